@@ -0,0 +1,184 @@
+"""SQL corpus of the FastOMOP benchmarks.
+
+Questions as a user would ask them and the SQL the SQL agent is expected to write for
+them against the synthetic fixture. Tables are not qualified, as in the queries of the
+agent, and are resolved by the server against the CDM and vocabulary schemas.
+"""
+
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True)
+class BenchmarkQuery:
+    """A question and the SQL answering it."""
+
+    name: str
+    question: str
+    sql: str
+
+
+T2DM_COHORT = """
+    select distinct co.person_id, min(co.condition_start_date) as index_date
+    from condition_occurrence co
+    join concept_ancestor ca on ca.descendant_concept_id = co.condition_concept_id
+    where ca.ancestor_concept_id = 201826
+    group by co.person_id
+"""
+
+CORPUS = [
+    BenchmarkQuery(
+        "person_count",
+        "How many patients are in the database?",
+        "select count(*) as persons from person",
+    ),
+    BenchmarkQuery(
+        "gender_breakdown",
+        "How many patients are there by gender?",
+        """
+        select c.concept_name as gender, count(*) as persons
+        from person p
+        join concept c on c.concept_id = p.gender_concept_id
+        group by c.concept_name
+        order by persons desc
+        """,
+    ),
+    BenchmarkQuery(
+        "t2dm_prevalence",
+        "What proportion of patients have type 2 diabetes?",
+        f"""
+        with t2dm as ({T2DM_COHORT})
+        select
+            count(*) as patients,
+            round(100.0 * count(*) / (select count(*) from person), 2) as percent
+        from t2dm
+        """,
+    ),
+    BenchmarkQuery(
+        "t2dm_age_at_diagnosis",
+        "What is the average age at diagnosis of type 2 diabetes by gender?",
+        f"""
+        with t2dm as ({T2DM_COHORT})
+        select
+            c.concept_name as gender,
+            round(avg(extract(year from t.index_date) - p.year_of_birth), 1) as mean_age
+        from t2dm t
+        join person p on p.person_id = t.person_id
+        join concept c on c.concept_id = p.gender_concept_id
+        group by c.concept_name
+        """,
+    ),
+    BenchmarkQuery(
+        "top_conditions",
+        "What are the ten most common conditions?",
+        """
+        select c.concept_name, count(distinct co.person_id) as patients
+        from condition_occurrence co
+        join concept_ancestor ca on ca.descendant_concept_id = co.condition_concept_id
+        join concept c on c.concept_id = ca.ancestor_concept_id
+        where ca.min_levels_of_separation = 1 and c.concept_id <> 441840
+        group by c.concept_name
+        order by patients desc
+        limit 10
+        """,
+    ),
+    BenchmarkQuery(
+        "t2dm_metformin",
+        "How many patients with type 2 diabetes were prescribed metformin?",
+        f"""
+        with t2dm as ({T2DM_COHORT})
+        select count(distinct de.person_id) as patients
+        from t2dm t
+        join drug_exposure de on de.person_id = t.person_id
+        join concept_ancestor ca on ca.descendant_concept_id = de.drug_concept_id
+        where ca.ancestor_concept_id = 1503297
+        """,
+    ),
+    BenchmarkQuery(
+        "t2dm_hba1c",
+        "What is the mean HbA1c of patients with type 2 diabetes by gender?",
+        f"""
+        with t2dm as ({T2DM_COHORT})
+        select
+            c.concept_name as gender,
+            round(avg(m.value_as_number), 2) as mean_hba1c,
+            count(*) as measurements
+        from t2dm t
+        join measurement m on m.person_id = t.person_id
+        join person p on p.person_id = t.person_id
+        join concept c on c.concept_id = p.gender_concept_id
+        where m.measurement_concept_id = 3004410
+        group by c.concept_name
+        """,
+    ),
+    BenchmarkQuery(
+        "visits_per_year",
+        "How many visits of each type were there per year?",
+        """
+        select
+            extract(year from v.visit_start_date) as year,
+            c.concept_name as visit_type,
+            count(*) as visits
+        from visit_occurrence v
+        join concept c on c.concept_id = v.visit_concept_id
+        group by 1, 2
+        order by 1, 2
+        """,
+    ),
+    BenchmarkQuery(
+        "mi_mortality",
+        "What proportion of patients with a myocardial infarction died?",
+        """
+        with mi as (
+            select distinct co.person_id
+            from condition_occurrence co
+            join concept_ancestor ca on ca.descendant_concept_id = co.condition_concept_id
+            where ca.ancestor_concept_id = 4329847
+        )
+        select
+            count(*) as patients,
+            count(d.person_id) as deaths,
+            round(100.0 * count(d.person_id) / count(*), 2) as percent
+        from mi
+        left join death d on d.person_id = mi.person_id
+        """,
+    ),
+    BenchmarkQuery(
+        "t2dm_hypertension",
+        "How many patients with type 2 diabetes also have hypertension?",
+        f"""
+        with t2dm as ({T2DM_COHORT}),
+        hypertension as (
+            select distinct co.person_id
+            from condition_occurrence co
+            join concept_ancestor ca on ca.descendant_concept_id = co.condition_concept_id
+            where ca.ancestor_concept_id = 320128
+        )
+        select count(*) as patients
+        from t2dm t
+        join hypertension h on h.person_id = t.person_id
+        """,
+    ),
+    BenchmarkQuery(
+        "recent_measurements",
+        "Show the most recent blood pressure measurements.",
+        """
+        select *
+        from measurement
+        where measurement_concept_id in (3004249, 3012888)
+        order by measurement_date desc, measurement_id
+        limit 20
+        """,
+    ),
+    BenchmarkQuery(
+        "concept_search",
+        "Which concepts match diabetes?",
+        """
+        select distinct c.concept_id, c.concept_name, c.vocabulary_id
+        from concept c
+        join concept_synonym cs on cs.concept_id = c.concept_id
+        where c.standard_concept = 'S' and lower(cs.concept_synonym_name) like '%diabetes%'
+        order by c.concept_id
+        limit 50
+        """,
+    ),
+]
@@ -0,0 +1,520 @@
+"""End-to-end benchmark for FastOMOP.
+
+Runs offline against a synthetic OMOP CDM (see `omop_fixture.py`) and replays the SQL
+corpus (see `corpus.py`) through each layer of the stack:
+    - validate: `SQLValidator.validate_sql` and `compile`, cold and with warm caches
+    - read_query: `OmopDatabase.read_query` with the result cache disabled, one query
+      at a time and from concurrent threads
+    - mcp: the `Select_Query` and `Select_Queries` tools of the OMOP MCP server,
+      started over stdio with the result cache disabled
+    - supervisor: `FastOmopSupervisor.process_query` with the agents' models replaced
+      by a deterministic stub, which answers every question with its corpus query.
+      The MCP server runs over streamable HTTP and the stub can simulate the latency
+      of a model.
+
+Every stage runs in a fresh interpreter, so that its peak RSS can be measured. The
+latency of each query is summarised by its median, p95, mean, min and max in seconds,
+and each stage reports its throughput in queries per second.
+
+Usage:
+    uv run python -m benchmarks.e2e [--persons 10000] [--runs 5] [--output e2e.json]
+
+The fixture is generated on first use and cached in `.cache/benchmarks`. Results are
+printed as JSON, messages of the application are printed to stderr.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import resource
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import typing as t
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.corpus import CORPUS, BenchmarkQuery
+from benchmarks.omop_fixture import DEFAULT_SCHEMA, ensure_fixture
+
+STAGES = ("validate", "read_query", "mcp", "supervisor")
+
+FIXTURE_DIR = os.path.join(".cache", "benchmarks")
+
+# Environment of the MCP server, measuring queries rather than cache hits
+SERVER_ENV = {
+    "CDM_SCHEMA": DEFAULT_SCHEMA,
+    "VOCAB_SCHEMA": DEFAULT_SCHEMA,
+    "RESULT_CACHE_MAX_ENTRIES": "0",
+    "DB_WARM_UP": "true",
+}
+
+
+def _summary(samples: t.List[float]) -> dict:
+    return {
+        "median": round(statistics.median(samples), 6),
+        "p95": round(
+            statistics.quantiles(samples, n=20, method="inclusive")[-1]
+            if len(samples) > 1
+            else samples[0],
+            6,
+        ),
+        "mean": round(statistics.mean(samples), 6),
+        "min": round(min(samples), 6),
+        "max": round(max(samples), 6),
+        "count": len(samples),
+    }
+
+
+def _throughput(count: int, seconds: float) -> float:
+    return round(count / seconds, 2) if seconds > 0 else 0.0
+
+
+def _peak_rss_mb(who: int) -> float:
+    """Peak resident set size of this process or its waited-for children in MB."""
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return round(resource.getrusage(who).ru_maxrss / scale, 1)
+
+
+def _timed(
+    queries: t.List[BenchmarkQuery],
+    run: t.Callable[[BenchmarkQuery], t.Any],
+    runs: int,
+    warmup: int,
+) -> dict:
+    """Run every query `warmup` times untimed and `runs` times timed."""
+    for _ in range(warmup):
+        for query in queries:
+            run(query)
+
+    samples: t.Dict[str, t.List[float]] = {query.name: [] for query in queries}
+    start = time.perf_counter()
+    for _ in range(runs):
+        for query in queries:
+            query_start = time.perf_counter()
+            run(query)
+            samples[query.name].append(time.perf_counter() - query_start)
+    elapsed = time.perf_counter() - start
+
+    return {
+        "latency_seconds": _summary([s for q in samples.values() for s in q]),
+        "throughput_qps": _throughput(runs * len(queries), elapsed),
+        "queries": {name: _summary(q) for name, q in samples.items()},
+    }
+
+
+async def _timed_async(
+    queries: t.List[BenchmarkQuery],
+    run: t.Callable[[BenchmarkQuery], t.Awaitable[t.Any]],
+    runs: int,
+    warmup: int,
+) -> dict:
+    """Like `_timed`, awaiting each query."""
+    for _ in range(warmup):
+        for query in queries:
+            await run(query)
+
+    samples: t.Dict[str, t.List[float]] = {query.name: [] for query in queries}
+    start = time.perf_counter()
+    for _ in range(runs):
+        for query in queries:
+            query_start = time.perf_counter()
+            await run(query)
+            samples[query.name].append(time.perf_counter() - query_start)
+    elapsed = time.perf_counter() - start
+
+    return {
+        "latency_seconds": _summary([s for q in samples.values() for s in q]),
+        "throughput_qps": _throughput(runs * len(queries), elapsed),
+        "queries": {name: _summary(q) for name, q in samples.items()},
+    }
+
+
+def _connection_string(path: str) -> str:
+    return f"duckdb://{os.path.abspath(path)}"
+
+
+def _database(path: str) -> t.Any:
+    from fastomop.mcp.sql.db import OmopDatabase
+
+    return OmopDatabase(
+        _connection_string(path),
+        cdm_schema=DEFAULT_SCHEMA,
+        vocab_schema=DEFAULT_SCHEMA,
+        cache_max_entries=0,
+        star_mode="expand",
+    )
+
+
+def stage_validate(path: str, args: argparse.Namespace) -> dict:
+    """Validate and compile the corpus, without and with the validator caches."""
+    from fastomop.mcp.sql.sql_validator import SQLValidator
+
+    db = _database(path)
+    schema, version = db._get_catalog_schema()
+
+    def validator(cache_size: int) -> SQLValidator:
+        return SQLValidator(
+            to_dialect=db.sql_validator.to_dialect,
+            table_schemas=db.sql_validator.table_schemas,
+            star_mode="expand",
+            cache_size=cache_size,
+        )
+
+    def run(validator: SQLValidator, query: BenchmarkQuery) -> None:
+        errors = validator.validate_sql(query.sql)
+        if errors:
+            raise ExceptionGroup(f"Query {query.name} is invalid", errors)
+        validator.compile(query.sql, schema=schema, schema_version=version)
+
+    cold = validator(0)
+    warm = validator(512)
+    return {
+        "cold": _timed(CORPUS, lambda q: run(cold, q), args.runs, args.warmup),
+        "warm": _timed(CORPUS, lambda q: run(warm, q), args.runs, max(args.warmup, 1)),
+    }
+
+
+def stage_read_query(path: str, args: argparse.Namespace) -> dict:
+    """Run the corpus through `OmopDatabase.read_query`, serially and concurrently."""
+    db = _database(path)
+    db.warm_up(full=True)
+    results = _timed(CORPUS, lambda q: db.read_query(q.sql), args.runs, args.warmup)
+
+    queries = [q for _ in range(args.runs) for q in CORPUS]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(lambda q: db.read_query(q.sql), queries))
+    results["concurrent"] = {
+        "threads": args.concurrency,
+        "throughput_qps": _throughput(len(queries), time.perf_counter() - start),
+    }
+    return results
+
+
+def _tool_text(result: t.Any) -> str:
+    text = "\n".join(getattr(part, "text", "") for part in result.content)
+    if result.isError:
+        raise RuntimeError(text)
+    return text
+
+
+async def _stage_mcp(path: str, args: argparse.Namespace) -> dict:
+    from mcp import ClientSession, StdioServerParameters
+    from mcp.client.stdio import stdio_client
+
+    server = StdioServerParameters(
+        command=sys.executable,
+        args=["-W", "ignore", "-m", "fastomop.mcp.sql.server"],
+        env={
+            **os.environ,
+            **SERVER_ENV,
+            "DB_CONNECTION_STRING": _connection_string(path),
+        },
+    )
+    async with stdio_client(server) as (read, write):
+        async with ClientSession(read, write) as session:
+            start = time.perf_counter()
+            await session.initialize()
+            await session.call_tool("Get_Information_Schema", {})
+            first_call = time.perf_counter() - start
+
+            async def select(query: BenchmarkQuery) -> None:
+                _tool_text(
+                    await session.call_tool("Select_Query", {"query": query.sql})
+                )
+
+            results = await _timed_async(CORPUS, select, args.runs, args.warmup)
+
+            batch = []
+            for _ in range(args.runs):
+                start = time.perf_counter()
+                _tool_text(
+                    await session.call_tool(
+                        "Select_Queries", {"queries": [q.sql for q in CORPUS]}
+                    )
+                )
+                batch.append(time.perf_counter() - start)
+
+    results["first_call_seconds"] = round(first_call, 6)
+    results["batch"] = {
+        "queries": len(CORPUS),
+        "latency_seconds": _summary(batch),
+        "throughput_qps": _throughput(len(CORPUS) * len(batch), sum(batch)),
+    }
+    return results
+
+
+def stage_mcp(path: str, args: argparse.Namespace) -> dict:
+    """Call the query tools of the MCP server over stdio."""
+    return asyncio.run(_stage_mcp(path, args))
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@contextlib.contextmanager
+def _http_server(path: str) -> t.Iterator[str]:
+    """Run the MCP server over streamable HTTP and yield its URL."""
+    port = _free_port()
+    process = subprocess.Popen(
+        [sys.executable, "-W", "ignore", "-m", "fastomop.mcp.sql.server"],
+        env={
+            **os.environ,
+            **SERVER_ENV,
+            "DB_CONNECTION_STRING": _connection_string(path),
+            "MCP_TRANSPORT": "streamable-http",
+            "MCP_HOST": "127.0.0.1",
+            "MCP_PORT": str(port),
+        },
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        deadline = time.monotonic() + 60
+        while True:
+            with contextlib.suppress(OSError):
+                socket.create_connection(("127.0.0.1", port), timeout=1).close()
+                break
+            if process.poll() is not None or time.monotonic() > deadline:
+                raise RuntimeError("The MCP server did not start")
+            time.sleep(0.1)
+        yield f"http://127.0.0.1:{port}/mcp"
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+
+class StubModel:
+    """
+    Deterministic stand-in for the models of the agents.
+
+    The SQL agent calls `Select_Query` with the corpus query of the question in its
+    prompt and then answers with the result. The other agents answer with a fixed
+    text. Every response waits `latency` seconds, as a model would.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+
+    @staticmethod
+    def _prompt(messages: t.List[t.Any]) -> str:
+        from pydantic_ai.messages import ModelRequest, UserPromptPart
+
+        return "\n".join(
+            part.content
+            for message in messages
+            if isinstance(message, ModelRequest)
+            for part in message.parts
+            if isinstance(part, UserPromptPart) and isinstance(part.content, str)
+        )
+
+    def sql_model(self) -> t.Any:
+        from pydantic_ai.messages import (
+            ModelRequest,
+            ModelResponse,
+            TextPart,
+            ToolCallPart,
+            ToolReturnPart,
+        )
+        from pydantic_ai.models.function import FunctionModel
+
+        async def respond(messages: t.List[t.Any], info: t.Any) -> ModelResponse:
+            await asyncio.sleep(self.latency)
+            returns = [
+                part
+                for message in messages
+                if isinstance(message, ModelRequest)
+                for part in message.parts
+                if isinstance(part, ToolReturnPart)
+            ]
+            if returns:
+                return ModelResponse(parts=[TextPart(str(returns[-1].content))])
+
+            prompt = self._prompt(messages)
+            query = next((q for q in CORPUS if q.question in prompt), None)
+            if query is None:
+                return ModelResponse(parts=[TextPart("No query matches the question.")])
+            return ModelResponse(
+                parts=[ToolCallPart("Select_Query", {"query": query.sql})]
+            )
+
+        return FunctionModel(respond)
+
+    def text_model(self, text: str) -> t.Any:
+        from pydantic_ai.messages import ModelResponse, TextPart
+        from pydantic_ai.models.function import FunctionModel
+
+        async def respond(messages: t.List[t.Any], info: t.Any) -> ModelResponse:
+            await asyncio.sleep(self.latency)
+            return ModelResponse(parts=[TextPart(text)])
+
+        async def stream(messages: t.List[t.Any], info: t.Any) -> t.AsyncIterator[str]:
+            await asyncio.sleep(self.latency)
+            for word in text.split(" "):
+                yield word + " "
+
+        return FunctionModel(respond, stream_function=stream)
+
+
+async def _stage_supervisor(url: str, args: argparse.Namespace) -> dict:
+    from fastomop.agents.mcp_sessions import get_mcp_session_manager
+    from fastomop.agents.supervisor import FastOmopSupervisor
+
+    manager = get_mcp_session_manager()
+    for name, settings in manager.settings.items():
+        manager.settings[name] = settings.model_copy(
+            update={"transport": "streamable-http", "url": url}
+        )
+
+    start = time.perf_counter()
+    supervisor = FastOmopSupervisor()
+    startup = time.perf_counter() - start
+
+    stub = StubModel(args.model_latency)
+    steps: t.Dict[str, t.List[float]] = {}
+
+    async def process(query: BenchmarkQuery) -> None:
+        result = await supervisor.process_query(query.question)
+        if not result.success:
+            raise RuntimeError(f"Query {query.name} failed: {result.final_answer}")
+        for step in result.steps:
+            if step.duration is not None:
+                steps.setdefault(step.agent_name, []).append(step.duration)
+
+    with (
+        supervisor.semantic_agent.override(
+            model=stub.text_model("The user asks about a cohort of patients.")
+        ),
+        supervisor.sql_agent.override(model=stub.sql_model()),
+        supervisor.supervisor_agent.override(
+            model=stub.text_model("The query answers the question.")
+        ),
+    ):
+        try:
+            results = await _timed_async(CORPUS, process, args.runs, args.warmup)
+        finally:
+            await supervisor.close()
+
+    # Only the timed runs, which follow the warm-up runs
+    timed = args.runs * len(CORPUS)
+    results["startup_seconds"] = round(startup, 6)
+    results["model_latency_seconds"] = args.model_latency
+    results["steps"] = {name: _summary(s[-timed:]) for name, s in steps.items()}
+    return results
+
+
+def stage_supervisor(path: str, args: argparse.Namespace) -> dict:
+    """Answer the corpus questions with the supervisor and stubbed models."""
+    # Nothing is sent to Langfuse, prompts are served from the configuration
+    os.environ["LANGFUSE_TRACING_ENABLED"] = "false"
+    with _http_server(path) as url:
+        return asyncio.run(_stage_supervisor(url, args))
+
+
+STAGE_FUNCTIONS: t.Dict[str, t.Callable[[str, argparse.Namespace], dict]] = {
+    "validate": stage_validate,
+    "read_query": stage_read_query,
+    "mcp": stage_mcp,
+    "supervisor": stage_supervisor,
+}
+
+
+def run_stage(stage: str, path: str, args: argparse.Namespace) -> dict:
+    """Run a stage in this process and add its peak memory use."""
+    # The application prints status messages, which must not mix with the results
+    with contextlib.redirect_stdout(sys.stderr):
+        results = STAGE_FUNCTIONS[stage](path, args)
+    results["peak_rss_mb"] = _peak_rss_mb(resource.RUSAGE_SELF)
+    if stage in ("mcp", "supervisor"):
+        results["server_peak_rss_mb"] = _peak_rss_mb(resource.RUSAGE_CHILDREN)
+    return results
+
+
+def _stage_in_subprocess(stage: str, path: str, argv: t.List[str]) -> dict:
+    output = subprocess.run(
+        [
+            sys.executable,
+            "-W",
+            "ignore",
+            "-m",
+            "benchmarks.e2e",
+            *argv,
+            "--run-stage",
+            stage,
+            "--fixture",
+            path,
+        ],
+        stdout=subprocess.PIPE,
+        text=True,
+        check=True,
+    ).stdout
+    return json.loads(output)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--persons", type=int, default=10_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument(
+        "--model-latency",
+        type=float,
+        default=0.0,
+        help="Seconds each stubbed model response takes",
+    )
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=list(STAGES))
+    parser.add_argument("--output", help="Also write the results to this JSON file")
+    parser.add_argument("--run-stage", choices=STAGES, help=argparse.SUPPRESS)
+    parser.add_argument("--fixture", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_stage:
+        print(json.dumps(run_stage(args.run_stage, args.fixture, args)))
+        return
+
+    path = os.path.join(FIXTURE_DIR, f"omop_{args.persons}_{args.seed}.duckdb")
+    with contextlib.redirect_stdout(sys.stderr):
+        fixture = ensure_fixture(path, args.persons, args.seed)
+
+    argv = [
+        f"--runs={args.runs}",
+        f"--warmup={args.warmup}",
+        f"--concurrency={args.concurrency}",
+        f"--model-latency={args.model_latency}",
+    ]
+    results = {
+        "python": sys.version.split()[0],
+        "runs": args.runs,
+        "warmup": args.warmup,
+        "fixture": {
+            "persons": fixture.persons,
+            "seed": fixture.seed,
+            "generated": fixture.generated,
+            "seconds": round(fixture.seconds, 2),
+            "rows": fixture.rows,
+        },
+        "corpus": [query.name for query in CORPUS],
+        "stages": {
+            stage: _stage_in_subprocess(stage, path, argv) for stage in args.stages
+        },
+    }
+
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,785 @@
+"""Synthetic OMOP CDM fixture for the FastOMOP benchmarks.
+
+Generates a DuckDB database with the OMOP CDM v5.4 clinical tables used by the agents
+and a small but realistic vocabulary: well-known standard concepts with their real
+concept ids (e.g. 201826 Type 2 diabetes mellitus, 1503297 metformin, 3004410
+hemoglobin A1c), synthetic descendants forming a hierarchy below them, non-standard
+ICD10CM source concepts mapped to the standard concepts, and the concept_ancestor,
+concept_relationship and concept_synonym tables.
+
+Clinical events are generated in DuckDB from deterministic hashes of the row numbers,
+so that a fixture of the same scale and seed is identical on every machine. Every
+event belongs to a visit, and condition prevalence is skewed towards the common
+conditions. Generating 1 million persons takes about half a minute and 250 MB.
+
+Usage:
+    uv run python -m benchmarks.omop_fixture --persons 10000 --path omop.duckdb
+"""
+
+import argparse
+import os
+import time
+import typing as t
+from dataclasses import dataclass
+
+import duckdb
+import pyarrow as pa
+
+# Bump when the generated data changes, so that cached fixtures are rebuilt
+FIXTURE_VERSION = 1
+
+DEFAULT_SCHEMA = "base"
+
+VISITS_PER_PERSON = 6
+CONDITIONS_PER_PERSON = 3
+DRUGS_PER_PERSON = 4
+MEASUREMENTS_PER_PERSON = 8
+# Percent of persons who died
+MORTALITY_PERCENT = 2
+
+EHR = 32817
+
+GENDERS = [(8507, "MALE"), (8532, "FEMALE")]
+RACES = [
+    (8527, "White"),
+    (8516, "Black or African American"),
+    (8515, "Asian"),
+    (0, "No matching concept"),
+]
+ETHNICITIES = [(38003563, "Hispanic or Latino"), (38003564, "Not Hispanic or Latino")]
+VISITS = [
+    (9202, "Outpatient Visit"),
+    (9201, "Inpatient Visit"),
+    (9203, "Emergency Room Visit"),
+]
+
+# Standard SNOMED conditions: concept id, name, ICD10CM code, relative prevalence
+CONDITIONS = [
+    (320128, "Essential hypertension", "I10", 12),
+    (201826, "Type 2 diabetes mellitus", "E11", 8),
+    (440383, "Depressive disorder", "F32", 6),
+    (317009, "Asthma", "J45", 5),
+    (313217, "Atrial fibrillation", "I48", 3),
+    (255573, "Chronic obstructive lung disease", "J44", 3),
+    (46271022, "Chronic kidney disease", "N18", 3),
+    (316139, "Heart failure", "I50", 2),
+    (4329847, "Myocardial infarction", "I21", 1),
+    (201254, "Type 1 diabetes mellitus", "E10", 1),
+]
+CONDITION_SYNONYMS = {
+    201826: ["T2DM", "Diabetes mellitus type 2", "Non-insulin dependent diabetes"],
+    201254: ["T1DM", "Diabetes mellitus type 1", "Insulin dependent diabetes"],
+    320128: ["Hypertension", "High blood pressure"],
+    4329847: ["Heart attack", "MI"],
+    255573: ["COPD"],
+    46271022: ["CKD"],
+}
+CONDITION_ROOT = (441840, "Clinical finding")
+
+# RxNorm ingredients: concept id, name, strengths in mg, relative use
+DRUGS = [
+    (1503297, "metformin", (500, 850, 1000), 8),
+    (1308216, "lisinopril", (5, 10, 20), 7),
+    (1545958, "atorvastatin", (10, 20, 40), 7),
+    (1112807, "aspirin", (81, 325), 6),
+    (1125315, "acetaminophen", (325, 500), 6),
+    (1307046, "metoprolol", (25, 50, 100), 4),
+    (974166, "hydrochlorothiazide", (12.5, 25), 4),
+    (1177480, "ibuprofen", (200, 400, 600), 3),
+    (1322184, "clopidogrel", (75,), 2),
+    (1596977, "insulin, regular, human", (100,), 1),
+]
+
+# LOINC measurements: concept id, name, unit concept id, mean, standard deviation
+MEASUREMENTS = [
+    (3004249, "Systolic blood pressure", 8876, 128.0, 18.0),
+    (3012888, "Diastolic blood pressure", 8876, 79.0, 11.0),
+    (3027018, "Heart rate", 8541, 74.0, 12.0),
+    (3038553, "Body mass index (BMI) [Ratio]", 9531, 28.0, 6.0),
+    (3004410, "Hemoglobin A1c/Hemoglobin.total in Blood", 8554, 6.1, 1.2),
+    (3027114, "Cholesterol [Mass/volume] in Serum or Plasma", 8840, 190.0, 38.0),
+    (3016723, "Creatinine [Mass/volume] in Serum or Plasma", 8840, 1.0, 0.3),
+    (3000963, "Hemoglobin [Mass/volume] in Blood", 8713, 13.8, 1.6),
+]
+UNITS = [
+    (8876, "millimeter mercury column", "mm[Hg]"),
+    (8541, "per minute", "/min"),
+    (9531, "kilogram per square meter", "kg/m2"),
+    (8554, "percent", "%"),
+    (8840, "milligram per deciliter", "mg/dL"),
+    (8713, "gram per deciliter", "g/dL"),
+]
+
+VOCABULARIES = [
+    ("SNOMED", "Systematic Nomenclature of Medicine - Clinical Terms"),
+    ("ICD10CM", "International Classification of Diseases, Tenth Revision, CM"),
+    ("RxNorm", "RxNorm"),
+    ("LOINC", "Logical Observation Identifiers Names and Codes"),
+    ("UCUM", "Unified Code for Units of Measure"),
+    ("Gender", "OMOP Gender"),
+    ("Race", "Race and Ethnicity Code Set"),
+    ("Ethnicity", "OMOP Ethnicity"),
+    ("Visit", "OMOP Visit"),
+    ("Type Concept", "OMOP Type Concept"),
+]
+DOMAINS = [
+    "Condition",
+    "Drug",
+    "Measurement",
+    "Unit",
+    "Gender",
+    "Race",
+    "Ethnicity",
+    "Visit",
+    "Type Concept",
+]
+RELATIONSHIPS = [
+    ("Maps to", "Mapped from"),
+    ("Mapped from", "Maps to"),
+    ("Is a", "Subsumes"),
+    ("Subsumes", "Is a"),
+]
+
+# Synthetic concepts get ids above the range of the OMOP vocabularies
+SYNTHETIC_CONCEPT_ID = 2_000_000_000
+
+
+@dataclass
+class FixtureInfo:
+    """A generated fixture and how long it took to build."""
+
+    path: str
+    persons: int
+    seed: int
+    schema: str
+    generated: bool
+    seconds: float
+    rows: t.Dict[str, int]
+
+
+class _Vocabulary:
+    """Rows of the vocabulary tables, built in memory."""
+
+    def __init__(self, children: int, grandchildren: int):
+        self.concepts: t.List[t.Dict[str, t.Any]] = []
+        self.ancestors: t.List[t.Tuple[int, int, int]] = []
+        self.relationships: t.List[t.Tuple[int, int, str]] = []
+        self.synonyms: t.List[t.Tuple[int, str]] = []
+        # Concept ids events are drawn from, repeated by their relative frequency
+        self.condition_pool: t.List[t.Tuple[int, int]] = []
+        self.drug_pool: t.List[t.Tuple[int, int]] = []
+        self._next_id = SYNTHETIC_CONCEPT_ID
+        self._build(children, grandchildren)
+
+    def _concept(
+        self,
+        concept_id: t.Optional[int],
+        name: str,
+        domain: str,
+        vocabulary: str,
+        concept_class: str,
+        code: str,
+        standard: t.Optional[str] = "S",
+    ) -> int:
+        if concept_id is None:
+            concept_id = self._next_id
+            self._next_id += 1
+        self.concepts.append(
+            {
+                "concept_id": concept_id,
+                "concept_name": name,
+                "domain_id": domain,
+                "vocabulary_id": vocabulary,
+                "concept_class_id": concept_class,
+                "standard_concept": standard,
+                "concept_code": code,
+            }
+        )
+        if standard == "S":
+            self.ancestors.append((concept_id, concept_id, 0))
+            self.synonyms.append((concept_id, name.lower()))
+        return concept_id
+
+    def _is_a(self, child: int, parents: t.List[int]) -> None:
+        """Add a child below a chain of parents, nearest parent first."""
+        self.relationships += [
+            (child, parents[0], "Is a"),
+            (parents[0], child, "Subsumes"),
+        ]
+        for level, parent in enumerate(parents, start=1):
+            self.ancestors.append((parent, child, level))
+
+    def _maps_to(self, source: int, standard: int) -> None:
+        self.relationships += [
+            (source, standard, "Maps to"),
+            (standard, source, "Mapped from"),
+        ]
+
+    def _build(self, children: int, grandchildren: int) -> None:
+        for concept_id, name in GENDERS:
+            self._concept(concept_id, name, "Gender", "Gender", "Gender", name[0])
+        for concept_id, name in RACES[:-1]:
+            self._concept(concept_id, name, "Race", "Race", "Race", str(concept_id))
+        for concept_id, name in ETHNICITIES:
+            self._concept(
+                concept_id, name, "Ethnicity", "Ethnicity", "Ethnicity", name[:3]
+            )
+        for concept_id, name in VISITS:
+            self._concept(concept_id, name, "Visit", "Visit", "Visit", name[:2].upper())
+        self._concept(EHR, "EHR", "Type Concept", "Type Concept", "Type Concept", "EHR")
+        for concept_id, name, code in UNITS:
+            self._concept(concept_id, name, "Unit", "UCUM", "Unit", code)
+
+        root_id, root_name = CONDITION_ROOT
+        self._concept(
+            root_id, root_name, "Condition", "SNOMED", "Clinical Finding", "404684003"
+        )
+        for concept_id, name, icd10, prevalence in CONDITIONS:
+            self._concept(
+                concept_id,
+                name,
+                "Condition",
+                "SNOMED",
+                "Clinical Finding",
+                str(concept_id),
+            )
+            self._is_a(concept_id, [root_id])
+            for synonym in CONDITION_SYNONYMS.get(concept_id, []):
+                self.synonyms.append((concept_id, synonym))
+            pool = [concept_id]
+            for i in range(children):
+                child = self._concept(
+                    None,
+                    f"{name}, subtype {i + 1}",
+                    "Condition",
+                    "SNOMED",
+                    "Clinical Finding",
+                    f"{concept_id}{i + 1:02d}",
+                )
+                self._is_a(child, [concept_id, root_id])
+                source = self._concept(
+                    None,
+                    f"{name}, subtype {i + 1}",
+                    "Condition",
+                    "ICD10CM",
+                    "ICD10 code",
+                    f"{icd10}.{i + 1}",
+                    standard=None,
+                )
+                self._maps_to(source, child)
+                pool.append(child)
+                for j in range(grandchildren):
+                    grandchild = self._concept(
+                        None,
+                        f"{name}, subtype {i + 1}, stage {j + 1}",
+                        "Condition",
+                        "SNOMED",
+                        "Clinical Finding",
+                        f"{concept_id}{i + 1:02d}{j + 1}",
+                    )
+                    self._is_a(grandchild, [child, concept_id, root_id])
+                    pool.append(grandchild)
+            self.condition_pool += [(concept, prevalence) for concept in pool]
+
+        for concept_id, name, strengths, use in DRUGS:
+            self._concept(
+                concept_id, name, "Drug", "RxNorm", "Ingredient", str(concept_id)
+            )
+            for strength in strengths:
+                for form in ("Oral Tablet", "Oral Capsule"):
+                    drug = self._concept(
+                        None,
+                        f"{name} {strength:g} MG {form}",
+                        "Drug",
+                        "RxNorm",
+                        "Clinical Drug",
+                        f"{concept_id}-{strength:g}-{form[5:8]}",
+                    )
+                    self._is_a(drug, [concept_id])
+                    self.drug_pool.append((drug, use))
+
+        for concept_id, name, _, _, _ in MEASUREMENTS:
+            self._concept(
+                concept_id, name, "Measurement", "LOINC", "Lab Test", str(concept_id)
+            )
+
+    def tables(self) -> t.Dict[str, pa.Table]:
+        """The vocabulary tables as Arrow tables."""
+        concepts = pa.Table.from_pylist(self.concepts)
+        n = len(self.concepts)
+        concepts = concepts.append_column(
+            "valid_start_date", pa.array([None] * n, pa.date32())
+        )
+        ancestors = list(zip(*self.ancestors))
+        relationships = list(zip(*self.relationships))
+        synonyms = list(zip(*self.synonyms))
+        return {
+            "_concept": concepts,
+            "_concept_ancestor": pa.table(
+                {
+                    "ancestor_concept_id": pa.array(ancestors[0], pa.int64()),
+                    "descendant_concept_id": pa.array(ancestors[1], pa.int64()),
+                    "levels": pa.array(ancestors[2], pa.int32()),
+                }
+            ),
+            "_concept_relationship": pa.table(
+                {
+                    "concept_id_1": pa.array(relationships[0], pa.int64()),
+                    "concept_id_2": pa.array(relationships[1], pa.int64()),
+                    "relationship_id": pa.array(relationships[2], pa.string()),
+                }
+            ),
+            "_concept_synonym": pa.table(
+                {
+                    "concept_id": pa.array(synonyms[0], pa.int64()),
+                    "concept_synonym_name": pa.array(synonyms[1], pa.string()),
+                }
+            ),
+            "_condition_pool": _pool_table(self.condition_pool),
+            "_drug_pool": _pool_table(self.drug_pool),
+            "_measurements": pa.Table.from_pylist(
+                [
+                    {
+                        "idx": i,
+                        "concept_id": c,
+                        "unit_concept_id": u,
+                        "mean": m,
+                        "sd": s,
+                    }
+                    for i, (c, _, u, m, s) in enumerate(MEASUREMENTS)
+                ]
+            ),
+        }
+
+
+def _pool_table(pool: t.List[t.Tuple[int, int]]) -> pa.Table:
+    """Repeat concept ids by their weight and number them for lookups by index."""
+    concept_ids = [concept_id for concept_id, weight in pool for _ in range(weight)]
+    return pa.table(
+        {
+            "idx": pa.array(range(len(concept_ids)), pa.int64()),
+            "concept_id": pa.array(concept_ids, pa.int64()),
+        }
+    )
+
+
+def _values(rows: t.List[t.Tuple[t.Any, ...]]) -> str:
+    """Render rows of ids as a SQL VALUES list indexed from zero."""
+    return ", ".join(f"({i}, {row[0]})" for i, row in enumerate(rows))
+
+
+def _clinical_sql(
+    schema: str, persons: int, seed: int, vocabulary: _Vocabulary
+) -> t.List[str]:
+    """SQL statements generating the clinical tables from the vocabulary tables."""
+    visits = persons * VISITS_PER_PERSON
+    # Inlined, since DuckDB cannot hash join on a condition with a subquery
+    conditions = sum(weight for _, weight in vocabulary.condition_pool)
+    drugs = sum(weight for _, weight in vocabulary.drug_pool)
+    return [
+        # rnd(i, k, m): deterministic pseudo-random integer in [0, m) for row i and stream k
+        f"create temp macro rnd(i, k, m) as cast(hash(i, k + {seed * 1000}) % m as bigint)",
+        "create temp macro unif(i, k) as "
+        "cast(hash(i, k + " + str(seed * 1000) + ") % 1000000 as double) / 1000000",
+        # Approximately normal, from the sum of three uniform variables
+        "create temp macro gauss(i, k) as "
+        "(unif(i, k) + unif(i, k + 1) + unif(i, k + 2) - 1.5) * 2",
+        f"create temp table _genders as select * from (values {_values(GENDERS)}) v(idx, concept_id)",
+        f"create temp table _races as select * from (values {_values(RACES)}) v(idx, concept_id)",
+        f"create temp table _ethnicities as select * from (values {_values(ETHNICITIES)}) v(idx, concept_id)",
+        f"""
+        create table {schema}.person as
+        select
+            i as person_id,
+            g.concept_id as gender_concept_id,
+            1930 + rnd(i, 2, 80) as year_of_birth,
+            1 + rnd(i, 3, 12) as month_of_birth,
+            1 + rnd(i, 4, 28) as day_of_birth,
+            null::timestamp as birth_datetime,
+            r.concept_id as race_concept_id,
+            e.concept_id as ethnicity_concept_id,
+            null::bigint as location_id,
+            null::bigint as provider_id,
+            null::bigint as care_site_id,
+            'P' || i as person_source_value,
+            case g.concept_id when 8507 then 'M' else 'F' end as gender_source_value,
+            0 as gender_source_concept_id,
+            null::varchar as race_source_value,
+            0 as race_source_concept_id,
+            null::varchar as ethnicity_source_value,
+            0 as ethnicity_source_concept_id
+        from range({persons}) p(i)
+        join _genders g on g.idx = rnd(i, 1, {len(GENDERS)})
+        join _races r on r.idx = case
+            when rnd(i, 5, 10) < 7 then 0 when rnd(i, 5, 10) < 9 then rnd(i, 5, 10) - 6
+            else 3 end
+        join _ethnicities e on e.idx = cast(rnd(i, 6, 10) > 1 as int)
+        """,
+        f"""
+        create table {schema}.observation_period as
+        select
+            i as observation_period_id,
+            i as person_id,
+            date '2010-01-01' + cast(rnd(i, 10, 1500) as int) as observation_period_start_date,
+            date '2024-12-31' - cast(rnd(i, 11, 700) as int) as observation_period_end_date,
+            {EHR} as period_type_concept_id
+        from range({persons}) p(i)
+        """,
+        f"create temp table _visit_types as select * from (values {_values(VISITS)}) v(idx, concept_id)",
+        f"""
+        create table {schema}.visit_occurrence as
+        select
+            v.i as visit_occurrence_id,
+            o.person_id,
+            t.concept_id as visit_concept_id,
+            o.observation_period_start_date + cast(
+                rnd(v.i, 21, greatest(
+                    o.observation_period_end_date - o.observation_period_start_date, 1
+                )) as int
+            ) as visit_start_date,
+            null::timestamp as visit_start_datetime,
+            visit_start_date + cast(
+                case t.concept_id when 9201 then 1 + rnd(v.i, 22, 10) else 0 end as int
+            ) as visit_end_date,
+            null::timestamp as visit_end_datetime,
+            {EHR} as visit_type_concept_id,
+            null::bigint as provider_id,
+            null::bigint as care_site_id,
+            null::varchar as visit_source_value,
+            0 as visit_source_concept_id,
+            0 as admitted_from_concept_id,
+            null::varchar as admitted_from_source_value,
+            0 as discharged_to_concept_id,
+            null::varchar as discharged_to_source_value,
+            null::bigint as preceding_visit_occurrence_id
+        from range({visits}) v(i)
+        join {schema}.observation_period o on o.person_id = rnd(v.i, 20, {persons})
+        join _visit_types t on t.idx = case
+            when rnd(v.i, 23, 20) < 16 then 0 when rnd(v.i, 23, 20) < 18 then 1 else 2 end
+        """,
+        f"""
+        create table {schema}.condition_occurrence as
+        select
+            c.i as condition_occurrence_id,
+            v.person_id,
+            p.concept_id as condition_concept_id,
+            v.visit_start_date as condition_start_date,
+            null::timestamp as condition_start_datetime,
+            null::date as condition_end_date,
+            null::timestamp as condition_end_datetime,
+            {EHR} as condition_type_concept_id,
+            0 as condition_status_concept_id,
+            null::varchar as stop_reason,
+            null::bigint as provider_id,
+            v.visit_occurrence_id,
+            null::bigint as visit_detail_id,
+            null::varchar as condition_source_value,
+            0 as condition_source_concept_id,
+            null::varchar as condition_status_source_value
+        from range({persons * CONDITIONS_PER_PERSON}) c(i)
+        join {schema}.visit_occurrence v on v.visit_occurrence_id = rnd(c.i, 30, {visits})
+        join _condition_pool p on p.idx = rnd(c.i, 31, {conditions})
+        """,
+        f"""
+        create table {schema}.drug_exposure as
+        select
+            d.i as drug_exposure_id,
+            v.person_id,
+            p.concept_id as drug_concept_id,
+            v.visit_start_date as drug_exposure_start_date,
+            null::timestamp as drug_exposure_start_datetime,
+            v.visit_start_date + cast(30 * (1 + 2 * (rnd(d.i, 41, 3) = 0)::int) as int)
+                as drug_exposure_end_date,
+            null::timestamp as drug_exposure_end_datetime,
+            null::date as verbatim_end_date,
+            {EHR} as drug_type_concept_id,
+            null::varchar as stop_reason,
+            rnd(d.i, 42, 4) as refills,
+            30.0 * (1 + rnd(d.i, 43, 3)) as quantity,
+            30 * (1 + 2 * (rnd(d.i, 41, 3) = 0)::int) as days_supply,
+            null::varchar as sig,
+            0 as route_concept_id,
+            null::varchar as lot_number,
+            null::bigint as provider_id,
+            v.visit_occurrence_id,
+            null::bigint as visit_detail_id,
+            null::varchar as drug_source_value,
+            0 as drug_source_concept_id,
+            null::varchar as route_source_value,
+            null::varchar as dose_unit_source_value
+        from range({persons * DRUGS_PER_PERSON}) d(i)
+        join {schema}.visit_occurrence v on v.visit_occurrence_id = rnd(d.i, 40, {visits})
+        join _drug_pool p on p.idx = rnd(d.i, 44, {drugs})
+        """,
+        f"""
+        create table {schema}.measurement as
+        select
+            m.i as measurement_id,
+            v.person_id,
+            k.concept_id as measurement_concept_id,
+            v.visit_start_date as measurement_date,
+            null::timestamp as measurement_datetime,
+            null::varchar as measurement_time,
+            {EHR} as measurement_type_concept_id,
+            0 as operator_concept_id,
+            round(greatest(k.mean + k.sd * gauss(m.i, 52), 0), 2) as value_as_number,
+            0 as value_as_concept_id,
+            k.unit_concept_id,
+            null::double as range_low,
+            null::double as range_high,
+            null::bigint as provider_id,
+            v.visit_occurrence_id,
+            null::bigint as visit_detail_id,
+            null::varchar as measurement_source_value,
+            0 as measurement_source_concept_id,
+            null::varchar as unit_source_value,
+            0 as unit_source_concept_id,
+            null::varchar as value_source_value,
+            null::bigint as measurement_event_id,
+            0 as meas_event_field_concept_id
+        from range({persons * MEASUREMENTS_PER_PERSON}) m(i)
+        join {schema}.visit_occurrence v on v.visit_occurrence_id = rnd(m.i, 50, {visits})
+        join _measurements k on k.idx = rnd(m.i, 51, {len(MEASUREMENTS)})
+        """,
+        f"""
+        create table {schema}.death as
+        select
+            o.person_id,
+            o.observation_period_end_date as death_date,
+            null::timestamp as death_datetime,
+            {EHR} as death_type_concept_id,
+            p.concept_id as cause_concept_id,
+            null::varchar as cause_source_value,
+            0 as cause_source_concept_id
+        from {schema}.observation_period o
+        join _condition_pool p on p.idx = rnd(o.person_id, 61, {conditions})
+        where rnd(o.person_id, 60, 100) < {MORTALITY_PERCENT}
+        """,
+    ]
+
+
+def _vocabulary_sql(schema: str) -> t.List[str]:
+    """SQL statements creating the vocabulary tables from the registered Arrow tables."""
+    vocabularies = ", ".join(f"('{v}', '{name}')" for v, name in VOCABULARIES)
+    domains = ", ".join(f"('{d}')" for d in DOMAINS)
+    relationships = ", ".join(f"('{r}', '{reverse}')" for r, reverse in RELATIONSHIPS)
+    return [
+        f"""
+        create table {schema}.concept as
+        select
+            concept_id,
+            concept_name,
+            domain_id,
+            vocabulary_id,
+            concept_class_id,
+            standard_concept,
+            concept_code,
+            date '1970-01-01' as valid_start_date,
+            date '2099-12-31' as valid_end_date,
+            null::varchar as invalid_reason
+        from _concept
+        """,
+        f"""
+        create table {schema}.concept_ancestor as
+        select
+            ancestor_concept_id,
+            descendant_concept_id,
+            min(levels) as min_levels_of_separation,
+            max(levels) as max_levels_of_separation
+        from _concept_ancestor
+        group by 1, 2
+        """,
+        f"""
+        create table {schema}.concept_relationship as
+        select
+            concept_id_1,
+            concept_id_2,
+            relationship_id,
+            date '1970-01-01' as valid_start_date,
+            date '2099-12-31' as valid_end_date,
+            null::varchar as invalid_reason
+        from _concept_relationship
+        """,
+        f"""
+        create table {schema}.concept_synonym as
+        select concept_id, concept_synonym_name, 4180186 as language_concept_id
+        from _concept_synonym
+        """,
+        f"""
+        create table {schema}.vocabulary as
+        select
+            vocabulary_id,
+            vocabulary_name,
+            null::varchar as vocabulary_reference,
+            'synthetic' as vocabulary_version,
+            0 as vocabulary_concept_id
+        from (values {vocabularies}) v(vocabulary_id, vocabulary_name)
+        """,
+        f"""
+        create table {schema}.domain as
+        select domain_id, domain_id as domain_name, 0 as domain_concept_id
+        from (values {domains}) v(domain_id)
+        """,
+        f"""
+        create table {schema}.concept_class as
+        select distinct
+            concept_class_id,
+            concept_class_id as concept_class_name,
+            0 as concept_class_concept_id
+        from _concept
+        """,
+        f"""
+        create table {schema}.relationship as
+        select
+            relationship_id,
+            relationship_id as relationship_name,
+            '0' as is_hierarchical,
+            '0' as defines_ancestry,
+            reverse_relationship_id,
+            0 as relationship_concept_id
+        from (values {relationships}) v(relationship_id, reverse_relationship_id)
+        """,
+    ]
+
+
+def fixture_name(persons: int, seed: int) -> str:
+    """Identifier of a fixture, stored in cdm_source to detect stale files."""
+    return f"synthetic-{persons}-{seed}-v{FIXTURE_VERSION}"
+
+
+def generate(
+    path: str,
+    persons: int = 10_000,
+    seed: int = 0,
+    schema: str = DEFAULT_SCHEMA,
+    children: int = 8,
+    grandchildren: int = 5,
+) -> t.Dict[str, int]:
+    """
+    Generate a synthetic OMOP CDM database, replacing the file atomically.
+
+    Args:
+        path: Path of the DuckDB database
+        persons: Number of persons
+        seed: Seed of the generated values
+        schema: Schema of the clinical and vocabulary tables
+        children: Number of synthetic child concepts of each standard condition
+        grandchildren: Number of synthetic child concepts of each child condition
+
+    Returns:
+        Number of rows of each table
+    """
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+
+    vocabulary = _Vocabulary(children, grandchildren)
+    con = duckdb.connect(tmp_path)
+    try:
+        con.execute(f"create schema if not exists {schema}")
+        for name, table in vocabulary.tables().items():
+            con.register(name, table)
+        for statement in _vocabulary_sql(schema) + _clinical_sql(
+            schema, persons, seed, vocabulary
+        ):
+            con.execute(statement)
+        con.execute(
+            f"""
+            create table {schema}.cdm_source as
+            select
+                'FastOMOP synthetic CDM' as cdm_source_name,
+                '{fixture_name(persons, seed)}' as cdm_source_abbreviation,
+                'FastOMOP benchmarks' as cdm_holder,
+                null::varchar as source_description,
+                null::varchar as source_documentation_reference,
+                null::varchar as cdm_etl_reference,
+                date '2024-12-31' as source_release_date,
+                date '2024-12-31' as cdm_release_date,
+                'v5.4' as cdm_version,
+                0 as cdm_version_concept_id,
+                'synthetic' as vocabulary_version
+            """
+        )
+        rows = {
+            table: con.execute(f"select count(*) from {schema}.{table}").fetchone()[0]  # type: ignore
+            for (table,) in con.execute(
+                "select table_name from information_schema.tables "
+                "where table_schema = ? order by 1",
+                [schema],
+            ).fetchall()
+        }
+    finally:
+        con.close()
+    os.replace(tmp_path, path)
+    return rows
+
+
+def ensure_fixture(
+    path: str, persons: int = 10_000, seed: int = 0, schema: str = DEFAULT_SCHEMA
+) -> FixtureInfo:
+    """
+    Reuse the fixture at the path if it has the scale and seed, otherwise generate it.
+
+    Args:
+        path: Path of the DuckDB database
+        persons: Number of persons
+        seed: Seed of the generated values
+        schema: Schema of the clinical and vocabulary tables
+
+    Returns:
+        The fixture
+    """
+    start = time.perf_counter()
+    if os.path.exists(path):
+        try:
+            con = duckdb.connect(path, read_only=True)
+            try:
+                name = con.execute(
+                    f"select cdm_source_abbreviation from {schema}.cdm_source"
+                ).fetchone()
+                rows = {
+                    table: con.execute(
+                        f"select count(*) from {schema}.{table}"
+                    ).fetchone()[0]  # type: ignore
+                    for table in ("person", "visit_occurrence", "condition_occurrence")
+                }
+            finally:
+                con.close()
+            if name and name[0] == fixture_name(persons, seed):
+                return FixtureInfo(
+                    path,
+                    persons,
+                    seed,
+                    schema,
+                    False,
+                    time.perf_counter() - start,
+                    rows,
+                )
+        except duckdb.Error:
+            pass
+
+    rows = generate(path, persons, seed, schema)
+    return FixtureInfo(
+        path, persons, seed, schema, True, time.perf_counter() - start, rows
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--path", default=".cache/benchmarks/omop.duckdb")
+    parser.add_argument("--persons", type=int, default=10_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--schema", default=DEFAULT_SCHEMA)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    rows = generate(args.path, args.persons, args.seed, args.schema)
+    print(f"Generated {args.path} in {time.perf_counter() - start:.1f}s")
+    for table, count in rows.items():
+        print(f"  {table}: {count:,}")
+
+
+if __name__ == "__main__":
+    main()
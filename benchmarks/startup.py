@@ -0,0 +1,151 @@
+"""Startup benchmark for FastOMOP.
+
+Measures in fresh interpreters:
+    - the import time of the CLI and of the OMOP MCP server
+    - the modules pulled in by the MCP server that belong to the agents or LLM SDKs
+    - the time from starting the CLI until it prompts for the first query
+    - the time from starting the MCP server until it lists its tools
+
+Usage:
+    uv run python benchmarks/startup.py [--runs 5] [--skip-mcp]
+
+The MCP server needs DB_CONNECTION_STRING to point to an OMOP database. Results are
+printed as JSON.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# Modules the MCP server should never import
+AGENT_MODULES = (
+    "fastomop.agents",
+    "fastomop.otel",
+    "langfuse",
+    "pydantic_ai",
+    "openai",
+    "anthropic",
+)
+
+IMPORT_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+prefixes = {prefixes!r}
+loaded = sorted(
+    {{name.split(".")[0] if not name.startswith("fastomop") else ".".join(name.split(".")[:2])
+      for name in sys.modules if name.startswith(prefixes)}}
+)
+print(json.dumps({{"seconds": elapsed, "agent_modules": loaded}}))
+"""
+
+
+def _summary(samples: list[float]) -> dict:
+    return {
+        "median": round(statistics.median(samples), 4),
+        "min": round(min(samples), 4),
+        "max": round(max(samples), 4),
+    }
+
+
+def measure_import(module: str, runs: int) -> dict:
+    """Import a module in fresh interpreters."""
+    samples = []
+    agent_modules: list[str] = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [
+                sys.executable,
+                "-W",
+                "ignore",
+                "-c",
+                IMPORT_SCRIPT.format(module=module, prefixes=AGENT_MODULES),
+            ],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        samples.append(result["seconds"])
+        agent_modules = result["agent_modules"]
+    return {"import_seconds": _summary(samples), "agent_modules": agent_modules}
+
+
+def measure_first_prompt(runs: int) -> dict:
+    """Start the CLI and wait until it asks for the first query."""
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        process = subprocess.Popen(
+            [sys.executable, "-W", "ignore", "-u", "-m", "fastomop.main"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+        assert process.stdout is not None and process.stdin is not None
+        output = b""
+        while b"User: " not in output:
+            chunk = process.stdout.read1(1024)  # type: ignore
+            if not chunk:
+                raise RuntimeError(f"The CLI exited before prompting: {output!r}")
+            output += chunk
+        samples.append(time.perf_counter() - start)
+        process.communicate(b"quit\n", timeout=120)
+    return {"first_prompt_seconds": _summary(samples)}
+
+
+async def _list_tools() -> int:
+    from mcp import ClientSession, StdioServerParameters
+    from mcp.client.stdio import stdio_client
+
+    server = StdioServerParameters(
+        command=sys.executable,
+        args=["-W", "ignore", "-m", "fastomop.mcp.sql.server"],
+        env={**os.environ, "DB_WARM_UP": "false"},
+    )
+    async with stdio_client(server) as (read, write):
+        async with ClientSession(read, write) as session:
+            await session.initialize()
+            return len((await session.list_tools()).tools)
+
+
+def measure_mcp_server(runs: int) -> dict:
+    """Start the MCP server over stdio and wait until it lists its tools."""
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        asyncio.run(_list_tools())
+        samples.append(time.perf_counter() - start)
+    return {"first_tool_list_seconds": _summary(samples)}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--skip-mcp", action="store_true")
+    args = parser.parse_args()
+
+    results = {
+        "python": sys.version.split()[0],
+        "runs": args.runs,
+        "cli": {
+            **measure_import("fastomop.main", args.runs),
+            **measure_first_prompt(args.runs),
+        },
+    }
+    if not args.skip_mcp:
+        results["mcp_server"] = {
+            **measure_import("fastomop.mcp.sql.server", args.runs),
+            **measure_mcp_server(args.runs),
+        }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
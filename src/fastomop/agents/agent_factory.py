@@ -3,18 +3,15 @@
 from typing import Any
 
 from pydantic_ai import Agent
-from pydantic_ai.mcp import MCPServerStdio
-from pydantic_ai.models.anthropic import AnthropicModel
-from pydantic_ai.models.openai import OpenAIModel
-from pydantic_ai.providers.anthropic import AnthropicProvider
-from pydantic_ai.providers.azure import AzureProvider
-from pydantic_ai.providers.openai import OpenAIProvider
 
-from fastomop.config import AgentSettings, ProviderConfig
-from fastomop.config import config as cfg
-from fastomop.otel import tracer
+from fastomop.agents.mcp_sessions import SharedMCPServer, get_mcp_session_manager
+from fastomop.agents.model_cache import CachingModel, ModelResponseStore
+from fastomop.config import AgentSettings, ProviderConfig, get_config
+from fastomop.otel import get_tracer
+from fastomop.prompts.registry import get_prompt_registry
 
-Agent.instrument_all()
+# MCP servers of the agents created by `create_agent`, by agent name
+_agent_mcp_servers: dict[str, list[SharedMCPServer]] = {}
 
 
 def _create_provider(provider_config: ProviderConfig) -> Any:
@@ -30,18 +27,25 @@ def _create_provider(provider_config: ProviderConfig) -> Any:
         ValueError: If provider type is not supported
     """
 
+    # Providers are imported when used, as their SDKs are slow to import
     match provider_config.provider_type:
         case "openai":
+            from pydantic_ai.providers.openai import OpenAIProvider
+
             return OpenAIProvider(
                 api_key=provider_config.api_key, base_url=provider_config.base_url
             )
         case "azure":
+            from pydantic_ai.providers.azure import AzureProvider
+
             return AzureProvider(
                 api_key=provider_config.api_key,
                 azure_endpoint=provider_config.azure_endpoint,
                 api_version=provider_config.api_version,
             )
         case "anthropic":
+            from pydantic_ai.providers.anthropic import AnthropicProvider
+
             return AnthropicProvider(api_key=provider_config.api_key)
         case _:
             raise ValueError(f"Unknown provider type: {provider_config.provider_type}")
@@ -66,18 +70,22 @@ def _create_model(
 
     match provider_config.provider_type:
         case "openai" | "azure":
+            from pydantic_ai.models.openai import OpenAIModel
+
             return OpenAIModel(
                 model_name=model_name,  # Azure OpenAI needs to be specified with deployment name
                 provider=provider,
             )
         case "anthropic":
+            from pydantic_ai.models.anthropic import AnthropicModel
+
             return AnthropicModel(model_name=model_name, provider=provider)
         case _:
             raise ValueError(f"Unknown provider type: {provider_config.provider_type}")
 
 
 def _create_pydantic_agent(
-    settings: AgentSettings, toolsets: list[MCPServerStdio]
+    settings: AgentSettings, toolsets: list[SharedMCPServer]
 ) -> Agent:
     """Create an appropriate agent based on Agent settings
 
@@ -94,20 +102,27 @@ def _create_pydantic_agent(
 
     provider = _create_provider(settings.provider)
     model = _create_model(settings.model_name, provider, settings.provider)
+    if settings.model_cache.mode != "off":
+        model = CachingModel(
+            model,
+            ModelResponseStore(settings.model_cache.path, settings.model_cache.ttl),
+            settings.model_cache.mode,
+        )
 
-    system_prompt_client = tracer.get_prompt(
-        name=settings.agent_name + "/system_prompt", label="latest"
-    )
+    cfg = get_config()
+    prompt_registry = get_prompt_registry()
+    system_prompt_name = settings.agent_name + "/system_prompt"
 
     if settings.needs_omop_schema:
-        system_prompt = system_prompt_client.compile(
+        system_prompt = prompt_registry.compile(
+            system_prompt_name,
             clinical_tables_schema=cfg.omop.clinical_tables_schema,
             vocabulary_tables_schema=cfg.omop.vocabulary_tables_schema,
             clinical_tables=cfg.omop.clinical_tables,
             vocabulary_tables=cfg.omop.vocabulary_tables,
         )
     else:
-        system_prompt = system_prompt_client.compile()
+        system_prompt = prompt_registry.compile(system_prompt_name)
 
     agent = Agent(
         name=settings.agent_name,
@@ -127,19 +142,33 @@ def create_agent(settings: AgentSettings) -> Agent:
         settings: Agent settings
         mcp_server: MCP server instance
     """
+    # Set up tracing before the first agent is created
+    get_tracer()
+    Agent.instrument_all()
+
     toolsets = []
     if settings.mcp_servers:
         for server_name in settings.mcp_servers:
-            server_config = next(
-                (s for s in cfg.mcp_servers if s.name == server_name), None
-            )
-            if server_config:
-                mcp_server = MCPServerStdio(
-                    command=server_config.command, args=server_config.args
-                )
+            # Agents share one session per server instead of starting their own
+            mcp_server = get_mcp_session_manager().toolset(server_name)
+            if mcp_server:
                 toolsets.append(mcp_server)
                 print(f"Added MCP server: {server_name}")
             else:
                 print(f"MCP server not found: {server_name}")
 
-    return _create_pydantic_agent(settings, toolsets)
+    agent = _create_pydantic_agent(settings, toolsets)
+    _agent_mcp_servers[settings.agent_name] = toolsets
+    return agent
+
+
+def get_mcp_servers(agent: Agent) -> list[SharedMCPServer]:
+    """Get the MCP servers of an agent created by `create_agent`.
+
+    Args:
+        agent: The agent
+
+    Returns:
+        The MCP servers of the agent, in the order of its settings
+    """
+    return _agent_mcp_servers.get(agent.name or "", [])
@@ -0,0 +1,277 @@
+"""Module for reusing the answers of similar questions in FastOMOP.
+
+Questions are normalised to their terms: lower case words without stop words, with
+plural endings removed and common synonyms mapped to one term, so that "How many women
+have diabetes?" and "Number of female patients with diabetes" share their terms. The
+similarity of two questions combines the overlap of their terms with the overlap of the
+character trigrams of the terms, which tolerates spelling variants. Questions that
+differ in a number, a negation or a comparison such as "over" and "under" are never
+similar.
+
+Every answer is tied to the version of the CDM it was computed from, and answers of
+other versions are dropped when the data changes.
+"""
+
+import re
+import threading
+import time
+from collections import Counter, OrderedDict
+from dataclasses import dataclass, field
+from math import sqrt
+from typing import Optional
+
+STOP_WORDS = frozenset(
+    """
+    a about all also am an and any are as at be been by can could did do does doing
+    for from get give had has have having he her how i in is it its me my of on or our
+    please show she so tell than that the their them there these they this those to
+    us was we were what when where which who whom why will with would you your
+    database data omop cdm patient people person subject individual
+    """.split()
+)
+
+# Words that reverse or bound the meaning of a question must match exactly
+NEGATIONS = frozenset({"no", "not", "never", "without", "except", "excluding", "non"})
+COMPARISONS = frozenset(
+    """
+    over under before after since until between min max most least more less first
+    last earliest latest highest lowest top bottom increase decrease
+    """.split()
+)
+
+SYNONYMS = {
+    "many": "count",
+    "number": "count",
+    "total": "count",
+    "women": "female",
+    "woman": "female",
+    "men": "male",
+    "man": "male",
+    "average": "mean",
+    "percentage": "proportion",
+    "percent": "proportion",
+    "fraction": "proportion",
+    "share": "proportion",
+    "rate": "proportion",
+    "prevalence": "proportion",
+    "diagnosed": "diagnosis",
+    "prescribed": "prescription",
+    "medication": "drug",
+    "medicine": "drug",
+    "older": "over",
+    "above": "over",
+    "greater": "over",
+    "exceeding": "over",
+    "younger": "under",
+    "below": "under",
+    "fewer": "under",
+    "prior": "before",
+    "following": "after",
+    "minimum": "min",
+    "maximum": "max",
+    "smallest": "min",
+    "largest": "max",
+    "higher": "more",
+    "lower": "less",
+}
+
+_WORD = re.compile(r"[a-z0-9]+(?:\.[0-9]+)?")
+
+
+def _stem(word: str) -> str:
+    """Remove the plural ending of a word."""
+    if word.endswith("ies") and len(word) > 4:
+        return word[:-3] + "y"
+    if word.endswith("s") and not word.endswith("ss") and len(word) > 3:
+        return word[:-1]
+    return word
+
+
+def question_terms(question: str) -> tuple[str, ...]:
+    """Get the normalised terms of a question.
+
+    Args:
+        question: The question
+
+    Returns:
+        The terms in the order of the question
+    """
+    terms = []
+    for word in _WORD.findall(question.lower()):
+        if word in STOP_WORDS:
+            continue
+        word = SYNONYMS.get(word, word)
+        word = SYNONYMS.get(_stem(word), _stem(word))
+        if word not in STOP_WORDS:
+            terms.append(word)
+    return tuple(terms)
+
+
+def _trigrams(terms: tuple[str, ...]) -> Counter:
+    text = f" {' '.join(terms)} "
+    return Counter(text[i : i + 3] for i in range(len(text) - 2))
+
+
+def _cosine(a: Counter, b: Counter) -> float:
+    dot = sum(count * b[gram] for gram, count in a.items())
+    norm = sqrt(sum(c * c for c in a.values())) * sqrt(sum(c * c for c in b.values()))
+    return dot / norm if norm else 0.0
+
+
+def _guard_terms(terms: tuple[str, ...]) -> frozenset[str]:
+    """Numbers, negations and comparisons, which similar questions must share."""
+    return frozenset(
+        t for t in terms if t in NEGATIONS or t in COMPARISONS or t[0].isdigit()
+    )
+
+
+@dataclass
+class CachedAnswer:
+    """The answer to a question and how it was computed."""
+
+    question: str
+    cdm_version: str
+    semantic_output: Optional[str]
+    sql_queries: list[str]
+    final_answer: str
+    terms: tuple[str, ...] = ()
+    trigrams: Counter = field(default_factory=Counter)
+    created_at: float = field(default_factory=time.monotonic)
+
+
+@dataclass
+class AnswerMatch:
+    """A cached answer similar to a question."""
+
+    answer: CachedAnswer
+    score: float
+
+
+class AnswerCache:
+    """Bounded index of answered questions, looked up by similarity."""
+
+    def __init__(self, max_entries: int = 1000, ttl: Optional[float] = None):
+        """Initialize the AnswerCache.
+
+        Args:
+            max_entries: Maximum number of answers, the least recently used are evicted
+            ttl: Seconds after which an answer is no longer served, None for never
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: OrderedDict[tuple[str, ...], CachedAnswer] = OrderedDict()
+        # Entries by term, to only score questions sharing a term
+        self._index: dict[str, set[tuple[str, ...]]] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def similarity(self, a: CachedAnswer, terms: tuple[str, ...]) -> float:
+        """Score the similarity of a cached question and question terms from 0 to 1.
+
+        Args:
+            a: The cached answer
+            terms: The terms of the question
+
+        Returns:
+            The similarity, 0 if the questions differ in a number, negation or
+            comparison
+        """
+        if a.terms == terms:
+            return 1.0
+        if _guard_terms(a.terms) != _guard_terms(terms):
+            return 0.0
+        shared, words = set(a.terms), set(terms)
+        dice = 2 * len(shared & words) / (len(shared) + len(words))
+        return 0.7 * dice + 0.3 * _cosine(a.trigrams, _trigrams(terms))
+
+    def lookup(self, question: str, cdm_version: str) -> Optional[AnswerMatch]:
+        """Find the most similar answered question of a CDM version.
+
+        Answers of other CDM versions are dropped.
+
+        Args:
+            question: The question
+            cdm_version: The current version of the CDM
+
+        Returns:
+            The most similar answer, or None if no question shares a term
+        """
+        terms = question_terms(question)
+        if not terms:
+            return None
+        with self._lock:
+            self._purge(cdm_version)
+            candidates = set().union(*(self._index.get(term, ()) for term in terms))
+            best = None
+            for key in candidates:
+                score = self.similarity(self._entries[key], terms)
+                if best is None or score > best.score:
+                    best = AnswerMatch(self._entries[key], score)
+            if best is not None:
+                self._entries.move_to_end(best.answer.terms)
+            return best
+
+    def add(
+        self,
+        question: str,
+        cdm_version: str,
+        final_answer: str,
+        semantic_output: Optional[str] = None,
+        sql_queries: Optional[list[str]] = None,
+    ) -> None:
+        """Add the answer to a question, replacing the answer to the same terms.
+
+        Args:
+            question: The question
+            cdm_version: The version of the CDM the answer was computed from
+            final_answer: The answer
+            semantic_output: The interpretation of the question by the semantic agent
+            sql_queries: The queries that computed the answer
+        """
+        terms = question_terms(question)
+        if not terms or self.max_entries <= 0:
+            return
+        entry = CachedAnswer(
+            question=question,
+            cdm_version=cdm_version,
+            semantic_output=semantic_output,
+            sql_queries=list(sql_queries or []),
+            final_answer=final_answer,
+            terms=terms,
+            trigrams=_trigrams(terms),
+        )
+        with self._lock:
+            self._remove(terms)
+            self._entries[terms] = entry
+            for term in set(terms):
+                self._index.setdefault(term, set()).add(terms)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def clear(self) -> None:
+        """Remove all answers."""
+        with self._lock:
+            self._entries.clear()
+            self._index.clear()
+
+    def _purge(self, cdm_version: str) -> None:
+        """Remove the answers of other CDM versions and expired answers."""
+        now = time.monotonic()
+        for key, entry in list(self._entries.items()):
+            if entry.cdm_version != cdm_version or (
+                self.ttl is not None and entry.created_at + self.ttl <= now
+            ):
+                self._remove(key)
+
+    def _remove(self, key: tuple[str, ...]) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for term in set(entry.terms):
+            keys = self._index.get(term)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._index[term]
@@ -0,0 +1,347 @@
+"""Module for storing the history of queries answered by the supervisor in FastOMOP.
+
+Each query is stored as a small record with the question, outcome and timing, and a
+compressed payload holding the full `QueryResult` with the prompts and outputs of the
+agents. Payloads are kept apart from the records and only decoded when a result is
+loaded, so listing the history stays cheap.
+
+Two stores are available: a ring buffer in memory keeping the latest queries within an
+entry and byte budget, and an append-only SQLite database which persists the history
+between runs and keeps the latest queries within an entry budget.
+"""
+
+import json
+import sqlite3
+import threading
+import time
+import zlib
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Optional
+
+from fastomop.config import HistorySettings
+
+if TYPE_CHECKING:
+    from fastomop.agents.supervisor import QueryResult
+
+# Characters of the answer kept in the record
+ANSWER_PREVIEW_LENGTH = 200
+
+_EXECUTION_FIELDS = ("semantic_execution", "sql_execution", "synthesis_execution")
+
+
+@dataclass(slots=True)
+class HistoryRecord:
+    """Summary of a query in the history, its full result is loaded separately."""
+
+    id: int
+    created_at: float
+    query: str
+    success: bool
+    workflow_pattern: str
+    total_duration_ms: Optional[float]
+    answer_preview: Optional[str]
+    payload_bytes: int
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Cannot serialise {type(value).__name__}")
+
+
+def encode_result(result: "QueryResult") -> bytes:
+    """Serialise a query result to compressed JSON."""
+    data = json.dumps(asdict(result), default=_json_default, separators=(",", ":"))
+    return zlib.compress(data.encode("utf-8"))
+
+
+def decode_result(payload: bytes) -> "QueryResult":
+    """Restore a query result serialised by `encode_result`."""
+    from fastomop.agents.supervisor import AgentExecution, QueryResult
+
+    def execution(data: Optional[dict]) -> Optional[AgentExecution]:
+        if data is None:
+            return None
+        for key in ("start_time", "end_time"):
+            if data.get(key):
+                data[key] = datetime.fromisoformat(data[key])
+        return AgentExecution(**data)
+
+    data = json.loads(zlib.decompress(payload))
+    for key in _EXECUTION_FIELDS:
+        data[key] = execution(data.get(key))
+    data["steps"] = [execution(step) for step in data.get("steps", [])]
+    return QueryResult(**data)
+
+
+def _record(record_id: int, result: "QueryResult", payload_bytes: int) -> HistoryRecord:
+    answer = result.final_answer
+    return HistoryRecord(
+        id=record_id,
+        created_at=time.time(),
+        query=result.query,
+        success=result.success,
+        workflow_pattern=result.workflow_pattern,
+        total_duration_ms=result.total_duration_ms,
+        answer_preview=answer[:ANSWER_PREVIEW_LENGTH] if answer else answer,
+        payload_bytes=payload_bytes,
+    )
+
+
+class HistoryStore(ABC):
+    """Store of the queries answered by the supervisor."""
+
+    @abstractmethod
+    def append(self, result: "QueryResult") -> HistoryRecord:
+        """
+        Add the result of a query.
+
+        Args:
+            result: The query result
+
+        Returns:
+            The record of the query
+        """
+
+    @abstractmethod
+    def records(
+        self, offset: int = 0, limit: Optional[int] = 50
+    ) -> list[HistoryRecord]:
+        """
+        Get a page of records, oldest first.
+
+        Args:
+            offset: Number of the newest records to skip
+            limit: Maximum number of records, None for all
+
+        Returns:
+            The records, e.g. the latest 50 records with the default arguments
+        """
+
+    @abstractmethod
+    def load(self, record_id: int) -> Optional["QueryResult"]:
+        """
+        Load the full result of a query.
+
+        Args:
+            record_id: The id of the record
+
+        Returns:
+            The query result, or None if it is no longer stored
+        """
+
+    @abstractmethod
+    def __len__(self) -> int: ...
+
+    def results(
+        self, offset: int = 0, limit: Optional[int] = 50
+    ) -> list["QueryResult"]:
+        """Get the full results of a page of records, see `records`."""
+        results = []
+        for record in self.records(offset, limit):
+            result = self.load(record.id)
+            if result is not None:
+                results.append(result)
+        return results
+
+    def close(self) -> None:
+        """Release the resources of the store."""
+
+
+class RingBufferHistory(HistoryStore):
+    """The latest queries in memory, within an entry and a payload byte budget."""
+
+    def __init__(self, max_entries: int = 1000, max_bytes: Optional[int] = None):
+        """
+        Initialize the RingBufferHistory.
+
+        Args:
+            max_entries: Maximum number of queries, the oldest are dropped
+            max_bytes: Maximum total size of the compressed payloads, None for
+                unbounded
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._records: OrderedDict[int, HistoryRecord] = OrderedDict()
+        self._payloads: dict[int, bytes] = {}
+        self._bytes = 0
+        self._next_id = 1
+        self._lock = threading.Lock()
+
+    def append(self, result: "QueryResult") -> HistoryRecord:
+        payload = encode_result(result)
+        with self._lock:
+            record = _record(self._next_id, result, len(payload))
+            self._next_id += 1
+            self._records[record.id] = record
+            self._payloads[record.id] = payload
+            self._bytes += len(payload)
+            while len(self._records) > max(self.max_entries, 1) or (
+                self.max_bytes is not None
+                and self._bytes > self.max_bytes
+                and len(self._records) > 1
+            ):
+                oldest, _ = self._records.popitem(last=False)
+                self._bytes -= len(self._payloads.pop(oldest))
+        return record
+
+    def records(
+        self, offset: int = 0, limit: Optional[int] = 50
+    ) -> list[HistoryRecord]:
+        with self._lock:
+            records = list(self._records.values())
+        end = len(records) - offset
+        start = 0 if limit is None else max(end - limit, 0)
+        return records[start:end] if end > 0 else []
+
+    def load(self, record_id: int) -> Optional["QueryResult"]:
+        with self._lock:
+            payload = self._payloads.get(record_id)
+        return decode_result(payload) if payload is not None else None
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+
+class SQLiteHistory(HistoryStore):
+    """Append-only history in a SQLite database, with payloads in their own table."""
+
+    def __init__(self, path: str | Path, max_entries: Optional[int] = None):
+        """
+        Initialize the SQLiteHistory.
+
+        Args:
+            path: Path of the SQLite database, created if missing
+            max_entries: Maximum number of queries kept, the oldest are deleted.
+                None keeps every query.
+        """
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            self.path, timeout=30, isolation_level=None, check_same_thread=False
+        )
+        self._conn.execute("pragma journal_mode=wal")
+        self._conn.execute("pragma synchronous=normal")
+        self._conn.execute(
+            """
+            create table if not exists queries (
+                id integer primary key autoincrement,
+                created_at real not null,
+                query text not null,
+                success integer not null,
+                workflow_pattern text not null,
+                total_duration_ms real,
+                answer_preview text,
+                payload_bytes integer not null
+            )
+            """
+        )
+        self._conn.execute(
+            """
+            create table if not exists payloads (
+                id integer primary key references queries (id) on delete cascade,
+                data blob not null
+            )
+            """
+        )
+
+    def append(self, result: "QueryResult") -> HistoryRecord:
+        payload = encode_result(result)
+        record = _record(0, result, len(payload))
+        with self._lock:
+            self._conn.execute("begin")
+            try:
+                cursor = self._conn.execute(
+                    "insert into queries (created_at, query, success, workflow_pattern,"
+                    " total_duration_ms, answer_preview, payload_bytes)"
+                    " values (?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        record.created_at,
+                        record.query,
+                        int(record.success),
+                        record.workflow_pattern,
+                        record.total_duration_ms,
+                        record.answer_preview,
+                        record.payload_bytes,
+                    ),
+                )
+                record.id = cursor.lastrowid  # type: ignore
+                self._conn.execute(
+                    "insert into payloads (id, data) values (?, ?)",
+                    (record.id, payload),
+                )
+                if self.max_entries is not None:
+                    cutoff = record.id - max(self.max_entries, 1)
+                    self._conn.execute("delete from payloads where id <= ?", (cutoff,))
+                    self._conn.execute("delete from queries where id <= ?", (cutoff,))
+                self._conn.execute("commit")
+            except BaseException:
+                self._conn.execute("rollback")
+                raise
+        return record
+
+    def records(
+        self, offset: int = 0, limit: Optional[int] = 50
+    ) -> list[HistoryRecord]:
+        with self._lock:
+            rows = self._conn.execute(
+                "select id, created_at, query, success, workflow_pattern,"
+                " total_duration_ms, answer_preview, payload_bytes"
+                " from queries order by id desc limit ? offset ?",
+                (-1 if limit is None else limit, offset),
+            ).fetchall()
+        return [
+            HistoryRecord(
+                id=row[0],
+                created_at=row[1],
+                query=row[2],
+                success=bool(row[3]),
+                workflow_pattern=row[4],
+                total_duration_ms=row[5],
+                answer_preview=row[6],
+                payload_bytes=row[7],
+            )
+            for row in reversed(rows)
+        ]
+
+    def load(self, record_id: int) -> Optional["QueryResult"]:
+        with self._lock:
+            row = self._conn.execute(
+                "select data from payloads where id = ?", (record_id,)
+            ).fetchone()
+        return decode_result(row[0]) if row is not None else None
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("select count(*) from queries").fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def create_history_store(settings: HistorySettings) -> HistoryStore:
+    """Create the history store of the configured backend.
+
+    Args:
+        settings: History settings
+
+    Returns:
+        The history store
+
+    Raises:
+        ValueError: If the backend is not supported
+    """
+    match settings.backend:
+        case "memory":
+            return RingBufferHistory(settings.max_entries, settings.max_bytes)
+        case "sqlite":
+            return SQLiteHistory(settings.path, settings.max_entries)
+        case _:
+            raise ValueError(f"Unknown history backend: {settings.backend}")
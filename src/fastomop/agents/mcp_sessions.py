@@ -0,0 +1,277 @@
+"""Module for sharing MCP server sessions between agents in FastOMOP."""
+
+import asyncio
+import functools
+from dataclasses import dataclass, field, replace
+from typing import Any, Optional
+
+import anyio
+from mcp.shared.exceptions import McpError
+from mcp.types import CONNECTION_CLOSED
+from pydantic_ai import ModelRetry, RunContext
+from pydantic_ai.mcp import MCPServer, MCPServerStdio, MCPServerStreamableHTTP
+from pydantic_ai.toolsets import AbstractToolset, ToolsetTool
+
+from fastomop.config import MCPServerSettings, get_config
+
+_CONNECTION_ERRORS = (
+    anyio.ClosedResourceError,
+    anyio.BrokenResourceError,
+    anyio.EndOfStream,
+    ConnectionError,
+)
+
+
+def _is_connection_error(error: BaseException) -> bool:
+    """Check whether an MCP call failed because the session is broken."""
+    if isinstance(error, _CONNECTION_ERRORS):
+        return True
+    if isinstance(error, McpError):
+        return error.error.code == CONNECTION_CLOSED
+    # pydantic-ai reports MCP errors, including closed connections, as retries
+    return isinstance(error, ModelRetry) and error.message == "Connection closed"
+
+
+def create_mcp_server(settings: MCPServerSettings) -> MCPServer:
+    """Create an MCP server client for the configured transport.
+
+    Args:
+        settings: MCP server settings
+
+    Returns:
+        The MCP server client
+
+    Raises:
+        ValueError: If the transport is not supported or the URL is missing
+    """
+    match settings.transport:
+        case "stdio":
+            return MCPServerStdio(command=settings.command, args=settings.args)
+        case "streamable-http":
+            if not settings.url:
+                raise ValueError(f"MCP server {settings.name} needs a url")
+            return MCPServerStreamableHTTP(url=settings.url)
+        case _:
+            raise ValueError(f"Unknown MCP transport: {settings.transport}")
+
+
+@dataclass
+class _Session:
+    """A running MCP server session, owned by a task of one event loop."""
+
+    loop: asyncio.AbstractEventLoop
+    server: MCPServer
+    ready: asyncio.Future
+    stopping: asyncio.Event = field(default_factory=asyncio.Event)
+    task: Optional[asyncio.Task] = None
+
+
+class MCPSessionManager:
+    """Process-wide manager starting each configured MCP server once.
+
+    Every server runs in a session owned by a background task, so the session stays
+    open between agent runs and is closed by the task that opened it. All agents using
+    a server share its session, which multiplexes their concurrent calls. A session
+    whose connection breaks is restarted and the failed call retried once.
+    """
+
+    def __init__(self, settings: list[MCPServerSettings]):
+        self.settings = {server.name: server for server in settings}
+        self._sessions: dict[str, _Session] = {}
+        self._locks: dict[tuple[str, int], asyncio.Lock] = {}
+        self._restarts: dict[str, int] = {}
+        self._toolsets: dict[str, "SharedMCPServer"] = {}
+
+    def toolset(self, name: str) -> Optional["SharedMCPServer"]:
+        """Get the toolset of a configured MCP server, shared by all agents.
+
+        Args:
+            name: Name of the MCP server in the configuration
+
+        Returns:
+            The toolset, or None if the server is not configured
+        """
+        if name not in self.settings:
+            return None
+        if name not in self._toolsets:
+            self._toolsets[name] = SharedMCPServer(manager=self, server_name=name)
+        return self._toolsets[name]
+
+    def _lock(self, name: str) -> asyncio.Lock:
+        key = (name, id(asyncio.get_running_loop()))
+        if key not in self._locks:
+            self._locks[key] = asyncio.Lock()
+        return self._locks[key]
+
+    async def _hold(self, session: _Session) -> None:
+        """Keep a session open until it is stopped."""
+        try:
+            async with session.server:
+                session.ready.set_result(session.server)
+                await session.stopping.wait()
+        except Exception as e:
+            if not session.ready.done():
+                session.ready.set_exception(e)
+
+    async def _start(self, name: str) -> _Session:
+        session = _Session(
+            loop=asyncio.get_running_loop(),
+            server=create_mcp_server(self.settings[name]),
+            ready=asyncio.get_running_loop().create_future(),
+        )
+        session.task = asyncio.create_task(self._hold(session), name=f"mcp-{name}")
+        self._sessions[name] = session
+        return session
+
+    async def _stop(self, session: _Session) -> None:
+        session.stopping.set()
+        if session.task is not None:
+            await asyncio.gather(session.task, return_exceptions=True)
+
+    async def get_server(self, name: str) -> MCPServer:
+        """Get the running server of a session, starting the session if needed.
+
+        Args:
+            name: Name of the MCP server in the configuration
+
+        Returns:
+            The connected MCP server
+        """
+        async with self._lock(name):
+            session = self._sessions.get(name)
+            if (
+                session is None
+                or session.loop is not asyncio.get_running_loop()
+                or (session.task is not None and session.task.done())
+            ):
+                # Sessions of another event loop cannot be used and are abandoned
+                session = await self._start(name)
+        try:
+            return await asyncio.shield(session.ready)
+        except Exception:
+            async with self._lock(name):
+                if self._sessions.get(name) is session:
+                    del self._sessions[name]
+            raise
+
+    async def restart(self, name: str, failed: MCPServer) -> MCPServer:
+        """Restart a session whose connection broke.
+
+        Args:
+            name: Name of the MCP server in the configuration
+            failed: The server whose call failed. If the session was already
+                restarted by another call, the new server is returned.
+
+        Returns:
+            The connected MCP server
+
+        Raises:
+            ConnectionError: If the server was restarted too often since the last
+                successful call. The broken session is closed all the same, so a
+                later call starts a new one
+        """
+        async with self._lock(name):
+            session = self._sessions.get(name)
+            if session is not None and session.server is failed:
+                del self._sessions[name]
+                await self._stop(session)
+                self._restarts[name] = self._restarts.get(name, 0) + 1
+                if self._restarts[name] > self.settings[name].max_restarts:
+                    raise ConnectionError(
+                        f"MCP server {name} failed after "
+                        f"{self.settings[name].max_restarts} restarts"
+                    )
+                print(f"Restarting MCP server: {name}")
+        return await self.get_server(name)
+
+    def reset_restarts(self, name: str) -> None:
+        """Reset the restart count of a server after a successful call."""
+        self._restarts.pop(name, None)
+
+    async def close(self) -> None:
+        """Stop all sessions of the running event loop."""
+        loop = asyncio.get_running_loop()
+        for name, session in list(self._sessions.items()):
+            if session.loop is loop:
+                del self._sessions[name]
+                await self._stop(session)
+
+
+@dataclass(eq=False)
+class SharedMCPServer(AbstractToolset[Any]):
+    """Toolset of an MCP server whose session is shared and kept warm by a manager.
+
+    Entering the toolset starts the session if needed, exiting it leaves the session
+    running for other agents and later runs.
+    """
+
+    manager: MCPSessionManager
+    server_name: str
+
+    @property
+    def name(self) -> str:
+        return f"MCP server {self.server_name}"
+
+    async def __aenter__(self) -> "SharedMCPServer":
+        await self.manager.get_server(self.server_name)
+        return self
+
+    async def __aexit__(self, *args: Any) -> Optional[bool]:
+        return None
+
+    async def get_tools(self, ctx: RunContext[Any]) -> dict[str, ToolsetTool[Any]]:
+        server = await self.manager.get_server(self.server_name)
+        try:
+            tools = await server.get_tools(ctx)
+        except Exception as e:
+            if not _is_connection_error(e):
+                raise
+            server = await self.manager.restart(self.server_name, server)
+            tools = await server.get_tools(ctx)
+        # Route the calls of the tools through this toolset
+        return {name: replace(tool, toolset=self) for name, tool in tools.items()}
+
+    async def call_tool(
+        self,
+        name: str,
+        tool_args: dict[str, Any],
+        ctx: RunContext[Any],
+        tool: ToolsetTool[Any],
+    ) -> Any:
+        server = await self.manager.get_server(self.server_name)
+        try:
+            result = await server.call_tool(name, tool_args, ctx, tool)
+        except Exception as e:
+            if not _is_connection_error(e):
+                raise
+            server = await self.manager.restart(self.server_name, server)
+            result = await server.call_tool(name, tool_args, ctx, tool)
+        self.manager.reset_restarts(self.server_name)
+        return result
+
+    async def direct_call_tool(self, name: str, args: dict[str, Any]) -> Any:
+        """Call a tool of the server outside of an agent run.
+
+        Args:
+            name: The name of the tool
+            args: The arguments of the tool
+
+        Returns:
+            The result of the tool call
+        """
+        server = await self.manager.get_server(self.server_name)
+        try:
+            result = await server.direct_call_tool(name, args)
+        except Exception as e:
+            if not _is_connection_error(e):
+                raise
+            server = await self.manager.restart(self.server_name, server)
+            result = await server.direct_call_tool(name, args)
+        self.manager.reset_restarts(self.server_name)
+        return result
+
+
+@functools.cache
+def get_mcp_session_manager() -> MCPSessionManager:
+    """Get the manager of the configured MCP servers, creating it on first use."""
+    return MCPSessionManager(get_config().mcp_servers)
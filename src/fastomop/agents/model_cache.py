@@ -0,0 +1,297 @@
+"""Module for caching, recording and replaying model responses in FastOMOP.
+
+A model call is identified by the model, its settings (e.g. the temperature), the tools
+and output the agent offers, and the message history including the results of earlier
+tool calls. Responses are saved as JSON files, so that repeated questions are answered
+from disk and recorded runs can be replayed offline. Tools are still called on replay,
+so a cached SQL agent runs its queries against the current database.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import time
+from collections.abc import AsyncIterator, Callable
+from contextlib import asynccontextmanager
+from dataclasses import asdict, dataclass, field, replace
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Literal, Optional
+
+from pydantic_ai.messages import (
+    ModelMessage,
+    ModelMessagesTypeAdapter,
+    ModelResponse,
+    ModelResponseStreamEvent,
+    TextPart,
+    ThinkingPart,
+    ToolCallPart,
+)
+from pydantic_ai.models import Model, ModelRequestParameters, StreamedResponse
+from pydantic_ai.models.wrapper import WrapperModel
+from pydantic_ai.settings import ModelSettings
+from pydantic_ai.usage import Usage
+
+ModelCacheMode = Literal["cache", "record", "replay"]
+
+# Fields of messages and their parts that differ between identical calls. Tool
+# arguments and returns are kept whole, even where they use the same names
+_VOLATILE_FIELDS = frozenset(
+    {"timestamp", "tool_call_id", "usage", "vendor_id", "vendor_details", "model_name"}
+)
+
+
+class ModelCacheMissError(Exception):
+    """A model call was not recorded and the cache is replaying."""
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _without_volatile_fields(value: dict[str, Any]) -> dict[str, Any]:
+    return {k: v for k, v in value.items() if k not in _VOLATILE_FIELDS}
+
+
+def _normalize(messages: list[dict[str, Any]]) -> list[dict[str, Any]]:
+    """Drop the volatile fields of the messages and of their parts."""
+    return [
+        {
+            **_without_volatile_fields(message),
+            "parts": [
+                _without_volatile_fields(part) for part in message.get("parts", [])
+            ],
+        }
+        for message in messages
+    ]
+
+
+def make_request_key(
+    model: Model,
+    messages: list[ModelMessage],
+    model_settings: Optional[ModelSettings],
+    model_request_parameters: ModelRequestParameters,
+) -> str:
+    """Get the key of a model call.
+
+    Args:
+        model: The model
+        messages: The message history sent to the model
+        model_settings: The settings of the call, e.g. the temperature
+        model_request_parameters: The tools and output offered to the model
+
+    Returns:
+        The SHA-256 of the canonical JSON of the call
+    """
+    payload = {
+        "system": model.system,
+        "model_name": model.model_name,
+        "settings": dict(model_settings or {}),
+        "parameters": asdict(model_request_parameters),
+        "messages": _normalize(
+            ModelMessagesTypeAdapter.dump_python(messages, mode="json")
+        ),
+    }
+    text = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+class ModelResponseStore:
+    """Model responses saved as one JSON file per call in a directory."""
+
+    def __init__(self, directory: str | Path, ttl: Optional[float] = None):
+        """Initialize the ModelResponseStore.
+
+        Args:
+            directory: Directory of the response files
+            ttl: Seconds after which a response is no longer served, None for never
+        """
+        self.directory = Path(directory)
+        self.ttl = ttl
+
+    def _path(self, key: str) -> Path:
+        return self.directory / key[:2] / f"{key}.json"
+
+    def get(self, key: str) -> Optional[ModelResponse]:
+        """Get a saved response.
+
+        Args:
+            key: The key of the call
+
+        Returns:
+            The response, or None if it is missing, expired or unreadable
+        """
+        path = self._path(key)
+        try:
+            with open(path) as f:
+                data = json.load(f)
+            if self.ttl is not None and data["created_at"] + self.ttl <= time.time():
+                return None
+            response = ModelMessagesTypeAdapter.validate_python(data["messages"])[0]
+        except (OSError, ValueError, KeyError, IndexError):
+            return None
+        return response if isinstance(response, ModelResponse) else None
+
+    def put(self, key: str, response: ModelResponse) -> None:
+        """Atomically save a response, replacing an earlier one.
+
+        Args:
+            key: The key of the call
+            response: The response of the model
+        """
+        path = self._path(key)
+        data = {
+            "created_at": time.time(),
+            "messages": ModelMessagesTypeAdapter.dump_python([response], mode="json"),
+        }
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=".response-")
+            with os.fdopen(fd, "w") as f:
+                json.dump(data, f, indent=2)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Failed to save model response to {path}: {e}")
+
+
+@dataclass
+class _CachedStreamedResponse(StreamedResponse):
+    """Stream of a saved response, one event per part."""
+
+    _response: ModelResponse
+    _timestamp: datetime = field(default_factory=_now)
+
+    async def _get_event_iterator(self) -> AsyncIterator[ModelResponseStreamEvent]:
+        for i, part in enumerate(self._response.parts):
+            if isinstance(part, TextPart):
+                yield self._parts_manager.handle_text_delta(
+                    vendor_part_id=i, content=part.content
+                )
+            elif isinstance(part, ThinkingPart):
+                yield self._parts_manager.handle_thinking_delta(
+                    vendor_part_id=i, content=part.content, signature=part.signature
+                )
+            elif isinstance(part, ToolCallPart):
+                yield self._parts_manager.handle_tool_call_part(
+                    vendor_part_id=i,
+                    tool_name=part.tool_name,
+                    args=part.args,
+                    tool_call_id=part.tool_call_id,
+                )
+
+    @property
+    def model_name(self) -> str:
+        return self._response.model_name or ""
+
+    @property
+    def timestamp(self) -> datetime:
+        return self._timestamp
+
+
+@dataclass
+class _RecordingStreamedResponse(StreamedResponse):
+    """Stream of the wrapped model, saving the response once it was fully streamed."""
+
+    _wrapped: StreamedResponse
+    _on_complete: Callable[[ModelResponse], None]
+
+    async def _get_event_iterator(self) -> AsyncIterator[ModelResponseStreamEvent]:
+        async for event in self._wrapped:
+            yield event
+        self._on_complete(self._wrapped.get())
+
+    def get(self) -> ModelResponse:
+        return self._wrapped.get()
+
+    def usage(self) -> Usage:
+        return self._wrapped.usage()
+
+    @property
+    def model_name(self) -> str:
+        return self._wrapped.model_name
+
+    @property
+    def timestamp(self) -> datetime:
+        return self._wrapped.timestamp
+
+
+@dataclass(init=False)
+class CachingModel(WrapperModel):
+    """Model serving repeated calls from a store of saved responses.
+
+    Modes:
+        cache: Serve saved responses and save the responses of new calls
+        record: Call the wrapped model and save every response
+        replay: Serve saved responses and raise `ModelCacheMissError` otherwise, so
+            that the wrapped model is never called
+
+    Served responses report no usage, as they cost no tokens.
+    """
+
+    store: ModelResponseStore
+    mode: ModelCacheMode
+
+    def __init__(
+        self, wrapped: Model, store: ModelResponseStore, mode: ModelCacheMode = "cache"
+    ):
+        super().__init__(wrapped)
+        self.store = store
+        self.mode = mode
+        self.hits = 0
+        self.misses = 0
+
+    def _lookup(
+        self,
+        messages: list[ModelMessage],
+        model_settings: Optional[ModelSettings],
+        model_request_parameters: ModelRequestParameters,
+    ) -> tuple[str, Optional[ModelResponse]]:
+        key = make_request_key(
+            self.wrapped, messages, model_settings, model_request_parameters
+        )
+        response = None if self.mode == "record" else self.store.get(key)
+        if response is not None:
+            self.hits += 1
+            return key, replace(response, usage=Usage(), timestamp=_now())
+
+        self.misses += 1
+        if self.mode == "replay":
+            raise ModelCacheMissError(
+                f"No recorded response of {self.model_name} for call {key[:16]} "
+                f"in {self.store.directory}"
+            )
+        return key, None
+
+    async def request(
+        self,
+        messages: list[ModelMessage],
+        model_settings: Optional[ModelSettings],
+        model_request_parameters: ModelRequestParameters,
+    ) -> ModelResponse:
+        key, response = self._lookup(messages, model_settings, model_request_parameters)
+        if response is not None:
+            return response
+        response = await self.wrapped.request(
+            messages, model_settings, model_request_parameters
+        )
+        self.store.put(key, response)
+        return response
+
+    @asynccontextmanager
+    async def request_stream(
+        self,
+        messages: list[ModelMessage],
+        model_settings: Optional[ModelSettings],
+        model_request_parameters: ModelRequestParameters,
+    ) -> AsyncIterator[StreamedResponse]:
+        key, response = self._lookup(messages, model_settings, model_request_parameters)
+        if response is not None:
+            yield _CachedStreamedResponse(response)
+            return
+        async with self.wrapped.request_stream(
+            messages, model_settings, model_request_parameters
+        ) as stream:
+            yield _RecordingStreamedResponse(
+                stream, lambda response: self.store.put(key, response)
+            )
@@ -1,16 +1,41 @@
-from fasta2a.schema import AgentProvider
+"""The semantic agent, created on first use."""
+
+import functools
+from typing import Any
+
+from pydantic_ai import Agent
 
 from fastomop.agents.agent_factory import create_agent
-from fastomop.config import config as cfg
-
-agent = create_agent(cfg.semantic_agent)
-
-# Not used at the moment, but can be used for A2A integration
-app = agent.to_a2a(
-    name=cfg.semantic_agent.agent_name,
-    description=cfg.semantic_agent.description,
-    provider=AgentProvider(
-        organization="FastOMOP Developers",
-        url="https://github.com/fastomop/fastomop",
-    ),
-)
+from fastomop.config import get_config
+
+
+@functools.cache
+def get_agent() -> Agent:
+    """Get the semantic agent, creating it on first use."""
+    return create_agent(get_config().semantic_agent)
+
+
+@functools.cache
+def get_app() -> Any:
+    """Get the A2A app of the semantic agent, creating it on first use."""
+    # Not used at the moment, but can be used for A2A integration
+    from fasta2a.schema import AgentProvider
+
+    cfg = get_config()
+    return get_agent().to_a2a(
+        name=cfg.semantic_agent.agent_name,
+        description=cfg.semantic_agent.description,
+        provider=AgentProvider(
+            organization="FastOMOP Developers",
+            url="https://github.com/fastomop/fastomop",
+        ),
+    )
+
+
+def __getattr__(name: str) -> Any:
+    # `agent` and `app` are created on first access
+    if name == "agent":
+        return get_agent()
+    if name == "app":
+        return get_app()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,12 +1,37 @@
+import asyncio
+import json
 from dataclasses import dataclass, field
 from datetime import datetime
-from typing import Any, Dict, List, Optional
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    List,
+    Literal,
+    Optional,
+    Tuple,
+)
 
-from fastomop.agents.agent_factory import create_agent
-from fastomop.agents.semantic_agent import agent as semantic_agent
-from fastomop.agents.sql_agent import agent as sql_agent
-from fastomop.config import config as cfg
-from fastomop.otel import tracer
+from pydantic_ai import Agent
+from pydantic_ai.agent import AgentRunResult
+from pydantic_ai.messages import (
+    FunctionToolCallEvent,
+    FunctionToolResultEvent,
+    ModelMessage,
+    ToolCallPart,
+    ToolReturnPart,
+)
+
+from fastomop.agents.agent_factory import create_agent, get_mcp_servers
+from fastomop.agents.answer_cache import AnswerCache, AnswerMatch
+from fastomop.agents.history import HistoryStore, create_history_store
+from fastomop.agents.mcp_sessions import get_mcp_session_manager
+from fastomop.agents.semantic_agent import get_agent as get_semantic_agent
+from fastomop.agents.sql_agent import get_agent as get_sql_agent
+from fastomop.config import get_config
+from fastomop.prompts.registry import get_prompt_registry
 
 
 @dataclass
@@ -19,6 +44,7 @@ class AgentExecution:
     end_time: Optional[datetime] = None
     duration: Optional[float] = None
     retry_count: int = 0
+    depends_on: List[str] = field(default_factory=list)
 
     def complete(self, output: Optional[str] = None, error: Optional[str] = None):
         """Mark execution as complete."""
@@ -38,6 +64,11 @@ class QueryResult:
     total_duration_ms: Optional[float] = None
     success: bool = False
     workflow_pattern: str = "semantic_sql_synthesis"
+    steps: List[AgentExecution] = field(default_factory=list)
+    # Queries of the SQL agent that ran without error
+    sql_queries: List[str] = field(default_factory=list)
+    # Similarity of the query to the cached question whose answer or SQL was reused
+    cache_score: Optional[float] = None
 
     def get_summary(self) -> Dict[str, Any]:
         """Get a summary of the query result."""
@@ -55,25 +86,153 @@ class QueryResult:
             "synthesis_duration_ms": self.synthesis_execution.duration
             if self.synthesis_execution
             else None,
+            "step_durations": {step.agent_name: step.duration for step in self.steps},
             "final_answer": self.final_answer,
         }
 
 
+@dataclass
+class WorkflowStep:
+    """A step of the query workflow and the steps whose outputs it takes as input."""
+
+    name: str
+    run: Callable[..., Awaitable[Any]]
+    depends_on: Tuple[str, ...] = ()
+
+
+EventKind = Literal[
+    "step_started", "semantic", "sql", "rows", "query_error", "token", "result"
+]
+
+# Tools of the SQL MCP server whose calls are reported as SQL and rows events
+QUERY_TOOLS = ("Select_Query", "Select_Queries")
+
+
+@dataclass
+class SupervisorEvent:
+    """
+    An intermediate result of a query, yielded by `process_query_stream`.
+
+    Events by kind:
+        step_started: A workflow step started, data is None
+        semantic: The semantic agent finished, data is its output
+        sql: The SQL agent runs a query, data is the SQL
+        rows: A query returned, data is the result text of the tool
+        query_error: A query failed, data is the error message
+        token: Text streamed by the synthesis agent, data is the new text
+        result: The query finished, data is the `QueryResult`
+    """
+
+    kind: EventKind
+    step: str
+    data: Any = None
+
+
+EventCallback = Callable[[SupervisorEvent], None]
+
+
+def _tool_output_text(output: Any) -> str:
+    """Get the text of an MCP tool output, unwrapping serialised tool results."""
+    if isinstance(output, list):
+        return "\n".join(_tool_output_text(part) for part in output)
+    if isinstance(output, dict) and "content" in output:
+        # pydantic-ai parses tool results that are valid JSON
+        data = output
+    elif not isinstance(output, str):
+        return json.dumps(output, default=str)
+    else:
+        try:
+            data = json.loads(output)
+        except ValueError:
+            return output
+        if not isinstance(data, dict) or "content" not in data:
+            return output
+    text = "\n".join(
+        part.get("text", "") for part in data["content"] if isinstance(part, dict)
+    )
+    if data.get("isError"):
+        raise Exception(text)
+    return text
+
+
+def _executed_queries(messages: List[ModelMessage]) -> List[str]:
+    """Get the queries of an agent run's query tool calls that did not fail."""
+    calls: Dict[str, ToolCallPart] = {}
+    queries: List[str] = []
+    for message in messages:
+        for part in message.parts:
+            if isinstance(part, ToolCallPart) and part.tool_name in QUERY_TOOLS:
+                calls[part.tool_call_id] = part
+            elif isinstance(part, ToolReturnPart) and part.tool_call_id in calls:
+                try:
+                    _tool_output_text(part.content)
+                except Exception:
+                    continue
+                args = calls[part.tool_call_id].args_as_dict()
+                if args.get("query"):
+                    queries.append(args["query"])
+                else:
+                    queries.extend(args.get("queries") or [])
+    return queries
+
+
 class FastOmopSupervisor:
     def __init__(self):
-        self.semantic_agent = semantic_agent
-        self.sql_agent = sql_agent
+        cfg = get_config()
+        self.semantic_agent = get_semantic_agent()
+        self.sql_agent = get_sql_agent()
         self.supervisor_agent = create_agent(cfg.supervisor_agent)
+        self.settings = cfg.supervisor
+        self.answer_cache_settings = cfg.answer_cache
 
-        self.history: List[QueryResult] = []
+        self.history: HistoryStore = create_history_store(cfg.history)
+        self.answer_cache: Optional[AnswerCache] = (
+            AnswerCache(cfg.answer_cache.max_entries, cfg.answer_cache.ttl)
+            if cfg.answer_cache.enabled
+            else None
+        )
+        self._schema: Optional[str] = None
 
-    def build_sql_prompt(self, user_query: str, semantic_output: str) -> str:
+    def build_semantic_prompt(
+        self, user_query: str, previous_meaning: Optional[str] = None
+    ) -> str:
+        """Build a prompt for the semantic agent."""
+        prompt = get_prompt_registry().compile(
+            "semantic_agent.user_prompt", user_query=user_query
+        )
+        if previous_meaning:
+            prompt += f"""
+        A similar but possibly different query was interpreted as below. Reuse what applies to this query, but interpret this query on its own:
+        {previous_meaning}
+        """
+        return prompt
+
+    def build_sql_prompt(
+        self,
+        user_query: str,
+        semantic_output: str,
+        schema: Optional[str] = None,
+        previous_sql: Optional[List[str]] = None,
+    ) -> str:
         """Build a prompt for the SQL agent."""
-        return f"""
+        prompt = f"""
         Given this user query: {user_query}
         and the semantic meaning of the query: {semantic_output}
         Please generate a SQL query to answer the user query and execute it against the OMOP database in the MCP server.
         """
+        if schema:
+            prompt += f"""
+        The tables of the database have already been retrieved from the MCP server:
+        {schema}
+        Get the columns of the tables the query needs with Get_Table_Schema, unless they are listed above.
+        """
+        if previous_sql:
+            queries = ";\n\n".join(previous_sql)
+            prompt += f"""
+        A similar but possibly different query was answered with the SQL below. Execute it again if it answers this query, otherwise adapt it:
+        {queries}
+        """
+        return prompt
 
     def build_synthesis_prompt(
         self, user_query: str, semantic_output: str, sql_output: str
@@ -93,42 +252,373 @@ class FastOmopSupervisor:
 
     async def process_query(self, user_query: str) -> QueryResult:
         """Process a query and return a QueryResult."""
+        if self.settings.orchestration == "dag":
+            return await self.process_query_dag(user_query)
+        return await self.process_query_sequential(user_query)
 
-        result = QueryResult(query=user_query)
+    async def warm_up_sql_agent(self) -> None:
+        """Start the MCP servers of the SQL agent, which stay running between runs."""
+        for server in get_mcp_servers(self.sql_agent):
+            await server.__aenter__()
+
+    async def fetch_schema(self) -> Optional[str]:
+        """Fetch the database schema from the SQL agent's MCP server, once."""
+        if self._schema is None and self.settings.schema_tool:
+            for server in get_mcp_servers(self.sql_agent):
+                output = await server.direct_call_tool(self.settings.schema_tool, {})
+                self._schema = _tool_output_text(output)
+                break
+        return self._schema
+
+    async def fetch_cdm_version(self) -> Optional[str]:
+        """Fetch the version of the CDM data from the SQL agent's MCP server."""
+        for server in get_mcp_servers(self.sql_agent):
+            output = await server.direct_call_tool(
+                self.answer_cache_settings.cdm_version_tool, {}
+            )
+            return _tool_output_text(output)
+        return None
+
+    async def close(self) -> None:
+        """Stop the MCP servers shared by the agents and close the history."""
+        await get_mcp_session_manager().close()
+        self.history.close()
+
+    async def _lookup_answer(
+        self, user_query: str
+    ) -> Tuple[Optional[str], Optional[AnswerMatch]]:
+        """
+        Find the cached answer to a similar query.
+
+        Returns:
+            The CDM version, None if the answer cache is disabled or the version is
+            unknown, and the most similar cached answer above the SQL threshold
+        """
+        if self.answer_cache is None:
+            return None, None
+        try:
+            cdm_version = await self.fetch_cdm_version()
+        except Exception:
+            # Cached answers may be stale when the CDM version is unknown
+            return None, None
+        if cdm_version is None:
+            return None, None
+        match = self.answer_cache.lookup(user_query, cdm_version)
+        if match is None or match.score < self.answer_cache_settings.sql_threshold:
+            return cdm_version, None
+        return cdm_version, match
+
+    def _is_answer_hit(self, match: Optional[AnswerMatch]) -> bool:
+        return (
+            match is not None
+            and match.score >= self.answer_cache_settings.answer_threshold
+        )
+
+    def _cached_result(
+        self,
+        user_query: str,
+        match: AnswerMatch,
+        start_time: datetime,
+        emit: Optional[EventCallback] = None,
+    ) -> QueryResult:
+        """Answer a query with the cached answer of a similar query."""
+        cached = match.answer
+        result = QueryResult(
+            query=user_query,
+            final_answer=cached.final_answer,
+            success=True,
+            workflow_pattern="answer_cache",
+            sql_queries=list(cached.sql_queries),
+            cache_score=match.score,
+        )
+        if emit:
+            if cached.semantic_output:
+                emit(SupervisorEvent("semantic", "semantic", cached.semantic_output))
+            emit(SupervisorEvent("token", "synthesis", cached.final_answer))
+        result.total_duration_ms = (datetime.now() - start_time).total_seconds() * 1000
+        self.history.append(result)
+        return result
+
+    def _remember_answer(self, result: QueryResult, cdm_version: Optional[str]) -> None:
+        """Add the answer of a successful query to the answer cache."""
+        if self.answer_cache is None or cdm_version is None:
+            return
+        if not result.success or not result.final_answer:
+            return
+        self.answer_cache.add(
+            result.query,
+            cdm_version,
+            result.final_answer,
+            semantic_output=result.semantic_execution.output
+            if result.semantic_execution
+            else None,
+            sql_queries=result.sql_queries,
+        )
+
+    async def _run_workflow(
+        self,
+        steps: List[WorkflowStep],
+        result: QueryResult,
+        emit: Optional[EventCallback] = None,
+    ) -> Dict[str, Any]:
+        """
+        Run workflow steps as soon as the steps they depend on have finished.
+
+        Each step runs as an asyncio task awaiting the tasks of its dependencies, so
+        independent steps run concurrently. The timing of every step is recorded in
+        `result.steps`. If a step fails, the remaining steps are cancelled and the
+        error is raised.
+
+        Args:
+            steps: The steps, listed after the steps they depend on
+            result: The query result recording the step timings
+            emit: Called with a step_started event when a step starts
+
+        Returns:
+            The output of each step by name
+        """
+        tasks: Dict[str, asyncio.Task] = {}
+
+        async def run_step(step: WorkflowStep) -> Any:
+            inputs = [await tasks[name] for name in step.depends_on]
+            execution = AgentExecution(
+                agent_name=step.name, input="", depends_on=list(step.depends_on)
+            )
+            result.steps.append(execution)
+            if emit:
+                emit(SupervisorEvent("step_started", step.name))
+            try:
+                output = await step.run(*inputs)
+            except BaseException as e:
+                execution.complete(error=str(e) or type(e).__name__)
+                raise
+            execution.complete(output=output if isinstance(output, str) else None)
+            return output
+
+        for step in steps:
+            tasks[step.name] = asyncio.ensure_future(run_step(step))
+        try:
+            await asyncio.gather(*tasks.values())
+        except BaseException:
+            for task in tasks.values():
+                task.cancel()
+            raise
+        return {name: task.result() for name, task in tasks.items()}
+
+    async def _run_sql_agent(
+        self, sql_prompt: str, emit: EventCallback
+    ) -> AgentRunResult[str]:
+        """Run the SQL agent, reporting the queries it runs and their results."""
+        async with self.sql_agent.iter(sql_prompt) as run:
+            async for node in run:
+                if not Agent.is_call_tools_node(node):
+                    continue
+                async with node.stream(run.ctx) as tool_events:
+                    async for event in tool_events:
+                        if (
+                            isinstance(event, FunctionToolCallEvent)
+                            and event.part.tool_name in QUERY_TOOLS
+                        ):
+                            args = event.part.args_as_dict()
+                            query = args.get("query") or ";\n\n".join(
+                                args.get("queries") or []
+                            )
+                            emit(SupervisorEvent("sql", "sql", query))
+                        elif (
+                            isinstance(event, FunctionToolResultEvent)
+                            and isinstance(event.result, ToolReturnPart)
+                            and event.result.tool_name in QUERY_TOOLS
+                        ):
+                            try:
+                                rows = _tool_output_text(event.result.content)
+                            except Exception as e:
+                                emit(SupervisorEvent("query_error", "sql", str(e)))
+                            else:
+                                emit(SupervisorEvent("rows", "sql", rows))
+        assert run.result is not None
+        return run.result
+
+    async def _run_synthesis_agent(
+        self, synthesis_prompt: str, emit: EventCallback
+    ) -> str:
+        """Run the synthesis agent, reporting the text as it streams from the model."""
+        async with self.supervisor_agent.run_stream(synthesis_prompt) as response:
+            async for text in response.stream_text(delta=True):
+                emit(SupervisorEvent("token", "synthesis", text))
+            return await response.get_output()
+
+    async def process_query_dag(
+        self, user_query: str, emit: Optional[EventCallback] = None
+    ) -> QueryResult:
+        """
+        Process a query, running independent steps concurrently.
+
+        Fetching the semantic prompt, starting the SQL agent's MCP server and
+        retrieving the schema run while the semantic agent works out the meaning of
+        the query. The SQL agent starts as soon as both the semantic output and the
+        schema are ready.
+
+        Args:
+            user_query: The user query
+            emit: Called with the intermediate results of the query. When given, the
+                SQL agent's queries are reported and the synthesis agent's answer is
+                streamed.
+        """
         start_time = datetime.now()
+        cdm_version, match = await self._lookup_answer(user_query)
+        if match is not None and self._is_answer_hit(match):
+            return self._cached_result(user_query, match, start_time, emit)
+
+        result = QueryResult(
+            query=user_query, workflow_pattern="semantic_sql_synthesis_dag"
+        )
+        if match is not None:
+            result.cache_score = match.score
+
+        async def fetch_prompt() -> str:
+            # Only blocks on the first use of the prompt
+            return await asyncio.to_thread(
+                self.build_semantic_prompt,
+                user_query,
+                match.answer.semantic_output if match else None,
+            )
+
+        async def warm_up() -> None:
+            try:
+                await self.warm_up_sql_agent()
+            except Exception:
+                # The SQL agent starts its MCP servers itself when it runs
+                pass
+
+        async def fetch_schema(_) -> Optional[str]:
+            try:
+                return await self.fetch_schema()
+            except Exception:
+                # The SQL agent can still retrieve the schema with its tools
+                return None
+
+        async def run_semantic(semantic_prompt: str) -> str:
+            result.semantic_execution = AgentExecution(
+                agent_name="semantic", input=semantic_prompt
+            )
+            semantic_output = (await self.semantic_agent.run(semantic_prompt)).output
+            result.semantic_execution.complete(output=semantic_output)
+            if not result.semantic_execution.output:
+                raise Exception("Semantic agent failed to produce output")
+            if emit:
+                emit(SupervisorEvent("semantic", "semantic", semantic_output))
+            return semantic_output
+
+        async def run_sql(semantic_output: str, schema: Optional[str]) -> str:
+            sql_prompt = self.build_sql_prompt(
+                user_query,
+                semantic_output,
+                schema,
+                previous_sql=match.answer.sql_queries if match else None,
+            )
+            result.sql_execution = AgentExecution(agent_name="sql", input=sql_prompt)
+            if emit:
+                sql_run = await self._run_sql_agent(sql_prompt, emit)
+            else:
+                sql_run = await self.sql_agent.run(sql_prompt)
+            result.sql_queries = _executed_queries(sql_run.all_messages())
+            result.sql_execution.complete(output=sql_run.output)
+            return sql_run.output
+
+        async def run_synthesis(semantic_output: str, sql_output: str) -> str:
+            synthesis_prompt = self.build_synthesis_prompt(
+                user_query, semantic_output, sql_output
+            )
+            result.synthesis_execution = AgentExecution(
+                agent_name="supervisor", input=synthesis_prompt
+            )
+            if emit:
+                final_output = await self._run_synthesis_agent(synthesis_prompt, emit)
+            else:
+                final_output = (
+                    await self.supervisor_agent.run(synthesis_prompt)
+                ).output
+            result.synthesis_execution.complete(output=final_output)
+            return final_output
+
+        steps = [
+            WorkflowStep("prompt", fetch_prompt),
+            WorkflowStep("mcp_warm_up", warm_up),
+            WorkflowStep("schema", fetch_schema, ("mcp_warm_up",)),
+            WorkflowStep("semantic", run_semantic, ("prompt",)),
+            WorkflowStep("sql", run_sql, ("semantic", "schema")),
+            WorkflowStep("synthesis", run_synthesis, ("semantic", "sql")),
+        ]
+
+        try:
+            outputs = await self._run_workflow(steps, result, emit)
+            result.final_answer = outputs["synthesis"]
+            result.success = True
+            self._remember_answer(result, cdm_version)
+
+        except Exception as e:
+            for execution in (
+                result.semantic_execution,
+                result.sql_execution,
+                result.synthesis_execution,
+            ):
+                if execution and not execution.output and not execution.end_time:
+                    execution.complete(error=str(e))
+
+            result.success = False
+            result.final_answer = f"Error processing query: {str(e)}"
+
+        result.total_duration_ms = (datetime.now() - start_time).total_seconds() * 1000
+        self.history.append(result)
+        return result
+
+    async def process_query_sequential(self, user_query: str) -> QueryResult:
+        """Process a query running the prompt fetch and each agent one after another."""
+
+        start_time = datetime.now()
+        cdm_version, match = await self._lookup_answer(user_query)
+        if match is not None and self._is_answer_hit(match):
+            return self._cached_result(user_query, match, start_time)
+
+        result = QueryResult(query=user_query)
+        if match is not None:
+            result.cache_score = match.score
 
         try:
             # Semantic Agent
-            # semantic_prompt = self.build_semantic_prompt(user_query)
-            semantic_prompt_client = tracer.get_prompt(
-                "semantic_agent.user_prompt", label="latest"
+            semantic_prompt = self.build_semantic_prompt(
+                user_query, match.answer.semantic_output if match else None
             )
-            semantic_prompt = semantic_prompt_client.compile(user_query=user_query)
 
             result.semantic_execution = AgentExecution(
                 agent_name="semantic",
                 input=semantic_prompt,
             )
 
-            semantic_output = await self.semantic_agent.run(semantic_prompt)
-            result.semantic_execution.complete(output=semantic_output.output)
+            semantic_output = (await self.semantic_agent.run(semantic_prompt)).output
+            result.semantic_execution.complete(output=semantic_output)
 
             if not result.semantic_execution.output:
                 raise Exception("Semantic agent failed to produce output")
 
             # SQL Agent
-            sql_prompt = self.build_sql_prompt(user_query, semantic_output.output)
+            sql_prompt = self.build_sql_prompt(
+                user_query,
+                semantic_output,
+                previous_sql=match.answer.sql_queries if match else None,
+            )
             result.sql_execution = AgentExecution(
                 agent_name="sql",
                 input=sql_prompt,
             )
 
             sql_output = await self.sql_agent.run(sql_prompt)
+            result.sql_queries = _executed_queries(sql_output.all_messages())
             result.sql_execution.complete(output=sql_output.output)
 
             # Synthesis Agent
             synthesis_prompt = self.build_synthesis_prompt(
-                user_query, semantic_output.output, sql_output.output
+                user_query, semantic_output, sql_output.output
             )
 
             result.synthesis_execution = AgentExecution(
@@ -141,6 +631,7 @@ class FastOmopSupervisor:
 
             result.final_answer = final_output.output
             result.success = True
+            self._remember_answer(result, cdm_version)
 
         except Exception as e:
             if result.semantic_execution and not result.semantic_execution.output:
@@ -162,6 +653,50 @@ class FastOmopSupervisor:
             self.history.append(result)
             return result
 
-    def get_history(self) -> List[QueryResult]:
-        """Get the history of queries."""
-        return self.history
+    async def process_query_stream(
+        self, user_query: str
+    ) -> AsyncIterator[SupervisorEvent]:
+        """
+        Process a query, yielding its intermediate results as they become available.
+
+        The query runs as with `process_query_dag`. The last event is a result event
+        holding the `QueryResult`.
+
+        Args:
+            user_query: The user query
+
+        Yields:
+            The events of the query, see `SupervisorEvent`
+        """
+        events: asyncio.Queue[Optional[SupervisorEvent]] = asyncio.Queue()
+
+        async def run() -> QueryResult:
+            try:
+                return await self.process_query_dag(user_query, emit=events.put_nowait)
+            finally:
+                events.put_nowait(None)
+
+        task = asyncio.ensure_future(run())
+        try:
+            while (event := await events.get()) is not None:
+                yield event
+            yield SupervisorEvent("result", "result", await task)
+        finally:
+            if not task.done():
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+
+    def get_history(
+        self, offset: int = 0, limit: Optional[int] = 50
+    ) -> List[QueryResult]:
+        """
+        Get a page of the history of queries, oldest first.
+
+        Args:
+            offset: Number of the latest queries to skip
+            limit: Maximum number of queries, None for all stored queries
+
+        Returns:
+            The query results, the latest 50 with the default arguments
+        """
+        return self.history.results(offset, limit)
@@ -0,0 +1,214 @@
+"""Fair scheduling of the queries of many tenants on one event loop.
+
+At most `max_concurrency` queries run at a time and at most `tenant_concurrency` of
+them belong to the same tenant. Further queries wait in per-tenant queues which are
+served round-robin, so that a tenant sending many queries does not delay the queries
+of the others. Queries are rejected when the queues are full, so that clients back off
+instead of piling up behind slow queries.
+"""
+
+import asyncio
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Dict, Optional
+
+
+class ServerBusyError(Exception):
+    """A query was rejected because the queues are full or it waited too long."""
+
+
+class ServerShuttingDownError(Exception):
+    """A query was rejected because the server is shutting down."""
+
+
+@dataclass
+class _Tenant:
+    running: int = 0
+    waiters: deque[asyncio.Future] = field(default_factory=deque)
+
+
+class QueryScheduler:
+    """Per-tenant concurrency limits and a fair queue of the queries waiting to run."""
+
+    def __init__(
+        self,
+        max_concurrency: int = 16,
+        tenant_concurrency: int = 4,
+        max_queue: int = 64,
+        tenant_queue: int = 16,
+        queue_timeout: Optional[float] = None,
+    ):
+        """
+        Initialize the QueryScheduler.
+
+        Args:
+            max_concurrency: Number of queries running at a time
+            tenant_concurrency: Number of queries of one tenant running at a time
+            max_queue: Number of queries waiting to run
+            tenant_queue: Number of queries of one tenant waiting to run
+            queue_timeout: Seconds a query waits to run before it is rejected, None
+                for no limit
+        """
+        self.max_concurrency = max(max_concurrency, 1)
+        self.tenant_concurrency = max(tenant_concurrency, 1)
+        self.max_queue = max_queue
+        self.tenant_queue = tenant_queue
+        self.queue_timeout = queue_timeout
+        # Tenants with running or waiting queries, the next one to serve first
+        self._tenants: OrderedDict[str, _Tenant] = OrderedDict()
+        self._running = 0
+        self._queued = 0
+        self._closed = False
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    @property
+    def running(self) -> int:
+        """Number of running queries."""
+        return self._running
+
+    @property
+    def queued(self) -> int:
+        """Number of queries waiting to run."""
+        return self._queued
+
+    @property
+    def closed(self) -> bool:
+        """Whether new queries are rejected."""
+        return self._closed
+
+    def stats(self) -> Dict[str, object]:
+        """Get the running and waiting queries, overall and by tenant."""
+        return {
+            "running": self._running,
+            "queued": self._queued,
+            "closed": self._closed,
+            "tenants": {
+                name: {"running": t.running, "queued": len(t.waiters)}
+                for name, t in self._tenants.items()
+            },
+        }
+
+    def check(self, tenant: str) -> None:
+        """
+        Check that a query of a tenant would be admitted.
+
+        Args:
+            tenant: The tenant sending the query
+
+        Raises:
+            ServerBusyError: If the queues are full
+            ServerShuttingDownError: If the scheduler is closed
+        """
+        if self._closed:
+            raise ServerShuttingDownError("The server is shutting down.")
+        state = self._tenants.get(tenant)
+        running = state.running if state else 0
+        waiting = len(state.waiters) if state else 0
+        if (
+            self._running < self.max_concurrency
+            and running < self.tenant_concurrency
+            and not waiting
+        ):
+            # The query runs at once
+            return
+        if self._queued >= self.max_queue or waiting >= self.tenant_queue:
+            raise ServerBusyError(
+                f"The server is busy with {self._running} running and {self._queued} "
+                "waiting queries. Try again later."
+            )
+
+    @asynccontextmanager
+    async def slot(self, tenant: str) -> AsyncIterator[None]:
+        """
+        Wait for the turn of a query of a tenant and hold its slot while it runs.
+
+        Args:
+            tenant: The tenant sending the query
+
+        Raises:
+            ServerBusyError: If the queues are full or the query waited longer than
+                the queue timeout
+            ServerShuttingDownError: If the scheduler is closed
+        """
+        self.check(tenant)
+        state = self._tenants.get(tenant)
+        if state is None:
+            state = self._tenants[tenant] = _Tenant()
+        waiter = asyncio.get_running_loop().create_future()
+        state.waiters.append(waiter)
+        self._queued += 1
+        self._idle.clear()
+        self._dispatch()
+        try:
+            async with asyncio.timeout(self.queue_timeout):
+                await waiter
+        except BaseException as e:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was granted as the wait was interrupted
+                self._release(tenant)
+            else:
+                state.waiters.remove(waiter)
+                self._queued -= 1
+                self._forget(tenant)
+            if isinstance(e, TimeoutError):
+                raise ServerBusyError(
+                    f"The query waited {self.queue_timeout}s to run. Try again later."
+                ) from e
+            raise
+
+        try:
+            yield
+        finally:
+            self._release(tenant)
+
+    def close(self) -> None:
+        """Reject new queries, the running and waiting queries are still served."""
+        self._closed = True
+
+    async def drain(self, timeout: Optional[float] = None) -> bool:
+        """
+        Wait for the running and waiting queries to finish.
+
+        Args:
+            timeout: Seconds to wait, None for no limit
+
+        Returns:
+            Whether all queries finished in time
+        """
+        try:
+            async with asyncio.timeout(timeout):
+                await self._idle.wait()
+        except TimeoutError:
+            return False
+        return True
+
+    def _dispatch(self) -> None:
+        """Start waiting queries while slots are free, one tenant after the other."""
+        while self._running < self.max_concurrency:
+            for name, state in self._tenants.items():
+                if state.waiters and state.running < self.tenant_concurrency:
+                    break
+            else:
+                return
+            waiter = state.waiters.popleft()
+            self._queued -= 1
+            self._running += 1
+            state.running += 1
+            # The tenant is served again after the others
+            self._tenants.move_to_end(name)
+            waiter.set_result(None)
+
+    def _release(self, tenant: str) -> None:
+        self._running -= 1
+        self._tenants[tenant].running -= 1
+        self._forget(tenant)
+        self._dispatch()
+
+    def _forget(self, tenant: str) -> None:
+        state = self._tenants[tenant]
+        if not state.running and not state.waiters:
+            del self._tenants[tenant]
+        if not self._running and not self._queued:
+            self._idle.set()
@@ -0,0 +1,337 @@
+"""Serve the FastOMOP supervisor over HTTP and A2A.
+
+Many queries run concurrently on one event loop, sharing the agents and the MCP server
+of one supervisor. Queries are admitted by a `QueryScheduler`, which limits the queries
+running per tenant, serves the tenants fairly and rejects queries with 429 when its
+queues are full. On shutdown new queries are rejected with 503 while the admitted ones
+finish.
+
+The tenant of an HTTP query is its client address. Behind a proxy, `tenant_header`
+names a header the proxy sets from the authenticated user, replacing any value sent by
+the client, since a client choosing its own tenant escapes the per-tenant limits. A2A
+clients are not authenticated, so their tasks share one tenant.
+
+Endpoints:
+    POST /query: Answer {"query": ..., "stream": false}. With "stream": true, the
+        events of the query are sent as server-sent events, see `SupervisorEvent`.
+    GET /health: The running and waiting queries, overall and by tenant
+    /a2a/: The supervisor as an A2A agent, its card at /a2a/.well-known/agent.json
+"""
+
+import asyncio
+import json
+import uuid
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, AsyncIterator, Dict, List, Optional
+
+from fasta2a.applications import FastA2A
+from fasta2a.broker import InMemoryBroker
+from fasta2a.schema import (
+    AgentProvider,
+    Artifact,
+    DataPart,
+    Message,
+    TaskIdParams,
+    TaskSendParams,
+    TextPart,
+)
+from fasta2a.storage import InMemoryStorage
+from fasta2a.worker import Worker
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Mount, Route
+
+from fastomop.api.scheduler import (
+    QueryScheduler,
+    ServerBusyError,
+    ServerShuttingDownError,
+)
+from fastomop.config import ServeSettings, get_config
+from fastomop.otel import get_tracer
+
+if TYPE_CHECKING:
+    from fastomop.agents.supervisor import FastOmopSupervisor, QueryResult
+
+# Seconds after which clients of rejected queries should try again
+RETRY_AFTER = 5
+
+DEFAULT_TENANT = "anonymous"
+A2A_TENANT = "a2a"
+
+
+def _result_json(result: "QueryResult") -> Dict[str, Any]:
+    return {
+        **result.get_summary(),
+        "query": result.query,
+        "sql_queries": result.sql_queries,
+        "cache_score": result.cache_score,
+    }
+
+
+def _rejection(e: Exception) -> JSONResponse:
+    """Response to a query the scheduler did not admit."""
+    status_code = 503 if isinstance(e, ServerShuttingDownError) else 429
+    return JSONResponse(
+        {"error": str(e)},
+        status_code=status_code,
+        headers={"Retry-After": str(RETRY_AFTER)},
+    )
+
+
+async def answer(
+    supervisor: "FastOmopSupervisor", user_query: str, tenant: str
+) -> "QueryResult":
+    """Answer a query within a trace span."""
+    with get_tracer().start_as_current_span(name="User Query") as span:
+        result = await supervisor.process_query(user_query)
+        span.update(
+            input={"user_query": user_query},
+            output={"final_answer": result.final_answer},
+            metadata={"tenant": tenant, **result.get_summary()},
+        )
+        return result
+
+
+@dataclass
+class SupervisorWorker(Worker[List[Message]]):
+    """A2A worker answering the messages of tasks with the supervisor.
+
+    Tasks run concurrently within the limits of the scheduler, all of them as one
+    tenant since the metadata and context of a task are chosen by the client.
+    """
+
+    supervisor: "FastOmopSupervisor"
+    scheduler: QueryScheduler
+    tasks: Dict[str, asyncio.Task] = field(default_factory=dict)
+
+    async def run_task(self, params: TaskSendParams) -> None:
+        # The worker handles one task operation at a time, so tasks run apart
+        task = asyncio.create_task(self._run(params, A2A_TENANT))
+        self.tasks[params["id"]] = task
+        task.add_done_callback(lambda _: self.tasks.pop(params["id"], None))
+
+    async def _run(self, params: TaskSendParams, tenant: str) -> None:
+        user_query = "\n".join(
+            part["text"]
+            for part in params["message"]["parts"]
+            if part["kind"] == "text"
+        )
+        try:
+            async with self.scheduler.slot(tenant):
+                await self.storage.update_task(params["id"], state="working")
+                result = await answer(self.supervisor, user_query, tenant)
+        except (ServerBusyError, ServerShuttingDownError) as e:
+            await self.storage.update_task(
+                params["id"], state="rejected", new_messages=[self._message(str(e))]
+            )
+            return
+        except asyncio.CancelledError:
+            await self.storage.update_task(params["id"], state="canceled")
+            return
+
+        if result.success:
+            await self.storage.update_task(
+                params["id"],
+                state="completed",
+                new_artifacts=self.build_artifacts(result),
+            )
+        else:
+            await self.storage.update_task(
+                params["id"],
+                state="failed",
+                new_messages=[self._message(result.final_answer or "")],
+            )
+
+    async def cancel_task(self, params: TaskIdParams) -> None:
+        task = self.tasks.get(params["id"])
+        if task is not None:
+            task.cancel()
+
+    def cancel_all(self) -> None:
+        """Cancel the running and waiting tasks."""
+        for task in list(self.tasks.values()):
+            task.cancel()
+
+    def build_message_history(self, history: List[Message]) -> List[Message]:
+        # The supervisor answers each query on its own
+        return history
+
+    def build_artifacts(self, result: "QueryResult") -> List[Artifact]:
+        return [
+            Artifact(
+                artifact_id=str(uuid.uuid4()),
+                name="result",
+                parts=[
+                    TextPart(kind="text", text=result.final_answer or ""),
+                    DataPart(kind="data", data=_result_json(result)),
+                ],
+            )
+        ]
+
+    @staticmethod
+    def _message(text: str) -> Message:
+        return Message(
+            role="agent",
+            parts=[TextPart(kind="text", text=text)],
+            kind="message",
+            message_id=str(uuid.uuid4()),
+        )
+
+
+def create_app(
+    supervisor: Optional["FastOmopSupervisor"] = None,
+    settings: Optional[ServeSettings] = None,
+) -> Starlette:
+    """
+    Create the ASGI app serving the supervisor.
+
+    Args:
+        supervisor: The supervisor, created if None
+        settings: The serve settings, from the configuration if None
+
+    Returns:
+        The app, which starts the A2A worker and drains the queries on shutdown
+    """
+    cfg = get_config()
+    settings = settings or cfg.serve
+    if supervisor is None:
+        from fastomop.agents.supervisor import FastOmopSupervisor
+
+        supervisor = FastOmopSupervisor()
+
+    scheduler = QueryScheduler(
+        max_concurrency=settings.max_concurrency,
+        tenant_concurrency=settings.tenant_concurrency,
+        max_queue=settings.max_queue,
+        tenant_queue=settings.tenant_queue,
+        queue_timeout=settings.queue_timeout,
+    )
+    storage: InMemoryStorage = InMemoryStorage()
+    broker = InMemoryBroker()
+    worker = SupervisorWorker(
+        broker=broker, storage=storage, supervisor=supervisor, scheduler=scheduler
+    )
+    a2a = FastA2A(
+        storage=storage,
+        broker=broker,
+        name=cfg.supervisor_agent.agent_name,
+        url=f"http://{settings.host}:{settings.port}/a2a/",
+        description=cfg.supervisor_agent.description,
+        provider=AgentProvider(
+            organization="FastOMOP Developers",
+            url="https://github.com/fastomop/fastomop",
+        ),
+    )
+
+    def tenant_of(request: Request) -> str:
+        if settings.tenant_header:
+            # Only trustworthy when set by a proxy, see the module docstring
+            return request.headers.get(settings.tenant_header) or DEFAULT_TENANT
+        return request.client.host if request.client else DEFAULT_TENANT
+
+    async def query(request: Request) -> Response:
+        try:
+            body = await request.json()
+            user_query = body["query"]
+            if not isinstance(user_query, str) or not user_query.strip():
+                raise ValueError
+        except (ValueError, KeyError, TypeError):
+            return JSONResponse(
+                {"error": 'Expected a JSON body with a non-empty "query".'},
+                status_code=400,
+            )
+        tenant = tenant_of(request)
+        if body.get("stream"):
+            return stream(user_query, tenant)
+        try:
+            async with scheduler.slot(tenant):
+                result = await answer(supervisor, user_query, tenant)
+        except (ServerBusyError, ServerShuttingDownError) as e:
+            return _rejection(e)
+        return JSONResponse(_result_json(result))
+
+    def stream(user_query: str, tenant: str) -> Response:
+        try:
+            scheduler.check(tenant)
+        except (ServerBusyError, ServerShuttingDownError) as e:
+            return _rejection(e)
+
+        async def events() -> AsyncIterator[str]:
+            try:
+                async with scheduler.slot(tenant):
+                    with get_tracer().start_as_current_span(name="User Query") as span:
+                        async for event in supervisor.process_query_stream(user_query):
+                            if event.kind == "result":
+                                data = _result_json(event.data)
+                                span.update(
+                                    input={"user_query": user_query},
+                                    output={"final_answer": event.data.final_answer},
+                                    metadata={"tenant": tenant, **data},
+                                )
+                            else:
+                                data = event.data
+                            payload = json.dumps({"step": event.step, "data": data})
+                            yield f"event: {event.kind}\ndata: {payload}\n\n"
+            except (ServerBusyError, ServerShuttingDownError) as e:
+                yield f"event: error\ndata: {json.dumps({'error': str(e)})}\n\n"
+
+        return StreamingResponse(
+            events(),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache"},
+        )
+
+    async def health(request: Request) -> Response:
+        status = "shutting_down" if scheduler.closed else "ok"
+        return JSONResponse({"status": status, **scheduler.stats()})
+
+    @asynccontextmanager
+    async def lifespan(app: Starlette) -> AsyncIterator[None]:
+        try:
+            await supervisor.warm_up_sql_agent()
+        except Exception as e:
+            print(f"Failed to start the MCP servers, retrying on first use: {e}")
+        async with a2a.task_manager, worker.run():
+            try:
+                yield
+            finally:
+                scheduler.close()
+                if not await scheduler.drain(settings.shutdown_timeout):
+                    print(
+                        f"{scheduler.running + scheduler.queued} queries did not "
+                        f"finish within {settings.shutdown_timeout}s, cancelling them"
+                    )
+                    worker.cancel_all()
+        await supervisor.close()
+        await asyncio.to_thread(get_tracer().flush)
+
+    app = Starlette(
+        routes=[
+            Route("/query", query, methods=["POST"]),
+            Route("/health", health, methods=["GET"]),
+            Mount("/a2a", app=a2a),
+        ],
+        lifespan=lifespan,
+    )
+    app.state.scheduler = scheduler
+    app.state.supervisor = supervisor
+    return app
+
+
+def main() -> None:
+    """Entry point for the fastomop_serve command."""
+    import uvicorn
+
+    settings = get_config().serve
+    uvicorn.run(
+        create_app(settings=settings),
+        host=settings.host,
+        port=settings.port,
+        timeout_graceful_shutdown=int(settings.shutdown_timeout),
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,9 @@
 """Configuration settings for FastOMOP."""
 
+import functools
 import os
 from pathlib import Path
-from typing import Literal, Optional, Union
+from typing import Any, Literal, Optional, Union
 
 from dotenv import find_dotenv
 from pydantic import BaseModel, Field
@@ -21,8 +22,6 @@ config_file_path = Path(
 
 env_file_path = find_dotenv()
 
-assert config_file_path.exists(), f"Config file not found: {config_file_path}"
-
 
 class OpenAIConfig(BaseModel):
     """Settings for OpenAI."""
@@ -62,6 +61,19 @@ def create_ollama_config() -> OpenAIConfig:
 ProviderConfig = Union[OpenAIConfig, AzureConfig, AnthropicConfig]
 
 
+class ModelCacheSettings(BaseModel):
+    """Settings for the cache of an agent's model responses."""
+
+    # "off", "cache" serves repeated calls from the cache and saves new responses,
+    # "record" calls the model and saves every response, "replay" only serves saved
+    # responses and fails on calls that were not recorded
+    mode: Literal["off", "cache", "record", "replay"] = "off"
+    # Directory of the saved responses, shared by the agents
+    path: str = ".cache/model_responses"
+    # Seconds after which a saved response is no longer served, None for never
+    ttl: Optional[float] = None
+
+
 class AgentSettings(BaseModel):
     """Settings for the agent configuration."""
 
@@ -74,22 +86,105 @@ class AgentSettings(BaseModel):
     system_prompt: str = "You are a helpful assistant."
     user_prompt: str = "How can I assist you today?"
     mcp_servers: list[str] = []
+    model_cache: ModelCacheSettings = ModelCacheSettings()
+
+
+class SupervisorSettings(BaseModel):
+    """Settings for the orchestration of agents by the supervisor."""
+
+    # "dag" runs independent steps concurrently, "sequential" runs one step at a time
+    orchestration: Literal["sequential", "dag"] = "dag"
+    # MCP tool of the SQL agent whose output is fetched ahead of the SQL step. The
+    # default lists the tables, the SQL agent gets the columns of the tables it needs
+    # with Get_Table_Schema. None leaves the schema retrieval to the SQL agent
+    schema_tool: Optional[str] = "List_Tables"
+
+
+class HistorySettings(BaseModel):
+    """Settings for the history of queries answered by the supervisor."""
+
+    # "memory" keeps the latest queries in a ring buffer, "sqlite" appends them to `path`
+    backend: Literal["memory", "sqlite"] = "memory"
+    # Number of queries kept, the oldest are dropped
+    max_entries: int = 1000
+    # Maximum total size of the compressed results kept in memory, None for unbounded
+    max_bytes: Optional[int] = 64 * 1024 * 1024
+    path: str = ".cache/history.sqlite"
+
+
+class ServeSettings(BaseModel):
+    """Settings for serving the supervisor over HTTP and A2A."""
+
+    host: str = "127.0.0.1"
+    port: int = 8080
+    # Queries running at a time, overall and of one tenant
+    max_concurrency: int = 16
+    tenant_concurrency: int = 4
+    # Queries waiting to run, overall and of one tenant, further queries are rejected
+    max_queue: int = 64
+    tenant_queue: int = 16
+    # Seconds a query waits to run before it is rejected, None for no limit
+    queue_timeout: Optional[float] = 120
+    # Seconds given to running and waiting queries to finish on shutdown
+    shutdown_timeout: float = 30
+    # Header identifying the tenant of an HTTP query, None for the client address.
+    # Only set it behind a proxy that sets the header from the authenticated user and
+    # replaces the client's value, as clients could rotate it to escape the limits
+    tenant_header: Optional[str] = None
+
+
+class AnswerCacheSettings(BaseModel):
+    """Settings for reusing the answers of similar questions."""
+
+    enabled: bool = False
+    # Similarity from 0 to 1 above which the answer of a previous question is served
+    answer_threshold: float = 0.9
+    # Similarity above which the interpretation and SQL of a previous question are
+    # given to the agents as hints
+    sql_threshold: float = 0.75
+    max_entries: int = 1000
+    # Seconds after which an answer is no longer served, None for never
+    ttl: Optional[float] = 86400.0
+    # MCP tool of the SQL agent returning the version of the CDM data, whose changes
+    # invalidate the cached answers
+    cdm_version_tool: str = "Get_CDM_Version"
+
+
+class PromptSettings(BaseModel):
+    """Settings for the local cache of the Langfuse prompts."""
+
+    label: str = "latest"
+    # Seconds after which a cached prompt is refreshed in the background
+    cache_ttl: float = 300.0
+    # File of the fetched prompts, used when Langfuse is unreachable
+    cache_path: Optional[str] = ".cache/prompts.json"
+    fetch_timeout: int = 5
 
 
 class MCPServerSettings(BaseModel):
     """Settings for the MCP server."""
 
     name: str = "sql_mcp_server"
+    # "stdio" starts the server as a subprocess, "streamable-http" connects to `url`
+    transport: Literal["stdio", "streamable-http"] = "stdio"
     command: str = "uv"
     args: list[str] = ["run", "fastomop_mcp_sql"]
+    url: Optional[str] = None
+    # Restarts of a broken session before calls fail
+    max_restarts: int = 3
 
 
 class TracerSettings(BaseModel):
     """Settings for the Langfuse OpenTelemetry tracer."""
 
-    public_key: str = os.environ["LANGFUSE_PUBLIC_KEY"]
-    secret_key: str = os.environ["LANGFUSE_SECRET_KEY"]
-    host: str = os.environ["LANGFUSE_HOST"]
+    # Read when the settings are loaded rather than when this module is imported
+    public_key: Optional[str] = Field(
+        default_factory=lambda: os.environ.get("LANGFUSE_PUBLIC_KEY")
+    )
+    secret_key: Optional[str] = Field(
+        default_factory=lambda: os.environ.get("LANGFUSE_SECRET_KEY")
+    )
+    host: Optional[str] = Field(default_factory=lambda: os.environ.get("LANGFUSE_HOST"))
 
 
 class OMOPSettings(BaseModel):
@@ -188,6 +283,11 @@ class FastOMOPSettings(BaseSettings):
     supervisor_agent: AgentSettings = AgentSettings()
     sql_agent: AgentSettings = AgentSettings()
     semantic_agent: AgentSettings = AgentSettings()
+    supervisor: SupervisorSettings = SupervisorSettings()
+    prompts: PromptSettings = PromptSettings()
+    answer_cache: AnswerCacheSettings = AnswerCacheSettings()
+    history: HistorySettings = HistorySettings()
+    serve: ServeSettings = ServeSettings()
 
     # OMOP settings
     omop: OMOPSettings = OMOPSettings()
@@ -197,7 +297,7 @@ class FastOMOPSettings(BaseSettings):
     mcp_servers: list[MCPServerSettings] = [MCPServerSettings()]
 
     # OpenTelemetry tracer settings
-    tracer: TracerSettings = TracerSettings()
+    tracer: TracerSettings = Field(default_factory=TracerSettings)
 
     model_config = SettingsConfigDict(
         env_file=env_file_path,
@@ -231,4 +331,15 @@ class FastOMOPSettings(BaseSettings):
         )
 
 
-config = FastOMOPSettings()
+@functools.cache
+def get_config() -> FastOMOPSettings:
+    """Load the settings on first use."""
+    assert config_file_path.exists(), f"Config file not found: {config_file_path}"
+    return FastOMOPSettings()
+
+
+def __getattr__(name: str) -> Any:
+    # `config` is loaded on first access, so that importing this module is cheap
+    if name == "config":
+        return get_config()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,57 +1,160 @@
 """Main entry point for FastOMOP application."""
 
 import asyncio
+import contextlib
+from typing import TYPE_CHECKING, Optional
 
-from langfuse import observe
 from rich.console import Console
+from rich.live import Live
+from rich.markdown import Markdown
+from rich.panel import Panel
+from rich.syntax import Syntax
+from rich.text import Text
 
-from fastomop.agents.supervisor import FastOmopSupervisor
-from fastomop.otel import tracer
+from fastomop.otel import get_tracer
+
+if TYPE_CHECKING:
+    # The agents are imported in the background, see `main_async`
+    from fastomop.agents.supervisor import FastOmopSupervisor, QueryResult
 
 console = Console()
 
+STEP_STATUS = {
+    "semantic": "Interpreting the query...",
+    "sql": "Querying the OMOP database...",
+    "synthesis": "Writing the answer...",
+}
+
+# Number of result lines shown while a query is processed
+PREVIEW_LINES = 10
+
+
+def _preview(rows: str) -> Text:
+    """Shorten a query result to its first lines."""
+    lines = rows.splitlines()
+    if len(lines) > PREVIEW_LINES:
+        lines = lines[:PREVIEW_LINES] + [f"... {len(lines) - PREVIEW_LINES} more lines"]
+    return Text("\n".join(lines))
+
+
+async def stream_query(
+    supervisor: "FastOmopSupervisor", user_query: str
+) -> Optional["QueryResult"]:
+    """Process a query, rendering its progress and the answer as they arrive."""
+    result = None
+    answer = ""
+    live: Optional[Live] = None
+    status = console.status("Processing query...")
+    status.start()
+    try:
+        async for event in supervisor.process_query_stream(user_query):
+            if event.kind == "step_started" and event.step in STEP_STATUS:
+                status.update(STEP_STATUS[event.step])
+            elif event.kind == "semantic":
+                console.print(Panel(Markdown(event.data), title="Interpretation"))
+            elif event.kind == "sql":
+                console.print(
+                    Panel(Syntax(event.data or "", "sql", word_wrap=True), title="SQL")
+                )
+            elif event.kind == "rows":
+                console.print(Panel(_preview(event.data), title="Rows"))
+            elif event.kind == "query_error":
+                console.print(
+                    Panel(Text(event.data), title="Query failed", style="red")
+                )
+            elif event.kind == "token":
+                if live is None:
+                    status.stop()
+                    console.print("\nAssistant:")
+                    live = Live(Markdown(""), console=console, refresh_per_second=10)
+                    live.start()
+                answer += event.data
+                live.update(Markdown(answer))
+            elif event.kind == "result":
+                result = event.data
+    finally:
+        if live is not None:
+            live.stop()
+        status.stop()
+
+    if result is not None and result.success and live is None:
+        console.print(f"\nAssistant: {result.final_answer}")
+    return result
+
+
+def _create_supervisor() -> "FastOmopSupervisor":
+    """Import the agents and create the supervisor."""
+    from fastomop.agents.supervisor import FastOmopSupervisor
+
+    return FastOmopSupervisor()
+
 
-@observe(name="FastOMOP.Main")
 async def main_async() -> None:
     """Entry point for the fastomop command."""
-    supervisor = FastOmopSupervisor()
+    # Create the agents in a thread while the user types the first query
+    startup = asyncio.ensure_future(asyncio.to_thread(_create_supervisor))
     print("FastOMOP v2 - pydantic-AI implementation")
     print("----------------------------------------")
     print("Type 'quit', 'exit' or 'q' to quit")
     print("----------------------------------------")
 
-    while True:
-        with tracer.start_as_current_span(name="User Query") as span:
+    try:
+        await _repl(startup)
+    finally:
+        if startup.done() and not startup.exception():
+            await startup.result().close()
+
+
+async def _repl(startup: "asyncio.Future[FastOmopSupervisor]") -> None:
+    """Answer user queries until the user quits."""
+    with contextlib.ExitStack() as session:
+        supervisor = None
+        while True:
             try:
                 user_query = input("User: ")
-                if user_query.lower() in ["quit", "exit", "q"]:
-                    print("Goodbye!")
-                    break
-
-                if not user_query:
-                    continue
-
-                print("Processing query...")
-                result = await supervisor.process_query(user_query)
-
-                if result.success:
-                    print(f"\n{result.get_summary()}")
-                    print(f"\nAssistant: {result.final_answer}")
-                else:
-                    print(f"\nError: {result.final_answer}")
-                span.update(
-                    input={"user_query": user_query},
-                    output={"final_answer": result.final_answer},
-                    metadata=result.__dict__,
-                )
-
-            except KeyboardInterrupt:
+            except (KeyboardInterrupt, EOFError):
                 print("\nGoodbye!")
                 break
-            except Exception as e:
-                print(f"\nError: {e}")
-            finally:
-                tracer.flush()
+            if user_query.lower() in ["quit", "exit", "q"]:
+                print("Goodbye!")
+                break
+
+            if not user_query:
+                continue
+
+            if supervisor is None:
+                supervisor = await startup
+                session.enter_context(
+                    get_tracer().start_as_current_span(name="FastOMOP.Main")
+                )
+            await _answer(supervisor, user_query)
+
+
+async def _answer(supervisor: "FastOmopSupervisor", user_query: str) -> None:
+    """Answer a user query within a trace span."""
+    tracer = get_tracer()
+    with tracer.start_as_current_span(name="User Query") as span:
+        try:
+            result = await stream_query(supervisor, user_query)
+            if result is None:
+                return
+
+            if result.success:
+                print(f"\n{result.get_summary()}")
+            else:
+                print(f"\nError: {result.final_answer}")
+            span.update(
+                input={"user_query": user_query},
+                output={"final_answer": result.final_answer},
+                metadata=result.__dict__,
+            )
+
+        except KeyboardInterrupt:
+            print("\nInterrupted")
+        except Exception as e:
+            print(f"\nError: {e}")
+        finally:
+            tracer.flush()
 
 
 def main() -> None:
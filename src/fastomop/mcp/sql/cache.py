@@ -0,0 +1,223 @@
+"""Result Cache Module
+This module provides a bounded, TTL-aware in-memory cache for query results.
+Keys are derived from the canonical (sqlglot normalised) form of the SQL so that
+whitespace, keyword case and identifier case variants of a query share an entry.
+"""
+
+import hashlib
+import threading
+import time
+import typing as t
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+
+import sqlglot as sg
+import sqlglot.expressions as exp
+from sqlglot.optimizer.normalize_identifiers import normalize_identifiers
+
+
+def normalize_sql(query: str | exp.Expression, dialect: t.Optional[str] = None) -> str:
+    """
+    Return the canonical form of a SQL query.
+
+    The query is parsed with sqlglot, unquoted identifiers are normalised and the
+    AST is rendered back to SQL without comments. Queries that cannot be parsed
+    fall back to a whitespace-collapsed version of the raw text.
+
+    Args:
+        query (str | exp.Expression): The SQL query or an already parsed query.
+            Parsed queries are copied and not modified.
+        dialect (str): The dialect used to parse and render the query.
+
+    Returns:
+        str: The canonical SQL string.
+    """
+    if isinstance(query, exp.Expression):
+        parsed = query.copy()
+    else:
+        try:
+            parsed = sg.parse_one(query, read=dialect)
+        except sg.errors.SqlglotError:
+            return " ".join(query.split())
+
+    return normalize_identifiers(parsed, dialect=dialect).sql(
+        dialect=dialect, comments=False
+    )
+
+
+def make_cache_key(
+    query: str | exp.Expression, *parts: t.Any, dialect: t.Optional[str] = None
+) -> str:
+    """
+    Build a cache key from the canonical SQL and any extra key parts.
+
+    Args:
+        query (str | exp.Expression): The SQL query or an already parsed query.
+        *parts: Additional values that change the result of the query, such as the
+            schema names or the row limit.
+        dialect (str): The dialect used to normalise the query.
+
+    Returns:
+        str: A hex digest identifying the query result.
+    """
+    payload = "\x1f".join([normalize_sql(query, dialect), *map(str, parts)])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _default_sizeof(value: t.Any) -> int:
+    """Estimate the size of a cached value in bytes."""
+    if isinstance(value, str):
+        return len(value.encode("utf-8"))
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return len(value)
+    return int(getattr(value, "nbytes", 0))
+
+
+@dataclass
+class CacheStats:
+    """Counters describing the state and effectiveness of a cache."""
+
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    expirations: int = 0
+    entries: int = 0
+    bytes: int = 0
+
+    def to_dict(self) -> t.Dict[str, int]:
+        return asdict(self)
+
+
+@dataclass
+class _CacheEntry:
+    value: t.Any
+    size: int
+    expires_at: t.Optional[float]
+
+
+class ResultCache:
+    """
+    A thread-safe LRU cache bounded by entry count and total size in bytes.
+
+    Entries expire after ``ttl`` seconds. Values larger than ``max_bytes`` are not
+    cached at all so a single large result cannot flush the whole cache.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 256,
+        max_bytes: t.Optional[int] = 64 * 1024 * 1024,
+        ttl: t.Optional[float] = 3600.0,
+        sizeof: t.Callable[[t.Any], int] = _default_sizeof,
+    ):
+        """
+        Initialize the ResultCache.
+
+        Args:
+            max_entries (int): Maximum number of entries. A value of 0 disables the cache.
+            max_bytes (int): Maximum total size of all entries. None means unbounded.
+            ttl (float): Time to live of each entry in seconds. None means no expiry.
+            sizeof (Callable): Function returning the size of a value in bytes.
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.sizeof = sizeof
+
+        self._entries: OrderedDict[str, _CacheEntry] = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = CacheStats()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def get(self, key: str) -> t.Any | None:
+        """
+        Get a value from the cache.
+
+        Args:
+            key (str): The cache key.
+
+        Returns:
+            The cached value, or None if the key is missing or expired.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats.misses += 1
+                return None
+
+            if entry.expires_at is not None and entry.expires_at <= time.monotonic():
+                self._remove(key)
+                self._stats.expirations += 1
+                self._stats.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self._stats.hits += 1
+            return entry.value
+
+    def put(self, key: str, value: t.Any) -> bool:
+        """
+        Add a value to the cache, evicting least recently used entries if needed.
+
+        Args:
+            key (str): The cache key.
+            value: The value to cache.
+
+        Returns:
+            bool: True if the value was cached.
+        """
+        if not self.enabled:
+            return False
+
+        size = self.sizeof(value)
+        if self.max_bytes is not None and size > self.max_bytes:
+            return False
+
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+            self._entries[key] = _CacheEntry(value, size, expires_at)
+            self._stats.bytes += size
+
+            while len(self._entries) > self.max_entries or (
+                self.max_bytes is not None and self._stats.bytes > self.max_bytes
+            ):
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self._stats.evictions += 1
+
+            self._stats.entries = len(self._entries)
+            return True
+
+    def invalidate(self, key: str) -> None:
+        """Remove a single entry from the cache."""
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def clear(self) -> None:
+        """Remove all entries from the cache."""
+        with self._lock:
+            self._entries.clear()
+            self._stats.entries = 0
+            self._stats.bytes = 0
+
+    @property
+    def stats(self) -> CacheStats:
+        """Return a snapshot of the cache counters."""
+        with self._lock:
+            return CacheStats(**self._stats.to_dict())
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key)
+        self._stats.bytes -= entry.size
+        self._stats.entries = len(self._entries)
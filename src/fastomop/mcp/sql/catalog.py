@@ -0,0 +1,432 @@
+"""Schema Catalog Module
+This module provides an in-memory catalog of the OMOP tables exposed by the MCP server.
+
+The catalog is introspected once from the database and holds the tables, columns,
+data types, primary and foreign keys and row count estimates. Keys declared in the
+database are used when present, otherwise they are inferred from the OMOP naming
+conventions. The catalog can be saved to a JSON snapshot, versioned by the CDM
+fingerprint, which loads without querying the database.
+"""
+
+import json
+import os
+import tempfile
+import typing as t
+from dataclasses import asdict, dataclass, field
+
+import pyarrow as pa
+
+CATALOG_FORMAT_VERSION = 1
+
+
+@dataclass
+class ColumnSchema:
+    """A column of a table in the catalog."""
+
+    name: str
+    data_type: str
+    nullable: bool = True
+
+
+@dataclass
+class ForeignKey:
+    """A foreign key from a column to the primary key of another table."""
+
+    column: str
+    references_table: str
+    references_column: str
+
+
+@dataclass
+class TableSchema:
+    """A table in the catalog."""
+
+    schema: str
+    name: str
+    columns: t.List[ColumnSchema] = field(default_factory=list)
+    primary_key: t.List[str] = field(default_factory=list)
+    foreign_keys: t.List[ForeignKey] = field(default_factory=list)
+    row_estimate: t.Optional[int] = None
+
+    @property
+    def qualified_name(self) -> str:
+        return f"{self.schema}.{self.name}"
+
+    def get_column(self, name: str) -> t.Optional[ColumnSchema]:
+        """Get a column by its case-insensitive name."""
+        name = name.lower()
+        return next((c for c in self.columns if c.name.lower() == name), None)
+
+    def describe(self) -> str:
+        """
+        Describe the table in a compact text form suited to LLM prompts.
+
+        Returns:
+            str: The table name, row estimate, primary key and one line per column
+                with its data type, nullability and foreign key.
+        """
+        references = {
+            fk.column: f"{fk.references_table}.{fk.references_column}"
+            for fk in self.foreign_keys
+        }
+        lines = [f"table: {self.qualified_name}"]
+        if self.row_estimate is not None:
+            lines.append(f"estimated_rows: {self.row_estimate}")
+        if self.primary_key:
+            lines.append(f"primary_key: {', '.join(self.primary_key)}")
+        lines.append("columns:")
+        for column in self.columns:
+            line = f"{column.name} {column.data_type}"
+            if not column.nullable:
+                line += " NOT NULL"
+            if column.name in references:
+                line += f" -> {references[column.name]}"
+            lines.append(line)
+        return "\n".join(lines)
+
+
+class SchemaCatalog:
+    """
+    An in-memory catalog of tables, columns and keys.
+    """
+
+    def __init__(self, tables: t.Iterable[TableSchema], version: str = ""):
+        """
+        Initialize the SchemaCatalog.
+
+        Args:
+            tables (Iterable[TableSchema]): The tables of the catalog.
+            version (str): Identifier of the database version the catalog describes.
+        """
+        self.version = version
+        self.tables: t.Dict[str, TableSchema] = {}
+        for table in tables:
+            self.tables.setdefault(table.name.lower(), table)
+
+    def __len__(self) -> int:
+        return len(self.tables)
+
+    def __contains__(self, name: str) -> bool:
+        return self.get_table(name) is not None
+
+    def get_table(self, name: str) -> t.Optional[TableSchema]:
+        """
+        Get a table by its case-insensitive, optionally schema qualified name.
+
+        Args:
+            name (str): The table name, such as "person" or "cdm.person".
+
+        Returns:
+            TableSchema: The table, or None if it is not in the catalog.
+        """
+        schema, _, table_name = name.strip().lower().rpartition(".")
+        table = self.tables.get(table_name)
+        if table is None or (schema and schema != table.schema.lower()):
+            return None
+        return table
+
+    def list_tables(self) -> pa.Table:
+        """
+        List the tables of the catalog.
+
+        Returns:
+            pa.Table: One row per table with its schema, name, number of columns and
+                estimated row count.
+        """
+        tables = sorted(self.tables.values(), key=lambda t: (t.schema, t.name))
+        return pa.table(
+            {
+                "table_schema": [t.schema for t in tables],
+                "table_name": [t.name for t in tables],
+                "column_count": [len(t.columns) for t in tables],
+                "estimated_rows": pa.array(
+                    [t.row_estimate for t in tables], type=pa.int64()
+                ),
+            }
+        )
+
+    def to_information_schema(self) -> pa.Table:
+        """
+        Return the columns of all tables in the layout of `information_schema.columns`.
+
+        Returns:
+            pa.Table: One row per column with its schema, table, name and data type.
+        """
+        columns: t.Dict[str, t.List[str]] = {
+            "table_schema": [],
+            "table_name": [],
+            "column_name": [],
+            "data_type": [],
+        }
+        for table in sorted(self.tables.values(), key=lambda t: (t.schema, t.name)):
+            for column in table.columns:
+                columns["table_schema"].append(table.schema)
+                columns["table_name"].append(table.name)
+                columns["column_name"].append(column.name)
+                columns["data_type"].append(column.data_type)
+        return pa.table(
+            {
+                name: pa.array(values, type=pa.string())
+                for name, values in columns.items()
+            }
+        )
+
+    def to_dict(self) -> t.Dict[str, t.Any]:
+        return {
+            "format_version": CATALOG_FORMAT_VERSION,
+            "version": self.version,
+            "tables": [asdict(table) for table in self.tables.values()],
+        }
+
+    @classmethod
+    def from_dict(cls, data: t.Dict[str, t.Any]) -> "SchemaCatalog":
+        tables = [
+            TableSchema(
+                schema=table["schema"],
+                name=table["name"],
+                columns=[ColumnSchema(**c) for c in table["columns"]],
+                primary_key=list(table["primary_key"]),
+                foreign_keys=[ForeignKey(**fk) for fk in table["foreign_keys"]],
+                row_estimate=table["row_estimate"],
+            )
+            for table in data["tables"]
+        ]
+        return cls(tables, version=data["version"])
+
+    def save(self, path: str) -> None:
+        """
+        Atomically write the catalog to a JSON snapshot.
+
+        Args:
+            path (str): Path of the snapshot file.
+        """
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(self.to_dict(), f, separators=(",", ":"))
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    @classmethod
+    def load(
+        cls, path: str, version: t.Optional[str] = None
+    ) -> t.Optional["SchemaCatalog"]:
+        """
+        Load a catalog from a JSON snapshot.
+
+        Args:
+            path (str): Path of the snapshot file.
+            version (str): Expected version of the catalog. Snapshots of other
+                versions are ignored.
+
+        Returns:
+            SchemaCatalog: The catalog, or None if the snapshot is missing, unreadable
+                or of another version.
+        """
+        try:
+            with open(path) as f:
+                data = json.load(f)
+            if data.get("format_version") != CATALOG_FORMAT_VERSION:
+                return None
+            if version is not None and data.get("version") != version:
+                return None
+            return cls.from_dict(data)
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    @classmethod
+    def introspect(
+        cls,
+        run_query: t.Callable[[str], pa.Table],
+        backend_name: str,
+        schemas: t.Sequence[str],
+        tables: t.Sequence[str],
+        allow_source_value_columns: bool = False,
+        version: str = "",
+    ) -> "SchemaCatalog":
+        """
+        Build the catalog from the database's information schema.
+
+        Args:
+            run_query (Callable): Function executing an internal query and returning
+                the rows as an Arrow table.
+            backend_name (str): Name of the database backend, such as "duckdb".
+            schemas (Sequence[str]): Schemas holding the tables.
+            tables (Sequence[str]): Names of the tables to include.
+            allow_source_value_columns (bool): Include source value columns.
+            version (str): Identifier of the database version.
+
+        Returns:
+            SchemaCatalog: The introspected catalog.
+        """
+        in_tables = ",".join(f"'{i}'" for i in tables)
+        in_schemas = ",".join(f"'{i}'" for i in dict.fromkeys(schemas))
+
+        query = f"""
+        select table_schema, table_name, column_name, data_type, is_nullable
+        from information_schema.columns
+        where table_name in ({in_tables})
+        and table_schema in ({in_schemas})
+        """
+        # Add filtering for source_value columns if not allowed
+        if not allow_source_value_columns:
+            query += " and lower(column_name) not like '%_source_value%'"
+        query += " order by table_schema, table_name, ordinal_position"
+
+        catalog: t.Dict[t.Tuple[str, str], TableSchema] = {}
+        for row in run_query(query).to_pylist():
+            key = (row["table_schema"], row["table_name"])
+            table = catalog.setdefault(key, TableSchema(*key))
+            table.columns.append(
+                ColumnSchema(
+                    name=row["column_name"],
+                    data_type=row["data_type"],
+                    nullable=str(row["is_nullable"]).upper() != "NO",
+                )
+            )
+
+        try:
+            primary_keys, foreign_keys = _declared_keys(
+                run_query, in_schemas, in_tables
+            )
+        except Exception:
+            # Constraint views are optional, fall back to the naming conventions
+            primary_keys, foreign_keys = {}, {}
+
+        try:
+            row_estimates = _row_estimates(run_query, backend_name, in_schemas)
+        except Exception:
+            row_estimates = {}
+
+        for key, table in catalog.items():
+            table.primary_key = primary_keys.get(key, [])
+            table.foreign_keys = foreign_keys.get(key, [])
+            table.row_estimate = row_estimates.get(key)
+
+        result = cls(catalog.values(), version=version)
+        for table in result.tables.values():
+            _infer_primary_key(table)
+        for table in result.tables.values():
+            _infer_foreign_keys(table, result)
+        return result
+
+
+def _declared_keys(
+    run_query: t.Callable[[str], pa.Table], in_schemas: str, in_tables: str
+) -> t.Tuple[
+    t.Dict[t.Tuple[str, str], t.List[str]],
+    t.Dict[t.Tuple[str, str], t.List[ForeignKey]],
+]:
+    """Read the primary and foreign keys declared in the database."""
+    primary_keys: t.Dict[t.Tuple[str, str], t.List[str]] = {}
+    pk_query = f"""
+    select kcu.table_schema, kcu.table_name, kcu.column_name
+    from information_schema.table_constraints tc
+    join information_schema.key_column_usage kcu
+        on kcu.constraint_name = tc.constraint_name
+        and kcu.table_schema = tc.table_schema
+        and kcu.table_name = tc.table_name
+    where tc.constraint_type = 'PRIMARY KEY'
+    and tc.table_schema in ({in_schemas})
+    and tc.table_name in ({in_tables})
+    order by kcu.table_schema, kcu.table_name, kcu.ordinal_position
+    """
+    for row in run_query(pk_query).to_pylist():
+        key = (row["table_schema"], row["table_name"])
+        primary_keys.setdefault(key, []).append(row["column_name"])
+
+    foreign_keys: t.Dict[t.Tuple[str, str], t.List[ForeignKey]] = {}
+    fk_query = f"""
+    select kcu.table_schema, kcu.table_name, kcu.column_name,
+        pk.table_name as references_table, pk.column_name as references_column
+    from information_schema.referential_constraints rc
+    join information_schema.key_column_usage kcu
+        on kcu.constraint_name = rc.constraint_name
+        and kcu.constraint_schema = rc.constraint_schema
+    join information_schema.key_column_usage pk
+        on pk.constraint_name = rc.unique_constraint_name
+        and pk.constraint_schema = rc.unique_constraint_schema
+        and pk.ordinal_position = kcu.position_in_unique_constraint
+    where kcu.table_schema in ({in_schemas})
+    and kcu.table_name in ({in_tables})
+    """
+    for row in run_query(fk_query).to_pylist():
+        key = (row["table_schema"], row["table_name"])
+        foreign_keys.setdefault(key, []).append(
+            ForeignKey(
+                row["column_name"], row["references_table"], row["references_column"]
+            )
+        )
+
+    return primary_keys, foreign_keys
+
+
+def _row_estimates(
+    run_query: t.Callable[[str], pa.Table], backend_name: str, in_schemas: str
+) -> t.Dict[t.Tuple[str, str], int]:
+    """Read the row count estimates kept in the database's statistics."""
+    if backend_name == "duckdb":
+        query = f"""
+        select schema_name as table_schema, table_name, estimated_size as row_estimate
+        from duckdb_tables()
+        where schema_name in ({in_schemas})
+        """
+    elif backend_name == "postgres":
+        query = f"""
+        select n.nspname as table_schema, c.relname as table_name,
+            c.reltuples::bigint as row_estimate
+        from pg_class c
+        join pg_namespace n on n.oid = c.relnamespace
+        where c.relkind in ('r', 'p') and n.nspname in ({in_schemas})
+        """
+    else:
+        return {}
+
+    return {
+        (row["table_schema"], row["table_name"]): int(row["row_estimate"])
+        for row in run_query(query).to_pylist()
+        # Postgres reports -1 for tables that were never analyzed
+        if row["row_estimate"] is not None and row["row_estimate"] >= 0
+    }
+
+
+def _infer_primary_key(table: TableSchema) -> None:
+    """Infer an undeclared primary key, which in OMOP is the `<table>_id` column."""
+    column = table.get_column(f"{table.name}_id")
+    if not table.primary_key and column is not None:
+        table.primary_key = [column.name]
+
+
+def _infer_foreign_keys(table: TableSchema, catalog: SchemaCatalog) -> None:
+    """
+    Infer undeclared foreign keys from the OMOP naming conventions.
+
+    A column named `<other>_id` or `<role>_<other>_id`, such as `person_id`,
+    `condition_concept_id` or `preceding_visit_occurrence_id`, references the
+    primary key of the table `<other>`.
+    """
+    if table.foreign_keys:
+        return
+
+    # Match the longest table name, so that concept_class_id references concept_class
+    names = sorted(catalog.tables, key=len, reverse=True)
+    for column in table.columns:
+        column_name = column.name.lower()
+        if column.name in table.primary_key or not column_name.endswith("_id"):
+            continue
+        for name in names:
+            if column_name == f"{name}_id" or column_name.endswith(f"_{name}_id"):
+                referenced = catalog.tables[name]
+                references_column = (
+                    referenced.primary_key[0]
+                    if len(referenced.primary_key) == 1
+                    else f"{name}_id"
+                )
+                table.foreign_keys.append(
+                    ForeignKey(column.name, referenced.name, references_column)
+                )
+                break
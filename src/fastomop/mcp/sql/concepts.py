@@ -0,0 +1,281 @@
+"""Concept Index Module
+This module provides an in-memory search index over the OMOP vocabulary.
+
+Concept names and synonyms are tokenized into an inverted index stored as CSR arrays:
+a sorted token dictionary, the offsets of each token's postings and the concept rows
+of the postings. Tokenization and index construction are vectorised with Arrow and
+NumPy, and a search only touches the postings of the query tokens, so candidates are
+ranked in milliseconds instead of scanning the concept table with LIKE.
+"""
+
+import typing as t
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+CONCEPT_COLUMNS = [
+    "concept_id",
+    "concept_name",
+    "domain_id",
+    "vocabulary_id",
+    "concept_class_id",
+    "standard_concept",
+    "concept_code",
+]
+
+# Query tokens of at least this length also match tokens they are a prefix of
+MIN_PREFIX_LENGTH = 3
+
+# Candidates are drawn from the most selective query tokens up to this many concepts,
+# so that common words such as "disease" do not make a search scan the vocabulary
+MAX_CANDIDATES = 50_000
+
+
+def sorted_unique(values: np.ndarray) -> np.ndarray:
+    """Sort and deduplicate an array, which is much faster than np.unique."""
+    values = np.sort(values)
+    if len(values) < 2:
+        return values
+    return values[np.concatenate(([True], values[1:] != values[:-1]))]
+
+
+def _contains(sorted_values: np.ndarray, values: np.ndarray) -> np.ndarray:
+    """Check which values are in a sorted array with a binary search."""
+    positions = np.searchsorted(sorted_values, values)
+    positions = np.minimum(positions, max(len(sorted_values) - 1, 0))
+    if not len(sorted_values):
+        return np.zeros(len(values), dtype=bool)
+    return sorted_values[positions] == values
+
+
+def _tokenize(names: pa.Array | pa.ChunkedArray) -> t.Tuple[np.ndarray, pa.Array]:
+    """
+    Split names into lower case alphanumeric tokens.
+
+    Returns:
+        The row index of each token and the tokens.
+    """
+    words = pc.split_pattern_regex(pc.utf8_lower(names), pattern=r"[^\p{L}\p{N}]+")
+    if isinstance(words, pa.ChunkedArray):
+        words = words.combine_chunks()
+    rows = pc.list_parent_indices(words).to_numpy()
+    tokens = pc.list_flatten(words)
+    keep = pc.not_equal(tokens, "").to_numpy(zero_copy_only=False)
+    return rows[keep], tokens.filter(pa.array(keep))
+
+
+def tokenize_query(text: str) -> t.List[str]:
+    """Split a search text into the tokens used by the index."""
+    _, tokens = _tokenize(pa.array([text]))
+    return list(dict.fromkeys(tokens.to_pylist()))
+
+
+class ConceptIndex:
+    """
+    A tokenized inverted index over concept names and synonyms.
+    """
+
+    def __init__(
+        self,
+        concepts: pa.Table,
+        tokens: np.ndarray,
+        offsets: np.ndarray,
+        postings: np.ndarray,
+    ):
+        """
+        Initialize the ConceptIndex. Use `ConceptIndex.build` to create an index.
+
+        Args:
+            concepts (pa.Table): The concepts, with the columns in `CONCEPT_COLUMNS`.
+            tokens (np.ndarray): Sorted array of the distinct tokens.
+            offsets (np.ndarray): Start of the postings of each token, with a final
+                entry holding the total number of postings.
+            postings (np.ndarray): Concept rows containing each token.
+        """
+        self.concepts = concepts
+        self.tokens = tokens
+        self.offsets = offsets
+        self.postings = postings
+
+        self._standard = (
+            pc.equal(concepts["standard_concept"], "S")
+            .fill_null(False)
+            .to_numpy(zero_copy_only=False)
+        )
+        self._filters: t.Dict[str, t.Tuple[pa.Array, np.ndarray]] = {}
+        for column in ("domain_id", "vocabulary_id"):
+            encoded = pc.dictionary_encode(concepts[column]).combine_chunks()
+            self._filters[column] = (
+                encoded.dictionary,
+                encoded.indices.fill_null(-1).to_numpy(),
+            )
+
+    def __len__(self) -> int:
+        return self.concepts.num_rows
+
+    @property
+    def nbytes(self) -> int:
+        return (
+            self.concepts.nbytes
+            + self.tokens.nbytes
+            + self.offsets.nbytes
+            + self.postings.nbytes
+        )
+
+    @classmethod
+    def build(
+        cls, concepts: pa.Table, synonyms: t.Optional[pa.Table] = None
+    ) -> "ConceptIndex":
+        """
+        Build the index from the concept and concept synonym tables.
+
+        Args:
+            concepts (pa.Table): Concepts with the columns in `CONCEPT_COLUMNS`.
+            synonyms (pa.Table): Synonyms with the columns `concept_id` and
+                `concept_synonym_name`. Synonyms of unknown concepts are ignored.
+
+        Returns:
+            ConceptIndex: The index.
+        """
+        # Store concepts in rank order, standard concepts and shorter names first, so
+        # that postings are sorted from the best to the worst match
+        concepts = concepts.select(CONCEPT_COLUMNS)
+        concepts = (
+            concepts.append_column(
+                "_non_standard",
+                pc.invert(pc.equal(concepts["standard_concept"], "S").fill_null(False)),
+            )
+            .append_column("_length", pc.utf8_length(concepts["concept_name"]))
+            .sort_by(
+                [
+                    ("_non_standard", "ascending"),
+                    ("_length", "ascending"),
+                    ("concept_id", "ascending"),
+                ]
+            )
+            .select(CONCEPT_COLUMNS)
+            .combine_chunks()
+        )
+
+        rows, tokens = _tokenize(concepts["concept_name"])
+        if synonyms is not None and synonyms.num_rows:
+            concept_ids = concepts["concept_id"].to_numpy()
+            by_id = np.argsort(concept_ids)
+            synonym_ids = synonyms["concept_id"].to_numpy(zero_copy_only=False)
+            positions = np.searchsorted(concept_ids[by_id], synonym_ids)
+            synonym_rows = by_id[np.minimum(positions, len(concept_ids) - 1)]
+            known = concept_ids[synonym_rows] == synonym_ids
+
+            token_rows, synonym_tokens = _tokenize(synonyms["concept_synonym_name"])
+            keep = known[token_rows]
+            rows = np.concatenate([rows, synonym_rows[token_rows[keep]]])
+            tokens = pa.concat_arrays([tokens, synonym_tokens.filter(pa.array(keep))])
+
+        # Number the tokens in sorted order so that prefixes are contiguous ranges
+        encoded = pc.dictionary_encode(tokens)
+        dictionary = encoded.dictionary.to_numpy(zero_copy_only=False).astype(str)
+        order = np.argsort(dictionary, kind="stable")
+        rank = np.empty_like(order)
+        rank[order] = np.arange(len(order))
+        token_ids = rank[encoded.indices.to_numpy()]
+
+        # Deduplicate (token, row) pairs, which also sorts them by token then row
+        pairs = sorted_unique(token_ids.astype(np.int64) * len(concepts) + rows)
+        postings = (pairs % max(len(concepts), 1)).astype(np.int32)
+        counts = np.bincount(pairs // max(len(concepts), 1), minlength=len(order))
+        offsets = np.zeros(len(order) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+
+        return cls(concepts, dictionary[order], offsets, postings)
+
+    def _token_rows(self, token: str) -> np.ndarray:
+        """Get the concept rows containing the token, or a token it is a prefix of."""
+        # Search with scalars of the dictionary's dtype, as longer strings make
+        # numpy copy the whole dictionary to a wider dtype
+        max_length = self.tokens.dtype.itemsize // 4
+        if len(token) > max_length:
+            return self.postings[:0]
+
+        start = np.searchsorted(self.tokens, np.array(token, self.tokens.dtype))
+        if MIN_PREFIX_LENGTH <= len(token) < max_length:
+            # Tokens starting with the prefix sort before the prefix followed by
+            # the largest code point
+            upper = np.array(token + "\U0010ffff", self.tokens.dtype)
+            end = np.searchsorted(self.tokens, upper)
+        elif start < len(self.tokens) and self.tokens[start] == token:
+            end = start + 1
+        else:
+            end = start
+        rows = self.postings[self.offsets[start] : self.offsets[end]]
+        return sorted_unique(rows) if end - start > 1 else rows
+
+    def search(
+        self,
+        text: str,
+        vocabulary_ids: t.Optional[t.Sequence[str]] = None,
+        domain_ids: t.Optional[t.Sequence[str]] = None,
+        standard_only: bool = False,
+        limit: int = 20,
+    ) -> pa.Table:
+        """
+        Search concepts by name and synonyms.
+
+        Concepts are ranked by the share of query tokens they contain, then exact name
+        matches, standard concepts and shorter names first. Candidates are the best
+        ranked concepts containing the most selective query tokens, see
+        `MAX_CANDIDATES`.
+
+        Args:
+            text (str): The search text.
+            vocabulary_ids (Sequence[str]): Only return concepts of these vocabularies.
+            domain_ids (Sequence[str]): Only return concepts of these domains.
+            standard_only (bool): Only return standard concepts.
+            limit (int): Maximum number of concepts to return.
+
+        Returns:
+            pa.Table: The matching concepts with their score, best match first.
+        """
+        query_tokens = tokenize_query(text)
+        if not query_tokens:
+            return self._result(np.array([], dtype=np.int64), np.array([]))
+
+        token_rows = sorted(
+            (self._token_rows(token) for token in query_tokens), key=len
+        )
+        rows = token_rows[0]
+        for matches in token_rows[1:]:
+            if len(rows) + len(matches) > MAX_CANDIDATES:
+                break
+            rows = sorted_unique(np.concatenate([rows, matches]))
+
+        mask = np.ones(len(rows), dtype=bool)
+        for column, values in (
+            ("vocabulary_id", vocabulary_ids),
+            ("domain_id", domain_ids),
+        ):
+            if values:
+                dictionary, indices = self._filters[column]
+                codes = pc.index_in(pa.array(list(values)), dictionary)
+                mask &= np.isin(indices[rows], codes.drop_null().to_numpy())
+        if standard_only:
+            mask &= self._standard[rows]
+        rows = rows[mask][:MAX_CANDIDATES]
+
+        counts = np.zeros(len(rows), dtype=np.int64)
+        for matches in token_rows:
+            counts += _contains(matches, rows)
+
+        names = self.concepts["concept_name"].take(pa.array(rows))
+        exact = (
+            pc.equal(pc.utf8_lower(names), text.strip().lower())
+            .fill_null(False)
+            .to_numpy(zero_copy_only=False)
+        )
+        # lexsort sorts by the last key first, rows are in rank order
+        order = np.lexsort((rows, ~exact, -counts))[:limit]
+        return self._result(rows[order], counts[order] / len(query_tokens))
+
+    def _result(self, rows: np.ndarray, scores: np.ndarray) -> pa.Table:
+        table = self.concepts.take(pa.array(rows, type=pa.int64()))
+        return table.append_column("score", pa.array(scores, type=pa.float64()))
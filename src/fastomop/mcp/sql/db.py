@@ -1,11 +1,42 @@
-from functools import lru_cache
-from typing import Any, Dict, List, Optional
+import hashlib
+import os
+import queue
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Literal, Optional, cast
+from urllib.parse import urlparse
 
-import ibis
-from ibis.backends import BaseBackend
+import numpy as np
+import pyarrow as pa
+import sqlglot as sg
 
 from . import exceptions as ex
-from .sql_validator import SQLValidator
+from .cache import ResultCache, make_cache_key
+from .catalog import SchemaCatalog
+from .concepts import CONCEPT_COLUMNS, ConceptIndex
+from .disk_cache import DiskResultCache
+from .executor import CancellationToken
+from .guard import GuardMode, QueryGuard
+from .hierarchy import ConceptHierarchy
+from .pool import (
+    ConnectionPool,
+    get_backend_name,
+    interrupt_connection,
+    temporary_tables,
+)
+from .results import collect_batches, is_truncated, to_csv
+from .sql_validator import (
+    OMOP_TABLES,
+    VOCABULARY_TABLES,
+    CompiledQuery,
+    SQLValidator,
+    StarMode,
+)
+from .subexpressions import SubexpressionStore
+
+CONCEPT_SET_NAME = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
 
 
 class OmopDatabase:
@@ -21,6 +52,35 @@ class OmopDatabase:
         vocab_schema: str = "vocab",
         allow_source_value_columns: bool = False,
         allowed_tables: Optional[List[str]] = None,
+        cache_max_entries: int = 256,
+        cache_max_bytes: Optional[int] = 64 * 1024 * 1024,
+        cache_ttl: Optional[float] = 3600.0,
+        disk_cache_dir: Optional[str] = None,
+        disk_cache_max_bytes: Optional[int] = 1024 * 1024 * 1024,
+        disk_cache_ttl: Optional[float] = None,
+        fingerprint_ttl: Optional[float] = 60.0,
+        row_limit: int = 1000,
+        byte_limit: Optional[int] = 8 * 1024 * 1024,
+        batch_size: int = 250,
+        pool_min_size: int = 1,
+        pool_max_size: int = 4,
+        pool_max_idle_time: Optional[float] = 300.0,
+        statement_timeout: Optional[float] = None,
+        max_estimated_cost: Optional[float] = None,
+        max_estimated_rows: Optional[float] = 100_000_000,
+        query_timeout: Optional[float] = 120.0,
+        guard_mode: GuardMode = "reject",
+        catalog_path: Optional[str] = None,
+        hierarchy_dir: Optional[str] = ".cache/concept_hierarchy",
+        subexpression_reuse: bool = True,
+        subexpression_min_uses: int = 2,
+        subexpression_max_rows: int = 1_000_000,
+        subexpression_max_bytes: Optional[int] = 256 * 1024 * 1024,
+        subexpression_max_sessions: int = 16,
+        sql_dialect: str = "postgres",
+        optimize_queries: bool = False,
+        star_mode: StarMode = "allow",
+        max_star_columns: Optional[int] = None,
     ):
         """
         Initialize the database connection.
@@ -30,9 +90,38 @@ class OmopDatabase:
             read_only: Flag to set the connection as read-only
             allow_source_values: Flag to allow source values
             allowed_tables: List of allowed tables for queries
+            cache_max_entries: Maximum number of cached query results (0 disables caching)
+            cache_max_bytes: Maximum total size of cached query results in bytes
+            cache_ttl: Time to live of cached query results in seconds
+            disk_cache_dir: Directory of the persistent result cache shared between processes
+            disk_cache_max_bytes: Maximum total size of the persistent result cache in bytes
+            disk_cache_ttl: Time to live of persistent cached results in seconds
+            fingerprint_ttl: Seconds after which the CDM fingerprint of cached results and metadata is checked again. None checks it once
+            row_limit: Maximum number of rows returned by a query
+            byte_limit: Maximum size in bytes of the rows returned by a query
+            batch_size: Number of rows fetched from the backend at a time
+            pool_min_size: Number of database connections kept open
+            pool_max_size: Maximum number of open database connections
+            pool_max_idle_time: Seconds after which idle connections above the minimum are closed
+            statement_timeout: Seconds after which the database cancels a statement (Postgres)
+            max_estimated_cost: Maximum estimated plan cost of a query
+            max_estimated_rows: Maximum estimated rows of a join producing more rows than its largest input
+            query_timeout: Seconds after which a running query is interrupted
+            guard_mode: "reject" or "downgrade" queries above the estimated cost limits
+            catalog_path: Path of the schema catalog snapshot, rebuilt when the CDM changes
+            hierarchy_dir: Directory of the memory-mapped concept hierarchy, rebuilt when the CDM changes. None rebuilds it in memory in every process
+            subexpression_reuse: Materialise CTEs and subqueries repeated by the queries of a session
+            subexpression_min_uses: Number of times a subexpression is seen before it is materialised
+            subexpression_max_rows: Maximum number of rows of a materialised subexpression
+            subexpression_max_bytes: Maximum total size of the materialised subexpressions of a session
+            subexpression_max_sessions: Maximum number of sessions with materialised subexpressions
+            sql_dialect: SQL dialect of the queries, transpiled to the dialect of the database
+            optimize_queries: Apply predicate pushdown and column pruning to queries
+            star_mode: "allow" stars, "expand" them to the columns of the catalog or "reject" them
+            max_star_columns: Maximum number of columns a query may select with stars
         """
 
-        self.conn: BaseBackend | Any = None
+        self.pool: ConnectionPool | Any = None
         self.supported_databases = [
             "duckdb",
             "postgres",
@@ -46,7 +135,9 @@ class OmopDatabase:
             # 'oracle'
         ]
         self.connection_string = connection_string
-        self.row_limit = 1000  # Default row limit for queries
+        self.row_limit = row_limit  # Default row limit for queries
+        self.byte_limit = byte_limit
+        self.batch_size = batch_size
         self.allowed_tables = allowed_tables or [
             "care_site",
             # "cdm_source",
@@ -88,13 +179,69 @@ class OmopDatabase:
 
         self.allow_source_value_columns: bool = allow_source_value_columns
 
+        self.cdm_schema = cdm_schema
+        self.vocab_schema = vocab_schema
+        self.backend_name = get_backend_name(connection_string)
+
+        vocabulary_tables = {name.lower() for name in VOCABULARY_TABLES}
         self.sql_validator = SQLValidator(
             allow_source_value_columns=self.allow_source_value_columns,
             exclude_tables=None,
             exclude_columns=None,
+            from_dialect=sql_dialect,
+            # SQLGlot names the dialect of all PostgreSQL drivers "postgres"
+            to_dialect="postgres"
+            if self.backend_name.startswith("postgres")
+            else self.backend_name,
+            table_schemas={
+                name: vocab_schema if name.lower() in vocabulary_tables else cdm_schema
+                for name in OMOP_TABLES
+            },
+            optimize=optimize_queries,
+            star_mode=star_mode,
+            max_star_columns=max_star_columns,
+        )
+        self._catalog_schema: Optional[tuple[str, Dict[str, Any]]] = None
+
+        self.result_cache = ResultCache(
+            max_entries=cache_max_entries,
+            max_bytes=cache_max_bytes,
+            ttl=cache_ttl,
+        )
+        self.disk_cache_dir = disk_cache_dir
+        self.disk_cache_max_bytes = disk_cache_max_bytes
+        self.disk_cache_ttl = disk_cache_ttl
+        self.disk_cache: Optional[DiskResultCache] = None
+        self.fingerprint_ttl = fingerprint_ttl
+        self._fingerprint: Optional[str] = None
+        self._fingerprint_checked_at = 0.0
+        self._fingerprint_lock = threading.Lock()
+        # The catalog, concept index and hierarchy with the CDM fingerprint each was
+        # built from, rebuilt once the fingerprint changes
+        self.catalog_path = catalog_path
+        self._catalog: Optional[tuple[str, SchemaCatalog]] = None
+        self._catalog_lock = threading.Lock()
+        self._concept_index: Optional[tuple[str, ConceptIndex]] = None
+        self._concept_index_lock = threading.Lock()
+        self.hierarchy_dir = hierarchy_dir
+        self._hierarchy: Optional[tuple[str, ConceptHierarchy]] = None
+        self._hierarchy_lock = threading.Lock()
+        self.subexpression_reuse = subexpression_reuse
+        self.subexpression_min_uses = subexpression_min_uses
+        self.subexpression_max_rows = subexpression_max_rows
+        self.subexpression_max_bytes = subexpression_max_bytes
+        self.subexpression_ttl = cache_ttl
+        # Subexpression stores by session, the least recently active ones are dropped
+        self._subexpression_stores = ResultCache(
+            max_entries=subexpression_max_sessions, max_bytes=None, ttl=cache_ttl
+        )
+        self._subexpression_lock = threading.Lock()
+        self.guard = QueryGuard(
+            max_estimated_cost=max_estimated_cost,
+            max_estimated_rows=max_estimated_rows,
+            timeout=query_timeout,
+            mode=guard_mode,
         )
-        self.cdm_schema = cdm_schema
-        self.vocab_schema = vocab_schema
 
         try:
             # Check if the connection string starts with a supported prefix
@@ -102,65 +249,798 @@ class OmopDatabase:
                 raise ValueError(
                     f"Unsupported database type in connection string: {connection_string}. Supported types are: {', '.join(self.supported_databases)}"
                 )
-            self.conn = ibis.connect(connection_string, read_only=read_only)
+            self.pool = ConnectionPool(
+                connection_string,
+                read_only=read_only,
+                min_size=pool_min_size,
+                max_size=pool_max_size,
+                max_idle_time=pool_max_idle_time,
+                statement_timeout=statement_timeout,
+            )
         except Exception as e:
             raise ConnectionError(f"Failed to connect to database: {str(e)}")
 
-    @lru_cache(maxsize=128)
-    def get_information_schema(self) -> Dict[str, List[str]]:
-        """Get the information schema of the database."""
+        if disk_cache_dir:
+            self.cdm_fingerprint()
+
+    def get_cdm_fingerprint(self) -> str:
+        """
+        Get a fingerprint identifying the current version of the CDM data.
+
+        The fingerprint combines the connection string, the contents of the
+        `cdm_source` table and, for DuckDB files, the modification time of the file.
+        Any change to these invalidates the persistent result cache.
+
+        Returns:
+            Hex digest identifying the CDM version
+        """
+        parts = [self.connection_string]
+
         try:
-            at = ",".join(f"'{i}'" for i in self.allowed_tables)
-            query = f"""
-            select table_schema, table_name, column_name,data_type
-            from information_schema.columns
-            where table_name in ({at})
-            and table_schema in ('{self.cdm_schema}', '{self.vocab_schema}')
-            """
-            # Add filtering for source_value columns if not allowed
-            if not self.allow_source_value_columns:
-                query += " and lower(column_name) not like '%_source_value%'"
-
-            query += ";"  # Add the semicolon to terminate the SQL query
-            df = self.conn.sql(query).execute()  # type: ignore
-            return df.to_csv(index=False)
+            cdm_source = self._to_pyarrow(f"select * from {self.cdm_schema}.cdm_source")
+            parts.append(cdm_source.to_pandas().to_csv(index=False))
+        except Exception:
+            # cdm_source is optional, fall back to the other parts of the fingerprint
+            pass
+
+        if self.backend_name == "duckdb":
+            url = urlparse(self.connection_string)
+            path = url.netloc + url.path
+            if path and os.path.exists(path):
+                parts.append(str(os.stat(path).st_mtime_ns))
+
+        return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+    def cdm_fingerprint(self) -> str:
+        """
+        Get the fingerprint of the CDM the cached results and metadata are built from.
+
+        The fingerprint is checked again once it is older than `fingerprint_ttl`, so
+        that a data refresh invalidates the cached results, the schema catalog, the
+        concept index and the concept hierarchy of a running process. When
+        it changes, results are read from and written to the disk cache subdirectory
+        of the new fingerprint.
+
+        Returns:
+            Hex digest identifying the CDM version
+        """
+        with self._fingerprint_lock:
+            now = time.monotonic()
+            if self._fingerprint is not None and (
+                self.fingerprint_ttl is None
+                or now - self._fingerprint_checked_at < self.fingerprint_ttl
+            ):
+                return self._fingerprint
+
+            fingerprint = self.get_cdm_fingerprint()
+            self._fingerprint_checked_at = now
+            if fingerprint != self._fingerprint:
+                self._fingerprint = fingerprint
+                if self.disk_cache_dir:
+                    self.disk_cache = DiskResultCache(
+                        directory=self.disk_cache_dir,
+                        fingerprint=fingerprint,
+                        max_bytes=self.disk_cache_max_bytes,
+                        ttl=self.disk_cache_ttl,
+                    )
+            return fingerprint
+
+    def _cache_key(self, query: str, *parts: Any) -> str:
+        """
+        Build the result cache key for a query, reusing the validator's parsed AST.
+
+        The key includes the validation policy and the allowed tables, so that servers
+        with different access rules sharing the disk cache never serve each other's
+        results.
+        """
+        try:
+            parsed: str | sg.Expression = self.sql_validator.parse(query).parsed
+        except sg.errors.SqlglotError:
+            parsed = query
+        return make_cache_key(
+            parsed,
+            self.cdm_schema,
+            self.vocab_schema,
+            self.row_limit,
+            self.byte_limit,
+            self.cdm_fingerprint(),
+            self.sql_validator.policy_key(),
+            ",".join(sorted(self.allowed_tables)),
+            *parts,
+        )
+
+    def _get_cached(self, key: str) -> Optional[pa.Table]:
+        """Get a result from the memory cache, falling back to the disk cache."""
+        table = self.result_cache.get(key)
+        if table is None and self.disk_cache is not None:
+            table = self.disk_cache.get(key)
+            if table is not None:
+                self.result_cache.put(key, table)
+        return table
+
+    def _put_cached(self, key: str, table: pa.Table) -> None:
+        """Add a result to the memory cache and the disk cache."""
+        self.result_cache.put(key, table)
+        if self.disk_cache is not None:
+            self.disk_cache.put(key, table)
+
+    def _to_pyarrow(
+        self, query: str, cancel_token: Optional[CancellationToken] = None
+    ) -> pa.Table:
+        """Execute an internal query and return all rows as an Arrow table."""
+        cancel_token = cancel_token or CancellationToken()
+        with self.pool.connection() as conn:
+            with (
+                cancel_token.on_cancel(lambda: interrupt_connection(conn)),
+                self.guard.deadline(conn, self.guard.timeout),
+            ):
+                return conn.sql(query).to_pyarrow()
+
+    def _catalog_version(self, fingerprint: str) -> str:
+        """Get the version of the schema catalog for the CDM and the exposed tables."""
+        parts = [
+            fingerprint,
+            self.cdm_schema,
+            self.vocab_schema,
+            str(self.allow_source_value_columns),
+            *self.allowed_tables,
+        ]
+        return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+    def get_catalog(
+        self, cancel_token: Optional[CancellationToken] = None
+    ) -> SchemaCatalog:
+        """
+        Get the schema catalog of the allowed tables.
+
+        The catalog is loaded once per version of the CDM from the snapshot file, or
+        introspected from the database when the snapshot is missing or belongs to
+        another version of the CDM, and then saved as the new snapshot.
+
+        Args:
+            cancel_token: Token that interrupts the introspection queries when cancelled
+
+        Returns:
+            The schema catalog
+        """
+        fingerprint = self.cdm_fingerprint()
+        with self._catalog_lock:
+            if self._catalog is not None and self._catalog[0] == fingerprint:
+                return self._catalog[1]
+
+            version = self._catalog_version(fingerprint)
+            catalog = None
+            if self.catalog_path:
+                catalog = SchemaCatalog.load(self.catalog_path, version)
+
+            if catalog is None:
+                catalog = SchemaCatalog.introspect(
+                    lambda query: self._to_pyarrow(query, cancel_token),
+                    backend_name=self.backend_name,
+                    schemas=[self.cdm_schema, self.vocab_schema],
+                    tables=self.allowed_tables,
+                    allow_source_value_columns=self.allow_source_value_columns,
+                    version=version,
+                )
+                if self.catalog_path:
+                    catalog.save(self.catalog_path)
+
+            self._catalog = (fingerprint, catalog)
+            return catalog
 
+    def get_information_schema(
+        self, cancel_token: Optional[CancellationToken] = None
+    ) -> str:
+        """Get the information schema of the allowed tables as CSV."""
+        try:
+            return to_csv(self.get_catalog(cancel_token).to_information_schema())
+        except (ex.QueryCancelledError, ex.QueryGuardError):
+            raise
         except Exception as e:
             raise ex.QueryError(f"Failed to get information schema: {str(e)}")
 
-    @lru_cache(maxsize=128)
-    def read_query(self, query: str) -> str:
+    def list_tables(self, cancel_token: Optional[CancellationToken] = None) -> str:
         """
-        Execute a read-only SQL query and return results as CSV
+        List the allowed tables with their estimated row counts as CSV.
 
         Args:
-            query: SQL query string
+            cancel_token: Token that interrupts the introspection queries when cancelled
 
         Returns:
-            CSV string representing query results
+            CSV string with one row per table
+        """
+        try:
+            return to_csv(self.get_catalog(cancel_token).list_tables())
+        except (ex.QueryCancelledError, ex.QueryGuardError):
+            raise
+        except Exception as e:
+            raise ex.QueryError(f"Failed to list tables: {str(e)}")
+
+    def get_table_schema(
+        self, tables: List[str], cancel_token: Optional[CancellationToken] = None
+    ) -> str:
+        """
+        Describe the columns and keys of the given tables.
+
+        Args:
+            tables: Table names, optionally qualified with the schema
+            cancel_token: Token that interrupts the introspection queries when cancelled
+
+        Returns:
+            The description of each table, separated by blank lines
+
+        Raises:
+            TableNotFoundError: If a table is not in the catalog
+        """
+        try:
+            catalog = self.get_catalog(cancel_token)
+        except (ex.QueryCancelledError, ex.QueryGuardError):
+            raise
+        except Exception as e:
+            raise ex.QueryError(f"Failed to get table schema: {str(e)}")
+
+        missing = [name for name in tables if name not in catalog]
+        if missing:
+            raise ex.TableNotFoundError(
+                f"Unknown or unauthorized tables: {', '.join(missing)}. "
+                f"Available tables are: {', '.join(sorted(catalog.tables))}"
+            )
+        return "\n\n".join(catalog.get_table(name).describe() for name in tables)  # type: ignore
+
+    def get_concept_index(
+        self, cancel_token: Optional[CancellationToken] = None
+    ) -> ConceptIndex:
+        """
+        Get the search index over the valid concepts and their synonyms.
+
+        The index is built once per version of the CDM from the vocabulary tables.
+
+        Args:
+            cancel_token: Token that interrupts loading the vocabulary when cancelled
+
+        Returns:
+            The concept index
+        """
+        fingerprint = self.cdm_fingerprint()
+        with self._concept_index_lock:
+            if (
+                self._concept_index is not None
+                and self._concept_index[0] == fingerprint
+            ):
+                return self._concept_index[1]
+
+            if "concept" not in self.allowed_tables:
+                raise ex.UnauthorizedTableError(
+                    "Concept search requires access to the concept table."
+                )
+
+            concepts = self._to_pyarrow(
+                f"select {', '.join(CONCEPT_COLUMNS)} "
+                f"from {self.vocab_schema}.concept where invalid_reason is null",
+                cancel_token,
+            )
+            synonyms = None
+            if "concept_synonym" in self.allowed_tables:
+                synonyms = self._to_pyarrow(
+                    "select concept_id, concept_synonym_name "
+                    f"from {self.vocab_schema}.concept_synonym",
+                    cancel_token,
+                )
+
+            index = ConceptIndex.build(concepts, synonyms)
+            self._concept_index = (fingerprint, index)
+            return index
+
+    def search_concepts(
+        self,
+        text: str,
+        vocabulary_ids: Optional[List[str]] = None,
+        domain_ids: Optional[List[str]] = None,
+        standard_only: bool = False,
+        limit: int = 20,
+        cancel_token: Optional[CancellationToken] = None,
+    ) -> pa.Table:
+        """
+        Search valid concepts by name and synonyms.
+
+        Args:
+            text: Search text
+            vocabulary_ids: Only return concepts of these vocabularies
+            domain_ids: Only return concepts of these domains
+            standard_only: Only return standard concepts
+            limit: Maximum number of concepts to return
+            cancel_token: Token that interrupts loading the vocabulary when cancelled
+
+        Returns:
+            Arrow table of the matching concepts with their score, best match first
+        """
+        try:
+            index = self.get_concept_index(cancel_token)
+        except (ex.QueryCancelledError, ex.QueryGuardError, ex.UnauthorizedTableError):
+            raise
+        except Exception as e:
+            raise ex.QueryError(f"Failed to build concept index: {str(e)}")
+
+        return index.search(
+            text,
+            vocabulary_ids=vocabulary_ids,
+            domain_ids=domain_ids,
+            standard_only=standard_only,
+            limit=min(limit, self.row_limit),
+        )
+
+    def get_concept_hierarchy(
+        self, cancel_token: Optional[CancellationToken] = None
+    ) -> ConceptHierarchy:
         """
+        Get the concept hierarchy built from the concept_ancestor table.
 
+        The hierarchy is memory-mapped from the hierarchy directory, or built from the
+        database when the directory is missing or belongs to another version of the
+        CDM, and then saved to the directory.
+
+        Args:
+            cancel_token: Token that interrupts loading concept_ancestor when cancelled
+
+        Returns:
+            The concept hierarchy
+        """
+        fingerprint = self.cdm_fingerprint()
+        with self._hierarchy_lock:
+            if self._hierarchy is not None and self._hierarchy[0] == fingerprint:
+                return self._hierarchy[1]
+
+            if "concept_ancestor" not in self.allowed_tables:
+                raise ex.UnauthorizedTableError(
+                    "Concept hierarchy expansion requires access to the "
+                    "concept_ancestor table."
+                )
+
+            version = hashlib.sha256(
+                f"{fingerprint}\x1f{self.vocab_schema}".encode("utf-8")
+            ).hexdigest()
+            hierarchy = None
+            if self.hierarchy_dir:
+                hierarchy = ConceptHierarchy.load(self.hierarchy_dir, version)
+
+            if hierarchy is None:
+                table = self._to_pyarrow(
+                    "select ancestor_concept_id, descendant_concept_id, "
+                    "min_levels_of_separation "
+                    f"from {self.vocab_schema}.concept_ancestor",
+                    cancel_token,
+                )
+                hierarchy = ConceptHierarchy.build(
+                    table["ancestor_concept_id"].to_numpy(),
+                    table["descendant_concept_id"].to_numpy(),
+                    table["min_levels_of_separation"].to_numpy(),
+                    version=version,
+                )
+                if self.hierarchy_dir:
+                    hierarchy.save(self.hierarchy_dir)
+                    # Serve from the memory-mapped files rather than the build arrays
+                    hierarchy = (
+                        ConceptHierarchy.load(self.hierarchy_dir, version) or hierarchy
+                    )
+
+            self._hierarchy = (fingerprint, hierarchy)
+            return hierarchy
+
+    def get_related_concepts(
+        self,
+        concept_ids: List[int],
+        direction: Literal["descendants", "ancestors"] = "descendants",
+        include_self: bool = True,
+        max_levels: Optional[int] = None,
+        cancel_token: Optional[CancellationToken] = None,
+    ) -> np.ndarray:
+        """
+        Get the descendants or ancestors of concepts from the concept hierarchy.
+
+        Args:
+            concept_ids: Concepts to expand
+            direction: "descendants" or "ancestors"
+            include_self: Include the given concepts in the result
+            max_levels: Maximum levels of separation from the given concepts
+            cancel_token: Token that interrupts loading concept_ancestor when cancelled
+
+        Returns:
+            Sorted array of the related concept ids
+        """
         try:
-            # Validate the SQL query
-            errors = self.sql_validator.validate_sql(query)
-
-            # DoNotDelete: Adding message and exceptions keywords to the exception group
-            # results in `TypeError: BaseExceptionGroup.__new__() takes exactly 2 arguments (0 given)`
-            if errors:
-                raise ExceptionGroup(
-                    "Query validation failed",
-                    errors,
+            hierarchy = self.get_concept_hierarchy(cancel_token)
+        except (ex.QueryCancelledError, ex.QueryGuardError, ex.UnauthorizedTableError):
+            raise
+        except Exception as e:
+            raise ex.QueryError(f"Failed to build concept hierarchy: {str(e)}")
+
+        if direction == "ancestors":
+            return hierarchy.get_ancestors(concept_ids, include_self, max_levels)
+        return hierarchy.get_descendants(concept_ids, include_self, max_levels)
+
+    def _concept_set_tables(
+        self,
+        concept_sets: Dict[str, List[int]],
+        cancel_token: Optional[CancellationToken] = None,
+    ) -> Dict[str, pa.Table]:
+        """Expand concept sets to their descendants as single column Arrow tables."""
+        omop_tables = {name.lower() for name in OMOP_TABLES}
+        tables = {}
+        for name, concept_ids in concept_sets.items():
+            if not CONCEPT_SET_NAME.match(name) or name.lower() in omop_tables:
+                raise ex.QueryError(
+                    f"Invalid concept set name: {name}. Use a plain identifier that "
+                    "is not the name of an OMOP table."
                 )
+            tables[name] = ConceptHierarchy.to_arrow(
+                self.get_related_concepts(concept_ids, cancel_token=cancel_token)
+            )
+        return tables
+
+    def warm_up(self, full: bool = False) -> None:
+        """
+        Load the schema catalog ahead of use.
+
+        Args:
+            full: Also load the concept index and concept hierarchy, which read the
+                whole vocabulary
+        """
+        loads = [self.get_catalog]
+        if full:
+            loads += [self.get_concept_index, self.get_concept_hierarchy]
+        for load in loads:
+            try:
+                load()
+            except Exception:
+                # Errors are raised again when a tool needs the failed component
+                pass
+
+    def _query_cache_key(self, query: str, concept_sets: Dict[str, List[int]]) -> str:
+        return self._cache_key(
+            query,
+            *(f"{name}={sorted(ids)}" for name, ids in sorted(concept_sets.items())),
+        )
+
+    def _validate(self, query: str, concept_sets: Dict[str, List[int]]) -> None:
+        """Validate a query, raising all validation errors as an exception group."""
+        errors = self.sql_validator.validate_sql(query, temp_tables=concept_sets)
+
+        # DoNotDelete: Adding message and exceptions keywords to the exception group
+        # results in `TypeError: BaseExceptionGroup.__new__() takes exactly 2 arguments (0 given)`
+        if errors:
+            raise ExceptionGroup(
+                "Query validation failed",
+                errors,
+            )
+
+    def _compile(self, query: str, concept_sets: Dict[str, List[int]]) -> CompiledQuery:
+        """Compile a validated query, raising dialect errors as validation errors."""
+        schema, version = None, ""
+        if self.sql_validator.optimize or self.sql_validator.star_mode == "expand":
+            schema, version = self._get_catalog_schema()
+        try:
+            return self.sql_validator.compile(
+                query, temp_tables=concept_sets, schema=schema, schema_version=version
+            )
+        except (ex.DialectError, ex.StarNotAllowedError) as e:
+            raise ExceptionGroup("Query validation failed", [e])
+
+    def _get_catalog_schema(self) -> tuple[Optional[Dict[str, Any]], str]:
+        """Get the column types of the catalog by schema and table for compiling queries."""
+        try:
+            catalog = self.get_catalog()
+        except Exception:
+            # Queries are compiled without the catalog until it loads
+            return None, ""
+        cached = self._catalog_schema
+        if cached is None or cached[0] != catalog.version:
+            schema: Dict[str, Any] = {}
+            for table in catalog.tables.values():
+                schema.setdefault(table.schema, {})[table.name] = {
+                    column.name: column.data_type for column in table.columns
+                }
+            cached = self._catalog_schema = (catalog.version, schema)
+        return cached[1], cached[0]
+
+    def _execute(
+        self,
+        conn: Any,
+        query: str,
+        cancel_token: CancellationToken,
+        row_limit: Optional[int] = None,
+        byte_limit: Optional[int] = None,
+    ) -> pa.Table:
+        """Run a validated query on a connection, streaming at most the row budget."""
+        row_limit = row_limit or self.row_limit
+        byte_limit = byte_limit or self.byte_limit
+        # Fetch one extra row to detect truncation
+        expr = conn.sql(query).limit(row_limit + 1)
+        # Check the estimated cost of the plan before running the query
+        timeout = self.guard.check(conn, conn.compile(expr))
+        with (
+            cancel_token.on_cancel(lambda: interrupt_connection(conn)),
+            self.guard.deadline(conn, timeout),
+        ):
+            reader = conn.to_pyarrow_batches(expr, chunk_size=self.batch_size)
+            return collect_batches(reader, row_limit, byte_limit)
+
+    def _subexpression_store(
+        self, session: Optional[str]
+    ) -> Optional[SubexpressionStore]:
+        """Get the subexpression store of a session, creating it on first use."""
+        if not self.subexpression_reuse or session is None:
+            return None
+        with self._subexpression_lock:
+            store = self._subexpression_stores.get(session)
+            if store is None:
+                store = SubexpressionStore(
+                    min_uses=self.subexpression_min_uses,
+                    max_bytes=self.subexpression_max_bytes,
+                    ttl=self.subexpression_ttl,
+                )
+                self._subexpression_stores.put(session, store)
+            return store
+
+    def _execute_reusing(
+        self,
+        conn: Any,
+        query: CompiledQuery,
+        temp_tables: Dict[str, pa.Table],
+        session: Optional[str],
+        cancel_token: CancellationToken,
+    ) -> pa.Table:
+        """
+        Run a validated query, reusing the subexpressions it repeats from earlier
+        queries of the session. The temporary tables must be registered on the
+        connection.
+        """
+        store = self._subexpression_store(session)
+        if store is None:
+            return self._execute(conn, query.sql, cancel_token)
+        dialect = self.sql_validator.to_dialect
+
+        def materialize(body: sg.exp.Query) -> Optional[pa.Table]:
+            try:
+                table = self._execute(
+                    conn,
+                    body.sql(dialect=dialect),
+                    cancel_token,
+                    row_limit=self.subexpression_max_rows,
+                    byte_limit=self.subexpression_max_bytes,
+                )
+            except ex.QueryCancelledError:
+                raise
+            except Exception:
+                # The query itself reports the error if the subexpression fails
+                return None
+            if is_truncated(table) or len(set(table.column_names)) < table.num_columns:
+                return None
+            return table
+
+        rewritten, reused = store.rewrite(query.expression, materialize, temp_tables)
+        if not reused:
+            return self._execute(conn, query.sql, cancel_token)
+        with temporary_tables(conn, reused):
+            return self._execute(conn, rewritten.sql(dialect=dialect), cancel_token)
 
-            # Execute the validated query
-            result = self.conn.sql(query).limit(  # type: ignore
-                self.row_limit
-            )  # Limit to 1000 rows for performance
-            df = result.execute()
-            # Convert dataframe to csv
-            return df.to_csv(index=False)
+    @staticmethod
+    def _query_error(e: Exception) -> Exception:
+        """Wrap unexpected errors of a query in a QueryError."""
+        if isinstance(
+            e,
+            (
+                ExceptionGroup,
+                ex.QueryCancelledError,
+                ex.QueryGuardError,
+                ex.UnauthorizedTableError,
+                ex.QueryError,
+            ),
+        ):
+            return e
+        return ex.QueryError(f"Failed to execute query: {str(e)}")
 
-        except ExceptionGroup:
+    def fetch_arrow(
+        self,
+        query: str,
+        cancel_token: Optional[CancellationToken] = None,
+        concept_sets: Optional[Dict[str, List[int]]] = None,
+        session: Optional[str] = None,
+    ) -> pa.Table:
+        """
+        Execute a read-only SQL query and return results as an Arrow table
+
+        Rows are streamed from the backend in record batches and reading stops as soon
+        as the row or byte budget is reached. Truncated results are flagged in the
+        schema metadata (see `results.is_truncated`).
+
+        Results are cached by the canonical form of the query, so repeated queries
+        that only differ in whitespace or case are served from memory or, when
+        enabled, from the persistent cache shared with other server processes.
+
+        Valid queries are transpiled from the SQL dialect of the agent to the dialect
+        of the database, with OMOP tables qualified by the CDM or vocabulary schema
+        (see `SQLValidator.compile`).
+
+        Concept sets are expanded to all their descendants with the concept hierarchy
+        and made available to the query as temporary tables with a single concept_id
+        column, for example `where condition_concept_id in (select concept_id from t2dm)`.
+
+        CTEs and subqueries that the queries of a session repeat are materialised
+        once and read from the materialised results by later queries of the session
+        (see `subexpressions`).
+
+        Args:
+            query: SQL query string
+            cancel_token: Token that interrupts the query when cancelled
+            concept_sets: Concept ids by temporary table name
+            session: Identifier of the client session, used to reuse subexpressions
+
+        Returns:
+            Arrow table with the query results
+        """
+        cancel_token = cancel_token or CancellationToken()
+
+        try:
+            concept_sets = concept_sets or {}
+            # Cached results may come from other processes, so hits are validated too.
+            # Validation outcomes are cached, which keeps this cheap
+            self._validate(query, concept_sets)
+            key = self._query_cache_key(query, concept_sets)
+            table = self._get_cached(key)
+            if table is not None:
+                return table
+
+            compiled = self._compile(query, concept_sets)
+            temp_tables = self._concept_set_tables(concept_sets, cancel_token)
+
+            with (
+                self.pool.connection() as conn,
+                temporary_tables(conn, temp_tables),
+            ):
+                table = self._execute_reusing(
+                    conn, compiled, temp_tables, session, cancel_token
+                )
+            self._put_cached(key, table)
+            return table
+
+        except (
+            ExceptionGroup,
+            ex.QueryCancelledError,
+            ex.QueryGuardError,
+            ex.UnauthorizedTableError,
+            ex.QueryError,
+        ):
             raise
         except Exception as e:
             raise ex.QueryError(f"Failed to execute query: {str(e)}")
+
+    def fetch_arrow_batch(
+        self,
+        queries: List[str],
+        cancel_token: Optional[CancellationToken] = None,
+        concept_sets: Optional[Dict[str, List[int]]] = None,
+        max_concurrency: int = 1,
+        session: Optional[str] = None,
+    ) -> List[pa.Table | Exception]:
+        """
+        Execute several read-only SQL queries and return a result or error per query
+
+        All queries are validated before any of them runs, and the concept sets are
+        expanded once for the whole batch. The valid queries then run on pooled
+        connections that register the concept set tables once and execute the queries
+        one after the other. With a concurrency above one, the queries are spread over
+        up to that many connections, limited by the size of the pool. Duplicate and
+        cached queries are only executed once.
+
+        A failing query does not stop the batch: its error is returned in its place,
+        except for a cancellation, which stops all remaining queries.
+
+        Args:
+            queries: SQL query strings
+            cancel_token: Token that interrupts the queries when cancelled
+            concept_sets: Concept ids by temporary table name, shared by all queries
+            max_concurrency: Maximum number of queries running at the same time
+            session: Identifier of the client session, used to reuse subexpressions
+
+        Returns:
+            Arrow table with the results, or the exception raised, of each query in
+            the order of the queries
+        """
+        cancel_token = cancel_token or CancellationToken()
+        concept_sets = concept_sets or {}
+        results: List[Optional[pa.Table | Exception]] = [None] * len(queries)
+
+        # Validate all queries together, grouping duplicates by their cache key
+        pending: Dict[str, List[int]] = {}
+        compiled: Dict[str, CompiledQuery] = {}
+        for i, query in enumerate(queries):
+            try:
+                self._validate(query, concept_sets)
+                key = self._query_cache_key(query, concept_sets)
+                table = self._get_cached(key)
+                if table is not None:
+                    results[i] = table
+                elif key in pending:
+                    pending[key].append(i)
+                else:
+                    compiled[key] = self._compile(query, concept_sets)
+                    pending[key] = [i]
+            except Exception as e:
+                results[i] = self._query_error(e)
+
+        if pending:
+            try:
+                temp_tables = self._concept_set_tables(concept_sets, cancel_token)
+            except Exception as e:
+                error = self._query_error(e)
+                for indices in pending.values():
+                    for i in indices:
+                        results[i] = error
+                pending = {}
+
+        work: "queue.SimpleQueue[str]" = queue.SimpleQueue()
+        for key in pending:
+            work.put(key)
+
+        def run_queries() -> None:
+            with (
+                self.pool.connection() as conn,
+                temporary_tables(conn, temp_tables),
+            ):
+                while True:
+                    try:
+                        key = work.get_nowait()
+                    except queue.Empty:
+                        return
+                    indices = pending[key]
+                    try:
+                        table = self._execute_reusing(
+                            conn,
+                            compiled[key],
+                            temp_tables,
+                            session,
+                            cancel_token,
+                        )
+                        self._put_cached(key, table)
+                        result: pa.Table | Exception = table
+                    except ex.QueryCancelledError:
+                        raise
+                    except Exception as e:
+                        result = self._query_error(e)
+                    for i in indices:
+                        results[i] = result
+
+        workers = min(max_concurrency, self.pool.max_size, len(pending))
+        try:
+            if workers == 1:
+                run_queries()
+            elif workers > 1:
+                with ThreadPoolExecutor(
+                    max_workers=workers, thread_name_prefix="omop-batch"
+                ) as executor:
+                    futures = [executor.submit(run_queries) for _ in range(workers)]
+                for future in futures:
+                    future.result()
+        except ex.QueryCancelledError:
+            raise
+        except Exception as e:
+            # A connection could not be opened, fail the queries that did not run
+            error = self._query_error(e)
+            results = [error if result is None else result for result in results]
+
+        return cast(List[pa.Table | Exception], results)
+
+    def read_query(
+        self, query: str, cancel_token: Optional[CancellationToken] = None
+    ) -> str:
+        """
+        Execute a read-only SQL query and return results as CSV
+
+        Args:
+            query: SQL query string
+            cancel_token: Token that interrupts the query when cancelled
+
+        Returns:
+            CSV string representing query results
+        """
+        return to_csv(self.fetch_arrow(query, cancel_token))
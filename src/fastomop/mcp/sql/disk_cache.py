@@ -0,0 +1,222 @@
+"""Disk Cache Module
+This module provides a persistent query result cache that is shared between MCP
+server processes. Results are stored as Arrow IPC files in a content-addressed
+directory and indexed in a SQLite database, which handles concurrent access from
+several processes. Each fingerprint of the CDM has its own subdirectory, so that a
+data refresh invalidates every result computed against the previous version while
+processes still serving another CDM, or another database sharing the directory, keep
+their entries. Subdirectories of versions no process serves anymore can be deleted.
+"""
+
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import typing as t
+from pathlib import Path
+
+import pyarrow as pa
+import pyarrow.ipc as ipc
+
+INDEX_FILE_NAME = "index.sqlite"
+OBJECTS_DIR_NAME = "objects"
+
+
+class DiskResultCache:
+    """
+    A process-safe on-disk cache of query results stored as Arrow IPC files.
+
+    Files are written to a temporary path and atomically renamed into place, so
+    readers never observe a partially written result. The SQLite index of the
+    fingerprint's subdirectory records the size and access time of each entry and is
+    used for expiry and for evicting the least recently used entries when over the
+    size budget.
+    """
+
+    def __init__(
+        self,
+        directory: str | Path,
+        fingerprint: str,
+        max_bytes: t.Optional[int] = 1024 * 1024 * 1024,
+        ttl: t.Optional[float] = None,
+    ):
+        """
+        Initialize the DiskResultCache.
+
+        Args:
+            directory (str | Path): Directory holding a subdirectory with the index and
+                the result files of each fingerprint.
+            fingerprint (str): Fingerprint of the CDM the results are computed from.
+            max_bytes (int): Maximum total size of the cached files of the fingerprint.
+                None means unbounded.
+            ttl (float): Time to live of each entry in seconds. None means no expiry.
+        """
+        self.directory = Path(directory) / fingerprint[:16]
+        self.objects_directory = self.directory / OBJECTS_DIR_NAME
+        self.fingerprint = fingerprint
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+
+        self.objects_directory.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+
+        self._connect().execute(
+            """
+            create table if not exists entries (
+                key text not null,
+                fingerprint text not null,
+                path text not null,
+                nbytes integer not null,
+                num_rows integer not null,
+                created_at real not null,
+                last_access real not null,
+                primary key (key, fingerprint)
+            )
+            """
+        )
+
+        self.purge()
+
+    def _connect(self) -> sqlite3.Connection:
+        """Return the SQLite connection of the current thread."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(
+                self.directory / INDEX_FILE_NAME, timeout=30, isolation_level=None
+            )
+            conn.execute("pragma journal_mode=wal")
+            conn.execute("pragma synchronous=normal")
+            self._local.conn = conn
+        return conn
+
+    def _object_path(self, key: str) -> Path:
+        return self.objects_directory / key[:2] / f"{key}.arrow"
+
+    def get(self, key: str) -> pa.Table | None:
+        """
+        Get a result from the cache.
+
+        Args:
+            key (str): The cache key.
+
+        Returns:
+            pa.Table: The cached result, or None if missing, expired or unreadable.
+        """
+        conn = self._connect()
+        row = conn.execute(
+            "select path, created_at from entries where key = ? and fingerprint = ?",
+            (key, self.fingerprint),
+        ).fetchone()
+        if row is None:
+            return None
+
+        path, created_at = row
+        if self.ttl is not None and created_at + self.ttl <= time.time():
+            self._delete(key)
+            return None
+
+        try:
+            with pa.memory_map(path, "r") as source:
+                table = ipc.open_file(source).read_all()
+        except (OSError, pa.ArrowInvalid):
+            self._delete(key)
+            return None
+
+        conn.execute(
+            "update entries set last_access = ? where key = ? and fingerprint = ?",
+            (time.time(), key, self.fingerprint),
+        )
+        return table
+
+    def put(self, key: str, table: pa.Table) -> bool:
+        """
+        Add a result to the cache.
+
+        Args:
+            key (str): The cache key.
+            table (pa.Table): The result to cache.
+
+        Returns:
+            bool: True if the result was cached.
+        """
+        path = self._object_path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as sink:
+                with ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table)
+            nbytes = os.path.getsize(tmp_path)
+            if self.max_bytes is not None and nbytes > self.max_bytes:
+                os.unlink(tmp_path)
+                return False
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+        now = time.time()
+        self._connect().execute(
+            "insert or replace into entries values (?, ?, ?, ?, ?, ?, ?)",
+            (key, self.fingerprint, str(path), nbytes, table.num_rows, now, now),
+        )
+        self._evict()
+        return True
+
+    def purge(self) -> None:
+        """Remove expired entries."""
+        if self.ttl is None:
+            return
+
+        conn = self._connect()
+        rows = conn.execute(
+            "select key, fingerprint, path from entries where created_at <= ?",
+            (time.time() - self.ttl,),
+        ).fetchall()
+        for key, fingerprint, path in rows:
+            self._delete(key, fingerprint, path)
+
+    def _evict(self) -> None:
+        """Remove least recently used entries until within the size budget."""
+        if self.max_bytes is None:
+            return
+
+        conn = self._connect()
+        (total,) = conn.execute(
+            "select coalesce(sum(nbytes), 0) from entries"
+        ).fetchone()
+        if total <= self.max_bytes:
+            return
+
+        rows = conn.execute(
+            "select key, fingerprint, path, nbytes from entries order by last_access"
+        ).fetchall()
+        for key, fingerprint, path, nbytes in rows:
+            if total <= self.max_bytes:
+                break
+            self._delete(key, fingerprint, path)
+            total -= nbytes
+
+    def _delete(
+        self, key: str, fingerprint: str | None = None, path: str | None = None
+    ) -> None:
+        fingerprint = fingerprint or self.fingerprint
+        conn = self._connect()
+        if path is None:
+            row = conn.execute(
+                "select path from entries where key = ? and fingerprint = ?",
+                (key, fingerprint),
+            ).fetchone()
+            path = row[0] if row else None
+
+        conn.execute(
+            "delete from entries where key = ? and fingerprint = ?", (key, fingerprint)
+        )
+        if path is not None:
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
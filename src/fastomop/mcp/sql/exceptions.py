@@ -19,6 +19,12 @@ class ColumnNotFoundError(QueryError):
     pass
 
 
+class DialectError(QueryError):
+    """Exception raised when a query cannot be transpiled to the dialect of the database"""
+
+    pass
+
+
 class EmptyQueryError(QueryError):
     """Exception raised when the query is empty"""
 
@@ -59,3 +65,35 @@ class UnauthorizedColumnError(QueryError):
     """Exception raised when query attempts to access unauthorized columns"""
 
     pass
+
+
+class QueryCancelledError(QueryError):
+    """Exception raised when a query is cancelled before or during execution"""
+
+    pass
+
+
+class ServerBusyError(QueryError):
+    """Exception raised when all database workers are busy and the queue is full"""
+
+    pass
+
+
+class QueryGuardError(QueryError):
+    """Base exception raised when the execution guard stops a query"""
+
+    def __init__(self, message: str, **details):
+        super().__init__(message)
+        self.details = details
+
+
+class QueryCostExceededError(QueryGuardError):
+    """Exception raised when the estimated cost of a query exceeds the configured limit"""
+
+    pass
+
+
+class QueryTimeoutError(QueryGuardError):
+    """Exception raised when a query runs longer than the configured timeout"""
+
+    pass
@@ -0,0 +1,165 @@
+"""Database Executor Module
+This module runs blocking database work on a bounded pool of worker threads so that
+async MCP tool handlers do not block the event loop. DuckDB and psycopg release the
+GIL while a query runs, so worker threads execute queries concurrently.
+
+Each submitted call receives a `CancellationToken`. When the awaiting task is
+cancelled, for example because the MCP client cancelled the request, the token is
+cancelled and interrupts the query running on the backend.
+"""
+
+import asyncio
+import contextlib
+import threading
+import typing as t
+from concurrent.futures import ThreadPoolExecutor
+
+from . import exceptions as ex
+
+T = t.TypeVar("T")
+
+
+class CancellationToken:
+    """A thread-safe flag that runs registered callbacks when cancelled."""
+
+    def __init__(self):
+        self._cancelled = False
+        self._callbacks: t.List[t.Callable[[], None]] = []
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled
+
+    def cancel(self) -> None:
+        """Cancel the token and run the registered callbacks."""
+        with self._lock:
+            if self._cancelled:
+                return
+            self._cancelled = True
+            callbacks = list(self._callbacks)
+
+        for callback in callbacks:
+            callback()
+
+    def raise_if_cancelled(self) -> None:
+        """
+        Raise if the token has been cancelled.
+
+        Raises:
+            QueryCancelledError: If the token has been cancelled.
+        """
+        if self._cancelled:
+            raise ex.QueryCancelledError("Query was cancelled by the client.")
+
+    @contextlib.contextmanager
+    def on_cancel(self, callback: t.Callable[[], None]) -> t.Iterator[None]:
+        """
+        Register a callback to run if the token is cancelled within the block.
+
+        Args:
+            callback (Callable): Function to call on cancellation, such as a function
+                interrupting the running query.
+
+        Raises:
+            QueryCancelledError: If the token was cancelled before the block, or the
+                block failed after the token was cancelled, e.g. because the callback
+                interrupted the query.
+        """
+        with self._lock:
+            already_cancelled = self._cancelled
+            if not already_cancelled:
+                self._callbacks.append(callback)
+
+        if already_cancelled:
+            raise ex.QueryCancelledError("Query was cancelled by the client.")
+
+        try:
+            yield
+        except ex.QueryCancelledError:
+            raise
+        except Exception as e:
+            if self._cancelled:
+                raise ex.QueryCancelledError(
+                    "Query was cancelled by the client."
+                ) from e
+            raise
+        finally:
+            with self._lock:
+                self._callbacks.remove(callback)
+
+
+class DatabaseExecutor:
+    """
+    A bounded pool of database worker threads.
+
+    At most ``max_workers`` calls run at a time and at most ``max_queue`` calls wait
+    for a free worker. Further calls are rejected with a `ServerBusyError` so that
+    clients can back off instead of piling up behind slow queries.
+    """
+
+    def __init__(self, max_workers: int = 4, max_queue: int = 16):
+        """
+        Initialize the DatabaseExecutor.
+
+        Args:
+            max_workers (int): Number of worker threads.
+            max_queue (int): Number of calls allowed to wait for a free worker.
+        """
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._pool = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="omop-db"
+        )
+        # Calls are counted until their worker finishes, even once the caller gave up
+        self._pending = 0
+        self._pending_lock = threading.Lock()
+
+    @property
+    def pending(self) -> int:
+        """Number of running and queued calls."""
+        return self._pending
+
+    async def run(self, fn: t.Callable[[CancellationToken], T]) -> T:
+        """
+        Run a blocking function on a worker thread.
+
+        Args:
+            fn (Callable): Function taking a `CancellationToken`. It should check the
+                token or register an interrupt callback with it.
+
+        Returns:
+            The return value of the function.
+
+        Raises:
+            ServerBusyError: If all workers are busy and the queue is full.
+        """
+        with self._pending_lock:
+            if self._pending >= self.max_workers + self.max_queue:
+                raise ex.ServerBusyError(
+                    f"The database is busy with {self._pending} queries. "
+                    "Wait for running queries to finish and try again."
+                )
+            self._pending += 1
+
+        token = CancellationToken()
+        try:
+            future = self._pool.submit(fn, token)
+        except BaseException:
+            self._done()
+            raise
+        future.add_done_callback(lambda _: self._done())
+        try:
+            return await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            future.cancel()
+            token.cancel()
+            raise
+
+    def _done(self) -> None:
+        with self._pending_lock:
+            self._pending -= 1
+
+    def shutdown(self) -> None:
+        """Stop the worker threads, cancelling calls that have not started."""
+        self._pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,246 @@
+"""Query Guard Module
+This module protects the database from runaway queries written by the LLM.
+
+Before a query runs, its plan is estimated with EXPLAIN. Queries whose estimated cost
+or join row count exceed the configured limits are rejected or, in downgrade mode, run
+with a shorter timeout. Only joins producing more rows than their largest input count
+towards the row limit, so scanning or counting a large table is never rejected while
+cross joins and exploding many-to-many joins are. While a query runs, a wall-clock
+timer interrupts it on the backend once the timeout expires.
+"""
+
+import contextlib
+import json
+import threading
+import typing as t
+from dataclasses import dataclass
+
+from ibis.backends import BaseBackend
+
+from . import exceptions as ex
+from .pool import interrupt_connection
+
+GuardMode = t.Literal["reject", "downgrade"]
+
+
+# Plan nodes joining their inputs
+DUCKDB_JOINS = ("CROSS_PRODUCT", "NESTED_LOOP_JOIN", "BLOCKWISE_NL_JOIN")
+POSTGRES_JOINS = ("Nested Loop", "Hash Join", "Merge Join")
+
+
+@dataclass
+class PlanEstimate:
+    """Estimated cost and the largest row count added by a join of a query plan."""
+
+    cost: float
+    rows: float
+    cross_products: int = 0
+
+
+def _estimate_duckdb_node(node: t.Dict[str, t.Any], estimate: PlanEstimate) -> float:
+    """Estimate the output rows of a DuckDB plan node, accumulating the plan cost."""
+    children = [_estimate_duckdb_node(c, estimate) for c in node.get("children", [])]
+    name = node.get("name", "").strip()
+
+    cardinality = (node.get("extra_info") or {}).get("Estimated Cardinality")
+    if cardinality is not None:
+        rows = float(cardinality)
+    elif name in DUCKDB_JOINS:
+        rows = 1.0
+        for child_rows in children:
+            rows *= child_rows
+    else:
+        rows = max(children, default=0.0)
+
+    if name == "CROSS_PRODUCT":
+        estimate.cross_products += 1
+
+    # The cost of a node is approximated by the number of rows it produces
+    estimate.cost += rows
+    if (name in DUCKDB_JOINS or name.endswith("_JOIN")) and rows > max(
+        children, default=0.0
+    ):
+        estimate.rows = max(estimate.rows, rows)
+    return rows
+
+
+def _estimate_postgres_node(node: t.Dict[str, t.Any], estimate: PlanEstimate) -> None:
+    """Accumulate the maximum join row estimate and cross joins of a Postgres plan."""
+    children = node.get("Plans", [])
+    rows = float(node.get("Plan Rows", 0))
+    if node.get("Node Type") in POSTGRES_JOINS and rows > max(
+        (float(child.get("Plan Rows", 0)) for child in children), default=0.0
+    ):
+        estimate.rows = max(estimate.rows, rows)
+    if node.get("Node Type") == "Nested Loop" and "Join Filter" not in node:
+        estimate.cross_products += 1
+    for child in children:
+        _estimate_postgres_node(child, estimate)
+
+
+def explain(conn: BaseBackend, sql: str) -> PlanEstimate:
+    """
+    Estimate the cost of a query from its plan.
+
+    For DuckDB the cost is the sum of the estimated cardinalities of all plan nodes,
+    for Postgres it is the planner's total cost. In both cases rows is the largest
+    estimated row count of a join producing more rows than its largest input, or 0.
+
+    Args:
+        conn (BaseBackend): The connection to explain the query on.
+        sql (str): The SQL query in the backend's dialect.
+
+    Returns:
+        PlanEstimate: The estimated cost and row count.
+    """
+    estimate = PlanEstimate(cost=0.0, rows=0.0)
+
+    if conn.name == "duckdb":
+        rows = conn.raw_sql(f"EXPLAIN (FORMAT JSON) {sql}").fetchall()  # type: ignore
+        for _, plan in rows:
+            for node in json.loads(plan):
+                _estimate_duckdb_node(node, estimate)
+    elif conn.name == "postgres":
+        cursor = conn.raw_sql(f"EXPLAIN (FORMAT JSON) {sql}")  # type: ignore
+        try:
+            (plan,) = cursor.fetchone()
+        finally:
+            cursor.close()
+        plan = json.loads(plan) if isinstance(plan, str) else plan
+        root = plan[0]["Plan"]
+        estimate.cost = float(root.get("Total Cost", 0))
+        _estimate_postgres_node(root, estimate)
+
+    return estimate
+
+
+class QueryGuard:
+    """
+    Execution guard enforcing cost limits and a wall-clock timeout on queries.
+    """
+
+    def __init__(
+        self,
+        max_estimated_cost: t.Optional[float] = None,
+        max_estimated_rows: t.Optional[float] = 100_000_000,
+        timeout: t.Optional[float] = 120.0,
+        mode: GuardMode = "reject",
+        downgraded_timeout: float = 10.0,
+    ):
+        """
+        Initialize the QueryGuard.
+
+        Args:
+            max_estimated_cost (float): Maximum estimated plan cost. None disables the check.
+            max_estimated_rows (float): Maximum estimated rows of a join producing more
+                rows than its largest input. None disables the check.
+            timeout (float): Seconds after which a running query is interrupted. None
+                disables the timeout.
+            mode (str): "reject" to refuse queries above the limits or "downgrade" to
+                run them with ``downgraded_timeout``.
+            downgraded_timeout (float): Timeout in seconds of downgraded queries.
+        """
+        self.max_estimated_cost = max_estimated_cost
+        self.max_estimated_rows = max_estimated_rows
+        self.timeout = timeout
+        self.mode = mode
+        self.downgraded_timeout = downgraded_timeout
+
+    @property
+    def checks_cost(self) -> bool:
+        return (
+            self.max_estimated_cost is not None or self.max_estimated_rows is not None
+        )
+
+    def check(self, conn: BaseBackend, sql: str) -> t.Optional[float]:
+        """
+        Check the estimated cost of a query and return the timeout to run it with.
+
+        Args:
+            conn (BaseBackend): The connection the query will run on.
+            sql (str): The SQL query in the backend's dialect.
+
+        Returns:
+            float: Timeout in seconds, or None for no timeout.
+
+        Raises:
+            QueryCostExceededError: If the query exceeds the limits in reject mode.
+        """
+        if not self.checks_cost:
+            return self.timeout
+
+        estimate = explain(conn, sql)
+        exceeded = []
+        if (
+            self.max_estimated_cost is not None
+            and estimate.cost > self.max_estimated_cost
+        ):
+            exceeded.append(
+                f"estimated cost {estimate.cost:.3g} exceeds {self.max_estimated_cost:.3g}"
+            )
+        if (
+            self.max_estimated_rows is not None
+            and estimate.rows > self.max_estimated_rows
+        ):
+            exceeded.append(
+                f"estimated rows {estimate.rows:.3g} exceed {self.max_estimated_rows:.3g}"
+            )
+
+        if not exceeded:
+            return self.timeout
+
+        if self.mode == "downgrade":
+            return min(self.timeout or self.downgraded_timeout, self.downgraded_timeout)
+
+        hint = (
+            "Add selective filters, aggregate before joining or narrow the date range."
+        )
+        if estimate.cross_products:
+            hint = "The plan contains a cross join. Add join conditions. " + hint
+        raise ex.QueryCostExceededError(
+            f"Query rejected because its {' and '.join(exceeded)}. {hint}",
+            estimated_cost=estimate.cost,
+            estimated_rows=estimate.rows,
+            cross_products=estimate.cross_products,
+            hint=hint,
+        )
+
+    @contextlib.contextmanager
+    def deadline(
+        self, conn: BaseBackend, timeout: t.Optional[float]
+    ) -> t.Iterator[None]:
+        """
+        Interrupt the query running on the connection if the block exceeds the timeout.
+
+        Args:
+            conn (BaseBackend): The connection running the query.
+            timeout (float): Timeout in seconds. None disables the timeout.
+
+        Raises:
+            QueryTimeoutError: If the query was interrupted by the timeout.
+        """
+        if timeout is None:
+            yield
+            return
+
+        timed_out = threading.Event()
+
+        def interrupt():
+            timed_out.set()
+            interrupt_connection(conn)
+
+        timer = threading.Timer(timeout, interrupt)
+        timer.daemon = True
+        timer.start()
+        try:
+            yield
+        except Exception as e:
+            if timed_out.is_set():
+                raise ex.QueryTimeoutError(
+                    f"Query interrupted after exceeding the {timeout} second timeout. "
+                    "Simplify the query, add selective filters or aggregate the results.",
+                    timeout=timeout,
+                ) from e
+            raise
+        finally:
+            timer.cancel()
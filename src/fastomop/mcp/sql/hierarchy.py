@@ -0,0 +1,273 @@
+"""Concept Hierarchy Module
+This module provides a precomputed index of the OMOP concept hierarchy.
+
+The `concept_ancestor` table, which already holds the transitive closure of the
+hierarchy, is stored as two CSR adjacency structures: the descendants of each concept
+and the ancestors of each concept, each with the levels of separation. Expanding a
+list of concepts is a binary search and a few array slices, which takes microseconds
+instead of a join on `concept_ancestor`. The arrays are saved as NumPy files and
+memory-mapped when loaded, so they load instantly and are shared between processes
+through the page cache.
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import typing as t
+
+import numpy as np
+import pyarrow as pa
+
+from .concepts import sorted_unique
+
+HIERARCHY_FORMAT_VERSION = 1
+
+_ARRAYS = (
+    "concept_ids",
+    "descendant_offsets",
+    "descendants",
+    "descendant_levels",
+    "ancestor_offsets",
+    "ancestors",
+    "ancestor_levels",
+)
+
+
+def _csr(
+    concept_ids: np.ndarray, keys: np.ndarray, values: np.ndarray, levels: np.ndarray
+) -> t.Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Group values and levels by key into CSR offsets, values and levels."""
+    order = np.argsort(keys)
+    # Searching the sorted keys for each concept is much faster than searching the
+    # concepts for each key, which jumps randomly through memory
+    offsets = np.empty(len(concept_ids) + 1, dtype=np.int64)
+    offsets[:-1] = np.searchsorted(keys[order], concept_ids)
+    offsets[-1] = len(keys)
+    return offsets, values[order], levels[order]
+
+
+class ConceptHierarchy:
+    """
+    Descendants and ancestors of concepts, stored as CSR arrays.
+    """
+
+    def __init__(
+        self,
+        concept_ids: np.ndarray,
+        descendant_offsets: np.ndarray,
+        descendants: np.ndarray,
+        descendant_levels: np.ndarray,
+        ancestor_offsets: np.ndarray,
+        ancestors: np.ndarray,
+        ancestor_levels: np.ndarray,
+        version: str = "",
+    ):
+        """
+        Initialize the ConceptHierarchy. Use `ConceptHierarchy.build` or
+        `ConceptHierarchy.load` to create a hierarchy.
+
+        Args:
+            concept_ids (np.ndarray): Sorted ids of all concepts in the hierarchy.
+            descendant_offsets (np.ndarray): Start of the descendants of each concept,
+                with a final entry holding the total number of descendants.
+            descendants (np.ndarray): Descendant concept ids.
+            descendant_levels (np.ndarray): Minimum levels of separation of each
+                descendant.
+            ancestor_offsets (np.ndarray): Start of the ancestors of each concept.
+            ancestors (np.ndarray): Ancestor concept ids.
+            ancestor_levels (np.ndarray): Minimum levels of separation of each ancestor.
+            version (str): Identifier of the vocabulary version.
+        """
+        self.concept_ids = concept_ids
+        self.descendant_offsets = descendant_offsets
+        self.descendants = descendants
+        self.descendant_levels = descendant_levels
+        self.ancestor_offsets = ancestor_offsets
+        self.ancestors = ancestors
+        self.ancestor_levels = ancestor_levels
+        self.version = version
+
+    def __len__(self) -> int:
+        return len(self.concept_ids)
+
+    @classmethod
+    def build(
+        cls,
+        ancestor_ids: np.ndarray,
+        descendant_ids: np.ndarray,
+        levels: np.ndarray,
+        version: str = "",
+    ) -> "ConceptHierarchy":
+        """
+        Build the hierarchy from the rows of the `concept_ancestor` table.
+
+        Args:
+            ancestor_ids (np.ndarray): The ancestor_concept_id column.
+            descendant_ids (np.ndarray): The descendant_concept_id column.
+            levels (np.ndarray): The min_levels_of_separation column.
+            version (str): Identifier of the vocabulary version.
+
+        Returns:
+            ConceptHierarchy: The hierarchy.
+        """
+        ancestor_ids = np.asarray(ancestor_ids, dtype=np.int64)
+        descendant_ids = np.asarray(descendant_ids, dtype=np.int64)
+        levels = np.asarray(levels, dtype=np.int16)
+
+        concept_ids = sorted_unique(np.concatenate([ancestor_ids, descendant_ids]))
+        descendants = _csr(concept_ids, ancestor_ids, descendant_ids, levels)
+        ancestors = _csr(concept_ids, descendant_ids, ancestor_ids, levels)
+        return cls(concept_ids, *descendants, *ancestors, version=version)
+
+    def _expand(
+        self,
+        offsets: np.ndarray,
+        values: np.ndarray,
+        levels: np.ndarray,
+        concept_ids: t.Iterable[int],
+        include_self: bool,
+        max_levels: t.Optional[int],
+    ) -> np.ndarray:
+        query = np.asarray(list(concept_ids), dtype=np.int64)
+        positions = np.searchsorted(self.concept_ids, query)
+        positions = np.minimum(positions, max(len(self.concept_ids) - 1, 0))
+        found = positions[self.concept_ids[positions] == query] if len(self) else []
+
+        parts = [query] if include_self else []
+        for position in found:
+            start, end = offsets[position], offsets[position + 1]
+            related, separation = values[start:end], levels[start:end]
+            mask = separation > 0
+            if max_levels is not None:
+                mask &= separation <= max_levels
+            parts.append(related[mask])
+
+        if not parts:
+            return np.array([], dtype=np.int64)
+        return sorted_unique(np.concatenate(parts))
+
+    def get_descendants(
+        self,
+        concept_ids: t.Iterable[int],
+        include_self: bool = True,
+        max_levels: t.Optional[int] = None,
+    ) -> np.ndarray:
+        """
+        Get the descendants of the given concepts.
+
+        Args:
+            concept_ids (Iterable[int]): The concepts to expand.
+            include_self (bool): Include the given concepts in the result.
+            max_levels (int): Only return descendants up to this many levels below.
+
+        Returns:
+            np.ndarray: Sorted ids of the descendants of any of the concepts.
+        """
+        return self._expand(
+            self.descendant_offsets,
+            self.descendants,
+            self.descendant_levels,
+            concept_ids,
+            include_self,
+            max_levels,
+        )
+
+    def get_ancestors(
+        self,
+        concept_ids: t.Iterable[int],
+        include_self: bool = True,
+        max_levels: t.Optional[int] = None,
+    ) -> np.ndarray:
+        """
+        Get the ancestors of the given concepts.
+
+        Args:
+            concept_ids (Iterable[int]): The concepts to expand.
+            include_self (bool): Include the given concepts in the result.
+            max_levels (int): Only return ancestors up to this many levels above.
+
+        Returns:
+            np.ndarray: Sorted ids of the ancestors of any of the concepts.
+        """
+        return self._expand(
+            self.ancestor_offsets,
+            self.ancestors,
+            self.ancestor_levels,
+            concept_ids,
+            include_self,
+            max_levels,
+        )
+
+    @staticmethod
+    def to_arrow(concept_ids: np.ndarray) -> pa.Table:
+        """Wrap concept ids in a table with a single concept_id column."""
+        return pa.table({"concept_id": pa.array(concept_ids, type=pa.int64())})
+
+    def save(self, directory: str) -> None:
+        """
+        Atomically write the hierarchy to a directory of NumPy files.
+
+        Args:
+            directory (str): Directory of the hierarchy. It is replaced if it exists.
+        """
+        directory = os.path.abspath(directory)
+        parent = os.path.dirname(directory)
+        os.makedirs(parent, exist_ok=True)
+
+        tmp_dir = tempfile.mkdtemp(dir=parent, prefix=".hierarchy-")
+        try:
+            for name in _ARRAYS:
+                np.save(os.path.join(tmp_dir, f"{name}.npy"), getattr(self, name))
+            with open(os.path.join(tmp_dir, "meta.json"), "w") as f:
+                json.dump(
+                    {
+                        "format_version": HIERARCHY_FORMAT_VERSION,
+                        "version": self.version,
+                    },
+                    f,
+                )
+
+            # Directories cannot be replaced atomically, so move the old one aside.
+            # Processes that memory-mapped the old files keep reading them.
+            old_dir = None
+            if os.path.exists(directory):
+                old_dir = tempfile.mkdtemp(dir=parent, prefix=".hierarchy-old-")
+                os.replace(directory, os.path.join(old_dir, "hierarchy"))
+            os.replace(tmp_dir, directory)
+            if old_dir is not None:
+                shutil.rmtree(old_dir, ignore_errors=True)
+        except BaseException:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+
+    @classmethod
+    def load(
+        cls, directory: str, version: t.Optional[str] = None
+    ) -> t.Optional["ConceptHierarchy"]:
+        """
+        Memory-map a hierarchy saved with `save`.
+
+        Args:
+            directory (str): Directory of the hierarchy.
+            version (str): Expected version of the hierarchy. Hierarchies of other
+                versions are ignored.
+
+        Returns:
+            ConceptHierarchy: The hierarchy, or None if it is missing, unreadable or of
+                another version.
+        """
+        try:
+            with open(os.path.join(directory, "meta.json")) as f:
+                meta = json.load(f)
+            if meta.get("format_version") != HIERARCHY_FORMAT_VERSION:
+                return None
+            if version is not None and meta.get("version") != version:
+                return None
+            arrays = {
+                name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r")
+                for name in _ARRAYS
+            }
+            return cls(**arrays, version=meta["version"])
+        except (OSError, ValueError, KeyError):
+            return None
@@ -0,0 +1,324 @@
+"""Connection Pool Module
+This module provides a pool of Ibis backend connections to the OMOP database.
+
+Connections are health checked on checkout and replaced transparently when the
+database has dropped them, idle connections above the minimum pool size are closed,
+and every connection is configured as read-only with its own statement timeout.
+
+DuckDB connections are cursors of a single database instance, which is the
+thread-safe way of using one DuckDB database from several threads.
+"""
+
+import contextlib
+import threading
+import time
+import typing as t
+from collections import deque
+from dataclasses import dataclass
+
+import ibis
+import pyarrow as pa
+from ibis.backends import BaseBackend
+
+from . import exceptions as ex
+
+
+def get_backend_name(connection_string: str) -> str:
+    """Return the backend name from the scheme of a connection string."""
+    return connection_string.split("://", 1)[0].split("+", 1)[0]
+
+
+def interrupt_connection(conn: BaseBackend) -> None:
+    """
+    Interrupt the query currently running on a connection.
+
+    Args:
+        conn (BaseBackend): The connection running the query.
+    """
+    raw = getattr(conn, "con", None)
+    if raw is None:
+        return
+    if conn.name == "duckdb":
+        raw.interrupt()
+    elif hasattr(raw, "cancel"):
+        raw.cancel()
+
+
+@contextlib.contextmanager
+def temporary_tables(
+    conn: BaseBackend, tables: t.Dict[str, pa.Table]
+) -> t.Iterator[None]:
+    """
+    Make Arrow tables available to queries on a connection for the duration of the block.
+
+    DuckDB scans the registered Arrow tables in place, other backends copy them into
+    temporary tables.
+
+    Args:
+        conn (BaseBackend): The connection running the queries.
+        tables (Dict[str, pa.Table]): The tables by name.
+    """
+    registered = []
+    try:
+        for name, table in tables.items():
+            if conn.name == "duckdb":
+                conn.con.register(name, table)  # type: ignore
+            else:
+                conn.create_table(name, obj=table, temp=True, overwrite=True)
+            registered.append(name)
+        yield
+    finally:
+        for name in registered:
+            with contextlib.suppress(Exception):
+                if conn.name == "duckdb":
+                    conn.con.unregister(name)  # type: ignore
+                else:
+                    conn.drop_table(name, force=True)
+
+
+@dataclass
+class _PooledConnection:
+    conn: BaseBackend
+    last_used: float
+
+
+class ConnectionPool:
+    """
+    A thread-safe pool of Ibis backend connections.
+    """
+
+    def __init__(
+        self,
+        connection_string: str,
+        read_only: bool = True,
+        min_size: int = 1,
+        max_size: int = 4,
+        max_idle_time: t.Optional[float] = 300.0,
+        checkout_timeout: float = 30.0,
+        statement_timeout: t.Optional[float] = None,
+    ):
+        """
+        Initialize the ConnectionPool and open the minimum number of connections.
+
+        Args:
+            connection_string (str): Connection string of the database.
+            read_only (bool): Open connections in read-only mode.
+            min_size (int): Number of connections kept open at all times.
+            max_size (int): Maximum number of open connections.
+            max_idle_time (float): Seconds after which idle connections above
+                ``min_size`` are closed. None keeps idle connections open.
+            checkout_timeout (float): Seconds to wait for a free connection.
+            statement_timeout (float): Seconds after which the database cancels a
+                statement, where the backend supports it.
+        """
+        self.connection_string = connection_string
+        self.read_only = read_only
+        self.min_size = min(min_size, max_size)
+        self.max_size = max_size
+        self.max_idle_time = max_idle_time
+        self.checkout_timeout = checkout_timeout
+        self.statement_timeout = statement_timeout
+
+        self.backend_name = get_backend_name(connection_string)
+        self._root: t.Optional[BaseBackend] = None
+        self._idle: deque[_PooledConnection] = deque()
+        self._size = 0
+        self._closed = False
+        self._condition = threading.Condition()
+        self._root_lock = threading.Lock()
+
+        for _ in range(max(self.min_size, 1)):
+            self._idle.append(_PooledConnection(self._open(), time.monotonic()))
+            self._size += 1
+
+        self._reaper: t.Optional[threading.Thread] = None
+        if self.max_idle_time is not None:
+            self._reaper = threading.Thread(
+                target=self._reap_forever, name="omop-db-pool-reaper", daemon=True
+            )
+            self._reaper.start()
+
+    @property
+    def size(self) -> int:
+        """Number of open connections, idle or in use."""
+        return self._size
+
+    def _open(self) -> BaseBackend:
+        """Open and configure a new connection."""
+        if self.backend_name == "duckdb":
+            # Share one database instance between cursors, so that in-memory
+            # databases are shared too and the database file is opened once
+            with self._root_lock:
+                if self._root is None:
+                    self._root = ibis.connect(
+                        self.connection_string, read_only=self.read_only
+                    )
+                    return self._root
+                return ibis.duckdb.from_connection(self._root.con.cursor())
+
+        conn = ibis.connect(self.connection_string)
+        self._configure(conn)
+        return conn
+
+    def _configure(self, conn: BaseBackend) -> None:
+        """Apply the read-only mode and statement timeout to a connection."""
+        if conn.name != "postgres":
+            return
+
+        statements = []
+        if self.read_only:
+            statements.append("SET default_transaction_read_only = on")
+        if self.statement_timeout is not None:
+            statements.append(
+                f"SET statement_timeout = {int(self.statement_timeout * 1000)}"
+            )
+        for statement in statements:
+            conn.raw_sql(statement).close()  # type: ignore
+
+    @staticmethod
+    def _is_healthy(conn: BaseBackend) -> bool:
+        """Check if a connection can still run a query."""
+        try:
+            result = conn.raw_sql("SELECT 1")  # type: ignore
+            result.fetchall()
+            # DuckDB returns the connection itself rather than a cursor
+            if conn.name != "duckdb":
+                result.close()
+            return True
+        except Exception:
+            return False
+
+    @staticmethod
+    def _close(conn: BaseBackend) -> None:
+        with contextlib.suppress(Exception):
+            conn.disconnect()
+
+    def _discard(self, conn: BaseBackend) -> None:
+        """Close a connection and release its slot in the pool."""
+        if conn is not self._root:
+            self._close(conn)
+        self._release_slot()
+
+    def _release_slot(self) -> None:
+        with self._condition:
+            self._size -= 1
+            self._condition.notify()
+
+    @contextlib.contextmanager
+    def connection(self) -> t.Iterator[BaseBackend]:
+        """
+        Check out a connection for the duration of the block.
+
+        Yields:
+            BaseBackend: A healthy connection.
+
+        Raises:
+            ServerBusyError: If no connection becomes free within the checkout timeout.
+            ConnectionError: If a new connection cannot be opened.
+        """
+        conn = self._checkout()
+        try:
+            yield conn
+        except Exception:
+            # The connection may have been dropped mid-query, check before reusing it
+            if self._is_healthy(conn):
+                self._checkin(conn)
+            else:
+                self._discard(conn)
+            raise
+        else:
+            self._checkin(conn)
+
+    def _checkout(self) -> BaseBackend:
+        deadline = time.monotonic() + self.checkout_timeout
+        while True:
+            with self._condition:
+                if self._closed:
+                    raise ConnectionError("Connection pool is closed.")
+
+                if self._idle:
+                    conn = self._idle.pop().conn
+                elif self._size < self.max_size:
+                    self._size += 1
+                    conn = None
+                else:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise ex.ServerBusyError(
+                            f"No database connection became available within "
+                            f"{self.checkout_timeout} seconds."
+                        )
+                    self._condition.wait(remaining)
+                    continue
+
+            if conn is None:
+                try:
+                    return self._open()
+                except Exception as e:
+                    self._release_slot()
+                    raise ConnectionError(f"Failed to connect to database: {str(e)}")
+
+            if self._is_healthy(conn):
+                return conn
+
+            # Transparently replace connections dropped by the database
+            if conn is self._root:
+                self._root = None
+            self._discard(conn)
+
+    def _checkin(self, conn: BaseBackend) -> None:
+        with self._condition:
+            if self._closed:
+                self._size -= 1
+                self._close(conn)
+                return
+            self._idle.append(_PooledConnection(conn, time.monotonic()))
+            self._condition.notify()
+
+    def reap_idle(self) -> int:
+        """
+        Close connections idle for longer than ``max_idle_time`` above ``min_size``.
+
+        Returns:
+            int: Number of connections closed.
+        """
+        if self.max_idle_time is None:
+            return 0
+
+        expired = []
+        cutoff = time.monotonic() - self.max_idle_time
+        with self._condition:
+            # Idle connections are ordered from least to most recently used
+            while (
+                self._idle
+                and self._size - len(expired) > self.min_size
+                and self._idle[0].last_used < cutoff
+                and self._idle[0].conn is not self._root
+            ):
+                expired.append(self._idle.popleft())
+            self._size -= len(expired)
+
+        for pooled in expired:
+            self._close(pooled.conn)
+        return len(expired)
+
+    def _reap_forever(self) -> None:
+        interval = max(self.max_idle_time / 2, 1.0)  # type: ignore
+        while not self._closed:
+            time.sleep(interval)
+            self.reap_idle()
+
+    def close(self) -> None:
+        """Close all idle connections. Connections in use are closed on checkin."""
+        with self._condition:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._size -= len(idle)
+            self._condition.notify_all()
+
+        for pooled in idle:
+            if pooled.conn is not self._root:
+                self._close(pooled.conn)
+        if self._root is not None:
+            self._close(self._root)
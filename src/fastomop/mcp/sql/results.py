@@ -0,0 +1,273 @@
+"""Query Results Module
+This module provides functionality to collect query results from a stream of Arrow
+record batches within a row and byte budget, and to encode them for MCP clients.
+
+Supported encodings are CSV, dictionary-encoded columnar JSON, base64 Arrow IPC for
+programmatic clients and a summary that fits a token budget for LLM clients.
+"""
+
+import base64
+import io
+import json
+import typing as t
+
+import pyarrow as pa
+import pyarrow.compute as pc
+
+TRUNCATED_METADATA_KEY = b"fastomop.truncated"
+
+ResultFormat = t.Literal["csv", "json", "arrow", "summary"]
+RESULT_FORMATS: t.Tuple[str, ...] = t.get_args(ResultFormat)
+
+# Rough number of characters per LLM token, used to size summaries
+CHARS_PER_TOKEN = 4
+
+
+def collect_batches(
+    reader: pa.RecordBatchReader,
+    row_limit: int,
+    byte_limit: t.Optional[int] = None,
+) -> pa.Table:
+    """
+    Read record batches until the row or byte budget is reached.
+
+    The reader is closed as soon as a budget is hit so that the backend stops
+    producing rows. The returned table is flagged as truncated in its schema
+    metadata when rows were dropped.
+
+    Args:
+        reader (pa.RecordBatchReader): Stream of record batches from the backend.
+        row_limit (int): Maximum number of rows to return. The reader is expected to
+            yield at most one extra row, which is used to detect truncation.
+        byte_limit (int): Maximum size in bytes of the returned rows. None means unbounded.
+
+    Returns:
+        pa.Table: The collected rows.
+    """
+    batches: t.List[pa.RecordBatch] = []
+    num_rows = 0
+    nbytes = 0
+    truncated = False
+
+    try:
+        for batch in reader:
+            if num_rows + batch.num_rows > row_limit:
+                batch = batch.slice(0, row_limit - num_rows)
+                truncated = True
+
+            if byte_limit is not None and nbytes + batch.nbytes > byte_limit:
+                row_size = batch.nbytes / max(batch.num_rows, 1)
+                batch = batch.slice(0, int((byte_limit - nbytes) // row_size))
+                truncated = True
+
+            batches.append(batch)
+            num_rows += batch.num_rows
+            nbytes += batch.nbytes
+
+            if truncated:
+                break
+    finally:
+        reader.close()
+
+    table = pa.Table.from_batches(batches, schema=reader.schema)
+    return table.replace_schema_metadata(
+        {TRUNCATED_METADATA_KEY: b"true" if truncated else b"false"}
+    )
+
+
+def is_truncated(table: pa.Table) -> bool:
+    """Check if the table was truncated by the row or byte budget."""
+    metadata = table.schema.metadata or {}
+    return metadata.get(TRUNCATED_METADATA_KEY) == b"true"
+
+
+def to_csv(table: pa.Table) -> str:
+    """
+    Encode a table as CSV one record batch at a time.
+
+    Args:
+        table (pa.Table): The table to encode.
+
+    Returns:
+        str: The table as a CSV string with a header row.
+    """
+    buffer = io.StringIO()
+    batches = table.to_batches()
+    if not batches:
+        buffer.write(",".join(table.column_names) + "\n")
+
+    for i, batch in enumerate(batches):
+        batch.to_pandas().to_csv(buffer, index=False, header=i == 0)
+
+    return buffer.getvalue()
+
+
+def to_columnar_json(table: pa.Table) -> str:
+    """
+    Encode a table as columnar JSON.
+
+    String columns with repeated values are dictionary encoded as a list of distinct
+    values and a list of indices into it, which is considerably shorter than
+    repeating the values on every row.
+
+    Args:
+        table (pa.Table): The table to encode.
+
+    Returns:
+        str: JSON object with the row count, truncation flag and columns.
+    """
+    columns: t.Dict[str, t.Any] = {}
+    for name, column in zip(table.column_names, table.columns):
+        if pa.types.is_string(column.type) or pa.types.is_large_string(column.type):
+            encoded = pc.dictionary_encode(column).combine_chunks()
+            if len(encoded.dictionary) < len(encoded) / 2:
+                columns[name] = {
+                    "dictionary": encoded.dictionary.to_pylist(),
+                    "indices": encoded.indices.to_pylist(),
+                }
+                continue
+        columns[name] = column.to_pylist()
+
+    return json.dumps(
+        {
+            "num_rows": table.num_rows,
+            "truncated": is_truncated(table),
+            "columns": columns,
+        },
+        default=str,
+        separators=(",", ":"),
+    )
+
+
+def to_arrow_ipc(table: pa.Table) -> str:
+    """
+    Encode a table as a base64 encoded Arrow IPC stream.
+
+    Args:
+        table (pa.Table): The table to encode.
+
+    Returns:
+        str: The base64 encoded IPC stream, including the schema metadata.
+    """
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return base64.b64encode(sink.getvalue().to_pybytes()).decode("ascii")
+
+
+def _column_stats(column: pa.ChunkedArray) -> t.Dict[str, t.Any]:
+    """Compute summary statistics of a column."""
+    stats: t.Dict[str, t.Any] = {"type": str(column.type), "nulls": column.null_count}
+    if len(column) == column.null_count:
+        return stats
+
+    if (
+        pa.types.is_integer(column.type)
+        or pa.types.is_floating(column.type)
+        or pa.types.is_decimal(column.type)
+        or pa.types.is_temporal(column.type)
+    ):
+        min_max = pc.min_max(column).as_py()
+        stats["min"], stats["max"] = min_max["min"], min_max["max"]
+        if not pa.types.is_temporal(column.type):
+            stats["mean"] = pc.mean(column).as_py()
+    elif pa.types.is_string(column.type) or pa.types.is_large_string(column.type):
+        counts = pc.value_counts(column)
+        stats["distinct"] = len(counts)
+        top = sorted(counts.to_pylist(), key=lambda c: c["counts"], reverse=True)[:3]
+        stats["top"] = {c["values"]: c["counts"] for c in top}
+    else:
+        stats["distinct"] = pc.count_distinct(column).as_py()
+
+    return stats
+
+
+def to_summary(table: pa.Table, token_budget: int = 1000) -> str:
+    """
+    Summarise a table within a token budget.
+
+    The summary holds the row count, per column statistics and as many of the first
+    rows as fit in the budget. When the statistics alone exceed the budget, the rows
+    are left out, the statistics of the last columns are shortened to their type and
+    then the last columns are left out, counted in "omitted_columns". A summary that
+    still does not fit is flagged with "budget_exceeded".
+
+    Args:
+        table (pa.Table): The table to summarise.
+        token_budget (int): Approximate maximum number of tokens of the summary.
+
+    Returns:
+        str: JSON object with the row count, column statistics and the first rows as CSV.
+    """
+    columns = {
+        name: _column_stats(column)
+        for name, column in zip(table.column_names, table.columns)
+    }
+    summary: t.Dict[str, t.Any] = {
+        "num_rows": table.num_rows,
+        "truncated": is_truncated(table),
+        "columns": columns,
+    }
+
+    def render() -> str:
+        return json.dumps(summary, default=str, separators=(",", ":"))
+
+    max_chars = token_budget * CHARS_PER_TOKEN
+    num_rows = min(table.num_rows, max_chars // 16)
+    summary["first_rows"] = to_csv(table.slice(0, num_rows))
+    text = render()
+    while num_rows > 0 and len(text) > max_chars:
+        num_rows //= 2
+        summary["first_rows"] = to_csv(table.slice(0, num_rows))
+        text = render()
+    if len(text) <= max_chars:
+        return text
+
+    del summary["first_rows"]
+    text = render()
+    for name in reversed(table.column_names):
+        if len(text) <= max_chars:
+            return text
+        columns[name] = {"type": columns[name]["type"]}
+        text = render()
+
+    names = list(table.column_names)
+    while names and len(text) > max_chars:
+        del columns[names.pop()]
+        summary["omitted_columns"] = len(table.column_names) - len(names)
+        text = render()
+    if len(text) > max_chars:
+        summary["budget_exceeded"] = True
+        text = render()
+    return text
+
+
+def encode(table: pa.Table, format: str = "csv", token_budget: int = 1000) -> str:
+    """
+    Encode a table in the requested format.
+
+    Args:
+        table (pa.Table): The table to encode.
+        format (str): One of "csv", "json", "arrow" or "summary".
+        token_budget (int): Approximate maximum number of tokens of a summary.
+
+    Returns:
+        str: The encoded table.
+
+    Raises:
+        ValueError: If the format is not supported.
+    """
+    match format:
+        case "csv":
+            return to_csv(table)
+        case "json":
+            return to_columnar_json(table)
+        case "arrow":
+            return to_arrow_ipc(table)
+        case "summary":
+            return to_summary(table, token_budget)
+        case _:
+            raise ValueError(
+                f"Unsupported result format: {format}. "
+                f"Supported formats are: {', '.join(RESULT_FORMATS)}"
+            )
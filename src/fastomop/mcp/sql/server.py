@@ -1,31 +1,112 @@
+import json
 import os
+import threading
+import typing as t
+import uuid
+import weakref
 
-from mcp.server.fastmcp import FastMCP
+import pyarrow as pa
+from mcp.server.fastmcp import Context, FastMCP
 from mcp.types import CallToolResult, TextContent
 
+from . import exceptions as ex
 from .db import OmopDatabase
+from .executor import CancellationToken, DatabaseExecutor
+from .results import ResultFormat, encode, is_truncated
 
 connection_string = os.environ["DB_CONNECTION_STRING"]
 
 
-# # Default host and port values, can be overridden via environment variables
-# NotImplemented
-# host = os.environ.get("MCP_HOST", "localhost")
-# port = int(os.environ.get("MCP_PORT", "8000"))
+# Transport of the server: "stdio" for a subprocess of one client, "streamable-http"
+# to serve many clients from one process
+transport = os.environ.get("MCP_TRANSPORT", "stdio")
+# Default host and port values, can be overridden via environment variables
+host = os.environ.get("MCP_HOST", "localhost")
+port = int(os.environ.get("MCP_PORT", "8000"))
 
-mcp = FastMCP(name="OMOP MCP Server")
+mcp = FastMCP(name="OMOP MCP Server", host=host, port=port)
 db = OmopDatabase(
     connection_string=connection_string,
     cdm_schema=os.environ.get("CDM_SCHEMA", "base"),
     vocab_schema=os.environ.get("VOCAB_SCHEMA", "base"),
+    cache_max_entries=int(os.environ.get("RESULT_CACHE_MAX_ENTRIES", "256")),
+    cache_max_bytes=int(
+        os.environ.get("RESULT_CACHE_MAX_BYTES", str(64 * 1024 * 1024))
+    ),
+    cache_ttl=float(os.environ.get("RESULT_CACHE_TTL", "3600")),
+    disk_cache_dir=os.environ.get("RESULT_CACHE_DIR"),
+    disk_cache_max_bytes=int(
+        os.environ.get("RESULT_CACHE_DIR_MAX_BYTES", str(1024 * 1024 * 1024))
+    ),
+    fingerprint_ttl=float(os.environ.get("CDM_FINGERPRINT_TTL", "60")),
+    row_limit=int(os.environ.get("QUERY_ROW_LIMIT", "1000")),
+    byte_limit=int(os.environ.get("QUERY_BYTE_LIMIT", str(8 * 1024 * 1024))),
+    pool_min_size=int(os.environ.get("DB_POOL_MIN_SIZE", "1")),
+    pool_max_size=int(os.environ.get("DB_POOL_MAX_SIZE", "4")),
+    pool_max_idle_time=float(os.environ.get("DB_POOL_MAX_IDLE_TIME", "300")),
+    statement_timeout=float(os.environ["DB_STATEMENT_TIMEOUT"])
+    if os.environ.get("DB_STATEMENT_TIMEOUT")
+    else None,
+    max_estimated_cost=float(os.environ["QUERY_MAX_ESTIMATED_COST"])
+    if os.environ.get("QUERY_MAX_ESTIMATED_COST")
+    else None,
+    max_estimated_rows=float(os.environ.get("QUERY_MAX_ESTIMATED_ROWS", "1e8")),
+    query_timeout=float(os.environ.get("QUERY_TIMEOUT", "120")),
+    guard_mode=os.environ.get("QUERY_GUARD_MODE", "reject"),  # type: ignore
+    catalog_path=os.environ.get("SCHEMA_CATALOG_PATH"),
+    # An empty value keeps the hierarchy in memory only
+    hierarchy_dir=os.environ.get("CONCEPT_HIERARCHY_DIR", ".cache/concept_hierarchy")
+    or None,
+    subexpression_reuse=os.environ.get("SUBEXPRESSION_REUSE", "true").lower() == "true",
+    subexpression_min_uses=int(os.environ.get("SUBEXPRESSION_MIN_USES", "2")),
+    subexpression_max_rows=int(os.environ.get("SUBEXPRESSION_MAX_ROWS", "1000000")),
+    subexpression_max_bytes=int(
+        os.environ.get("SUBEXPRESSION_MAX_BYTES", str(256 * 1024 * 1024))
+    ),
+    sql_dialect=os.environ.get("SQL_DIALECT", "postgres"),
+    optimize_queries=os.environ.get("QUERY_OPTIMIZE", "false").lower() == "true",
+    star_mode=os.environ.get("QUERY_STAR_MODE", "allow"),  # type: ignore
+    max_star_columns=int(os.environ["QUERY_MAX_STAR_COLUMNS"])
+    if os.environ.get("QUERY_MAX_STAR_COLUMNS")
+    else None,
 )
+# Maximum number of queries of a Select_Queries call and how many run concurrently
+max_batch_queries = int(os.environ.get("QUERY_BATCH_MAX_QUERIES", "20"))
+batch_concurrency = int(os.environ.get("QUERY_BATCH_CONCURRENCY", "4"))
+executor = DatabaseExecutor(
+    max_workers=int(os.environ.get("DB_WORKERS", "4")),
+    max_queue=int(os.environ.get("DB_QUEUE_SIZE", "16")),
+)
+
+
+def _error_text(e: Exception) -> str:
+    """Describe a failed query for the client."""
+    if isinstance(e, ex.QueryGuardError):
+        return json.dumps({"error": type(e).__name__, "message": str(e), **e.details})
+    if isinstance(e, ExceptionGroup):
+        errors = "\n\n".join(str(i) for i in e.exceptions)
+        return f"Query validation failed with one or more errors:\n {errors}"
+    return f"Failed to execute query: {str(e)}"
+
+
+# Identifiers of the open client sessions. Object ids are reused once a session is
+# garbage collected, which would hand its materialised subexpressions to a new session
+_session_ids: weakref.WeakKeyDictionary[t.Any, str] = weakref.WeakKeyDictionary()
+
+
+def _session_id(ctx: Context) -> str:
+    """Identify the client session of a tool call."""
+    session_id = _session_ids.get(ctx.session)
+    if session_id is None:
+        session_id = _session_ids[ctx.session] = uuid.uuid4().hex
+    return session_id
 
 
 @mcp.tool(
     name="Get_Information_Schema",
     description="Get the information schema of the OMOP database.",
 )
-def get_information_schema() -> CallToolResult:
+async def get_information_schema() -> CallToolResult:
     """Get the information schema of the OMOP database.
 
     This function retrieves information from the information schema of the OMOP database.
@@ -36,7 +117,7 @@ def get_information_schema() -> CallToolResult:
         List of schemas, tables, columns and data types formatted as a CSV string.
     """
     try:
-        result = db.get_information_schema()
+        result = await executor.run(db.get_information_schema)
         return CallToolResult(
             content=[
                 TextContent(type="text", text=result),
@@ -55,54 +136,343 @@ def get_information_schema() -> CallToolResult:
 
 
 @mcp.tool(
-    name="Select_Query", description="Execute a select query against the OMOP database."
+    name="Get_CDM_Version",
+    description="Get an identifier of the current version of the OMOP CDM data, "
+    "which changes when the data is refreshed.",
 )
-def read_query(query: str) -> CallToolResult:
-    """Run a SQL query against the OMOP database.
+async def get_cdm_version() -> CallToolResult:
+    """Get an identifier of the current version of the OMOP CDM data.
 
-    This function is a tool in the MCP server that allows users to execute SQL queries
-    against the OMOP database. Only SELECT queries are allowed. Results are returned as CSV.
+    Args:
+        None
+    Returns:
+        Fingerprint of the connection, the cdm_source table and, for DuckDB, the
+        database file.
+    """
+    try:
+        result = await executor.run(lambda _: db.get_cdm_fingerprint())
+        return CallToolResult(content=[TextContent(type="text", text=result)])
+    except Exception as e:
+        return CallToolResult(
+            isError=True,
+            content=[
+                TextContent(type="text", text=f"Failed to get the CDM version: {e}")
+            ],
+        )
+
+
+@mcp.tool(
+    name="List_Tables",
+    description="List the OMOP tables available for querying with their estimated "
+    "row counts.",
+)
+async def list_tables() -> CallToolResult:
+    """List the OMOP tables available for querying.
 
     Args:
-        query: SQL query to execute
+        None
     Returns:
-        Result of the query as a string or a detailed error message if the query fails.
+        Schema, name, number of columns and estimated row count of each table formatted
+        as a CSV string.
     """
     try:
-        result = db.read_query(query)
+        result = await executor.run(db.list_tables)
+        return CallToolResult(content=[TextContent(type="text", text=result)])
+    except Exception as e:
         return CallToolResult(
+            isError=True,
+            content=[TextContent(type="text", text=f"Failed to list tables: {str(e)}")],
+        )
+
+
+@mcp.tool(
+    name="Get_Table_Schema",
+    description="Get the columns, data types, primary key and foreign keys of one or "
+    "more OMOP tables. Prefer this over Get_Information_Schema when only a few tables "
+    "are needed.",
+)
+async def get_table_schema(tables: list[str]) -> CallToolResult:
+    """Describe the columns and keys of the given OMOP tables.
+
+    Args:
+        tables: Table names, optionally qualified with the schema
+    Returns:
+        Description of each table with one line per column, or an error message listing
+        the available tables if a table is unknown.
+    """
+    try:
+        result = await executor.run(lambda token: db.get_table_schema(tables, token))
+        return CallToolResult(content=[TextContent(type="text", text=result)])
+    except Exception as e:
+        return CallToolResult(
+            isError=True,
             content=[
-                TextContent(type="text", text=result),
-            ]
+                TextContent(type="text", text=f"Failed to get table schema: {str(e)}")
+            ],
         )
 
-    except ExceptionGroup as e:
-        errors = "\n\n".join(str(i) for i in e.exceptions)
+
+@mcp.tool(
+    name="Search_Concepts",
+    description="Search OMOP concepts by name and synonyms, optionally filtered by "
+    "vocabulary, domain and standard concepts. Returns ranked candidates with their "
+    "concept_id. Prefer this over LIKE queries on the concept table.",
+)
+async def search_concepts(
+    query: str,
+    vocabulary_ids: list[str] | None = None,
+    domain_ids: list[str] | None = None,
+    standard_only: bool = False,
+    limit: int = 20,
+    format: ResultFormat = "csv",
+) -> CallToolResult:
+    """Search OMOP concepts by name and synonyms.
+
+    Args:
+        query: Search text, such as "type 2 diabetes"
+        vocabulary_ids: Only return concepts of these vocabularies, such as ["SNOMED"]
+        domain_ids: Only return concepts of these domains, such as ["Condition"]
+        standard_only: Only return standard concepts
+        limit: Maximum number of concepts to return
+        format: Result encoding, one of "csv", "json", "arrow" or "summary"
+    Returns:
+        Matching concepts with a score between 0 and 1, best match first.
+    """
+
+    def run_search(token: CancellationToken) -> str:
+        table = db.search_concepts(
+            query, vocabulary_ids, domain_ids, standard_only, limit, token
+        )
+        return encode(table, format)
+
+    try:
+        result = await executor.run(run_search)
+        return CallToolResult(content=[TextContent(type="text", text=result)])
+    except Exception as e:
+        return CallToolResult(
+            isError=True,
+            content=[
+                TextContent(type="text", text=f"Failed to search concepts: {str(e)}")
+            ],
+        )
+
+
+@mcp.tool(
+    name="Get_Concept_Hierarchy",
+    description="Get all descendants or ancestors of a list of concept_ids from the "
+    "precomputed concept hierarchy. To filter a query by the descendants of concepts, "
+    "pass them as concept_sets to Select_Query instead of joining concept_ancestor.",
+)
+async def get_concept_hierarchy(
+    concept_ids: list[int],
+    direction: t.Literal["descendants", "ancestors"] = "descendants",
+    include_self: bool = True,
+    max_levels: int | None = None,
+    limit: int = 1000,
+) -> CallToolResult:
+    """Get the descendants or ancestors of concepts.
+
+    Args:
+        concept_ids: Concepts to expand
+        direction: "descendants" or "ancestors"
+        include_self: Include the given concepts in the result
+        max_levels: Maximum levels of separation from the given concepts
+        limit: Maximum number of concept_ids to return
+    Returns:
+        JSON object with the number of related concepts and their concept_ids.
+    """
+
+    def run_expand(token: CancellationToken) -> str:
+        related = db.get_related_concepts(
+            concept_ids, direction, include_self, max_levels, token
+        )
+        return json.dumps(
+            {
+                "count": len(related),
+                "truncated": len(related) > limit,
+                "concept_ids": related[:limit].tolist(),
+            },
+            separators=(",", ":"),
+        )
+
+    try:
+        result = await executor.run(run_expand)
+        return CallToolResult(content=[TextContent(type="text", text=result)])
+    except Exception as e:
         return CallToolResult(
             isError=True,
             content=[
                 TextContent(
-                    type="text",
-                    text=f"Query validation failed with one or more errors:\n {errors}",
+                    type="text", text=f"Failed to expand concept hierarchy: {str(e)}"
                 )
             ],
         )
+
+
+@mcp.tool(
+    name="Select_Query",
+    description="Execute a select query against the OMOP database. "
+    "Results are returned as CSV by default. Use format='summary' with a token_budget "
+    "to get the row count, column statistics and the first rows of large results, "
+    "format='json' for dictionary-encoded columnar JSON or format='arrow' for a base64 "
+    "encoded Arrow IPC stream. concept_sets maps table names to concept_ids, which are "
+    "expanded to all their descendants and can be used in the query as tables with a "
+    "single concept_id column, e.g. concept_sets={'t2dm': [201826]} and "
+    "`where condition_concept_id in (select concept_id from t2dm)`.",
+)
+async def read_query(
+    ctx: Context,
+    query: str,
+    format: ResultFormat = "csv",
+    token_budget: int = 1000,
+    concept_sets: dict[str, list[int]] | None = None,
+) -> CallToolResult:
+    """Run a SQL query against the OMOP database.
+
+    This function is a tool in the MCP server that allows users to execute SQL queries
+    against the OMOP database. Only SELECT queries are allowed. Results are returned as CSV
+    unless another format is requested.
+
+    Args:
+        ctx: Context of the tool call, used to reuse subexpressions within a session
+        query: SQL query to execute
+        format: Result encoding, one of "csv", "json", "arrow" or "summary"
+        token_budget: Approximate maximum number of tokens of a summary
+        concept_sets: Concept ids by table name, expanded to all their descendants
+    Returns:
+        Result of the query as a string or a detailed error message if the query fails.
+    """
+    session = _session_id(ctx)
+
+    def run_query(token: CancellationToken) -> tuple[pa.Table, str]:
+        table = db.fetch_arrow(query, token, concept_sets, session)
+        return table, encode(table, format, token_budget)
+
+    try:
+        table, text = await executor.run(run_query)
+        content = [TextContent(type="text", text=text)]
+        if format == "csv" and is_truncated(table):
+            content.append(
+                TextContent(
+                    type="text",
+                    text=f"Results truncated to {table.num_rows} rows. "
+                    "Aggregate or filter the query to see all results.",
+                )
+            )
+        return CallToolResult(content=content)
+
     except Exception as e:
+        return CallToolResult(
+            isError=True,
+            content=[TextContent(type="text", text=_error_text(e))],
+        )
+
+
+@mcp.tool(
+    name="Select_Queries",
+    description="Execute several select queries against the OMOP database in one call. "
+    "All queries are validated together and run on pooled connections, concurrently "
+    "unless concurrent=False. Returns the result or error of each query in order, "
+    f"for at most {max_batch_queries} queries. format, token_budget and concept_sets "
+    "work as for Select_Query and apply to every query.",
+)
+async def read_queries(
+    ctx: Context,
+    queries: list[str],
+    format: ResultFormat = "csv",
+    token_budget: int = 1000,
+    concept_sets: dict[str, list[int]] | None = None,
+    concurrent: bool = True,
+) -> CallToolResult:
+    """Run several SQL queries against the OMOP database.
+
+    The queries are validated before any of them runs and share the concept sets and
+    the database connections, so a batch is cheaper than calling Select_Query for each
+    query. A failing query does not stop the other queries.
+
+    Args:
+        ctx: Context of the tool call, used to reuse subexpressions within a session
+        queries: SQL queries to execute
+        format: Result encoding of every query, one of "csv", "json", "arrow" or "summary"
+        token_budget: Approximate maximum number of tokens of each summary
+        concept_sets: Concept ids by table name, expanded to all their descendants
+        concurrent: Run the queries concurrently on several connections
+    Returns:
+        The result or a detailed error message of each query, numbered in order.
+    """
+    if not queries:
+        return CallToolResult(
+            isError=True,
+            content=[TextContent(type="text", text="No queries given.")],
+        )
+    if len(queries) > max_batch_queries:
         return CallToolResult(
             isError=True,
             content=[
                 TextContent(
                     type="text",
-                    text=f"Failed to execute query: {str(e)}",
+                    text=f"Too many queries: {len(queries)}. "
+                    f"Send at most {max_batch_queries} queries per call.",
                 )
             ],
         )
 
+    session = _session_id(ctx)
+
+    def run_queries(token: CancellationToken) -> list[tuple[bool, str]]:
+        results = db.fetch_arrow_batch(
+            queries,
+            token,
+            concept_sets,
+            max_concurrency=batch_concurrency if concurrent else 1,
+            session=session,
+        )
+        texts = []
+        for result in results:
+            if isinstance(result, Exception):
+                texts.append((False, _error_text(result)))
+                continue
+            text = encode(result, format, token_budget)
+            if format == "csv" and is_truncated(result):
+                text += f"\n(Results truncated to {result.num_rows} rows)"
+            texts.append((True, text))
+        return texts
+
+    try:
+        texts = await executor.run(run_queries)
+    except Exception as e:
+        return CallToolResult(
+            isError=True,
+            content=[TextContent(type="text", text=_error_text(e))],
+        )
+
+    content = [
+        TextContent(
+            type="text",
+            text=f"Query {i}{'' if ok else ' failed'}:\n{text}",
+        )
+        for i, (ok, text) in enumerate(texts, start=1)
+    ]
+    return CallToolResult(
+        isError=not any(ok for ok, _ in texts),
+        content=content,
+    )
+
 
 def main():
     """Main function to run the MCP server."""
+    # "catalog" loads the schema catalog before the first tool call, "true" also
+    # loads the concept index and hierarchy, which read the whole vocabulary
+    warm_up = os.environ.get("DB_WARM_UP", "false").lower()
+    if warm_up in ("catalog", "true"):
+        threading.Thread(
+            target=db.warm_up,
+            args=(warm_up == "true",),
+            name="omop-warm-up",
+            daemon=True,
+        ).start()
 
-    mcp.run(transport="stdio")
+    mcp.run(transport=transport)  # type: ignore
 
 
 if __name__ == "__main__":
@@ -1,91 +1,179 @@
 """SQL Validator Module
-This module provides functionality to validate SQL queries using SQLGlot
+This module provides functionality to validate SQL queries using SQLGlot.
+
+A query is parsed once and walked once to collect the tables, columns, stars and
+CTE names it references. The collected `ParsedQuery` is then checked by a list of
+rule objects. Parsed ASTs and validation outcomes are cached by query hash so that
+repeated validation of the same query does not pay the parsing cost again.
+
+Valid queries are compiled for the database: transpiled from the dialect the agent
+writes to the dialect of the backend, with OMOP tables qualified by their schema and,
+optionally, simplified by the SQLGlot optimizer. Stars can be expanded to the columns
+of the schema catalog, so that columns that are never used are not scanned, or rejected.
+Compiled queries are cached as well.
 """
 
+import dataclasses
+import hashlib
+import re
 import typing as t
+from dataclasses import dataclass, field
 
 import sqlglot as sg
 import sqlglot.expressions as exp
-from sqlglot.optimizer.scope import build_scope
+from sqlglot.optimizer import optimize
+from sqlglot.optimizer.pushdown_predicates import pushdown_predicates
+from sqlglot.optimizer.pushdown_projections import pushdown_projections
+from sqlglot.optimizer.qualify import qualify
 
 from fastomop.config import config as cfg
 
 from . import exceptions as ex
+from .cache import ResultCache
 
 OMOP_TABLES = (
     cfg.omop.clinical_tables + cfg.omop.vocabulary_tables + cfg.omop.metadata_tables
 )
-
-
-class SQLValidator:
-    def __init__(
-        self,
-        allow_source_value_columns: bool = False,
-        exclude_tables: t.List = None,
-        exclude_columns: t.List = None,
-        from_dialect: str = "postgres",
-        to_dialect: str = "duckdb",
-    ):
+VOCABULARY_TABLES = tuple(cfg.omop.vocabulary_tables)
+
+# Optimizer rules applied to compiled queries: predicate pushdown and column pruning
+OPTIMIZER_RULES = (qualify, pushdown_projections, pushdown_predicates)
+
+# How stars in queries are handled: run as written, expanded to the columns of the
+# schema catalog or rejected
+StarMode = t.Literal["allow", "expand", "reject"]
+
+# Aliases SQLGlot gives to unnamed output columns when qualifying a query
+_GENERATED_ALIAS = re.compile(r"^_col_\d+$")
+
+
+def _is_projection_star(node: exp.Expression) -> bool:
+    """Check if a projection is `*` or `table.*`."""
+    return isinstance(node, exp.Star) or (
+        isinstance(node, exp.Column) and isinstance(node.this, exp.Star)
+    )
+
+
+def _restore_output_names(original: exp.Expression, qualified: exp.Expression) -> None:
+    """
+    Remove the aliases that qualifying gave to unnamed output columns, so that the
+    backend names the columns of the result as it would for the original query.
+    """
+    aliases = {projection.alias for projection in original.selects}
+    for projection in qualified.selects:
+        if (
+            isinstance(projection, exp.Alias)
+            and _GENERATED_ALIAS.match(projection.alias)
+            and projection.alias not in aliases
+        ):
+            # ORDER BY and GROUP BY positions are rewritten to the generated aliases
+            for column in list(qualified.find_all(exp.Column)):
+                if not column.table and column.name == projection.alias:
+                    column.replace(projection.this.copy())
+            projection.replace(projection.this)
+
+
+@dataclass
+class ParsedQuery:
+    """The parsed SQL query and the nodes collected from a single walk of its AST."""
+
+    sql: str
+    parsed: exp.Expression
+    tables: t.List[exp.Table] = field(default_factory=list)
+    columns: t.List[exp.Column] = field(default_factory=list)
+    stars: t.List[exp.Star] = field(default_factory=list)
+    cte_names: t.Set[str] = field(default_factory=set)
+
+    @classmethod
+    def from_expression(cls, sql: str, parsed: exp.Expression) -> "ParsedQuery":
         """
-        Initialize the SQLValidator with a list of allowed tables.
+        Collect tables, columns, stars and CTE names in a single walk of the AST.
 
         Args:
-            allowed_tables (list): A list of allowed table names for validation.
-            allow_source_values (bool): Flag to allow source values in validation.
-            exclude_tables (list): A list of tables to exclude from validation.
-            exclude_columns (list): A list of columns to exclude from validation.
+            sql (str): The SQL query.
+            parsed (exp.Expression): The parsed SQL query.
+
+        Returns:
+            ParsedQuery: The parsed query with the collected nodes.
         """
+        query = cls(sql=sql, parsed=parsed)
+        for node in parsed.walk():
+            if isinstance(node, exp.Table):
+                query.tables.append(node)
+            elif isinstance(node, exp.Column):
+                query.columns.append(node)
+            elif isinstance(node, exp.Star):
+                query.stars.append(node)
+            elif isinstance(node, exp.CTE):
+                query.cte_names.add(node.alias_or_name.lower())
+        return query
+
+    @property
+    def source_tables(self) -> t.List[exp.Table]:
+        """Real table references, excluding references to CTEs."""
+        return [
+            table
+            for table in self.tables
+            if table.db or table.name.lower() not in self.cte_names
+        ]
 
-        self.allow_source_value_columns: bool = allow_source_value_columns
-        self.exclude_tables: t.List = (
-            list(map(str.lower, exclude_tables)) if exclude_tables is not None else []
-        )
-        self.exclude_columns: t.List = (
-            list(map(str.lower, exclude_columns)) if exclude_columns is not None else []
-        )
 
-    def _check_is_select_query(
-        self, parsed_sql: exp.Expression
-    ) -> ex.NotSelectQueryError | None:
-        """
-        Check if the parsed SQL query is a SELECT statement.
+class ValidationRule:
+    """
+    Base class for validation rules.
 
-        Args:
-            parsed_sql (exp.Expression): The parsed SQL query.
+    A rule inspects a `ParsedQuery` and returns an error or None. Validation stops
+    after a failing rule that is marked as fatal.
+    """
 
-        Returns:
-            NotSelectQueryError: If the query is not a SELECT statement.
-        """
-        if not isinstance(parsed_sql, exp.Select):
+    fatal: bool = False
+
+    def check(self, query: ParsedQuery) -> ex.QueryError | None:
+        raise NotImplementedError
+
+
+class SelectOnlyRule(ValidationRule):
+    """Check if the parsed SQL query is a SELECT statement."""
+
+    fatal = True
+
+    def check(self, query: ParsedQuery) -> ex.NotSelectQueryError | None:
+        if not isinstance(query.parsed, exp.Select):
             return ex.NotSelectQueryError(
                 "Only SELECT statements are allowed for security reasons."
             )
 
-    def _check_is_omop_table(
-        self, parsed_sql: exp.Expression
-    ) -> ex.TableNotFoundError | None:
-        """
-        Check if all real table references in the query are OMOP CDM tables and
-        ignores CTEs (defined in WITH clauses).
 
-        Args:
-            parsed_sql (exp.Expression): The parsed SQL expression.
+class HasTablesRule(ValidationRule):
+    """Check if the query references at least one table."""
 
-        Return:
-            TableNotFoundError: If any non-OMOP tables are found.
-        """
-        root = build_scope(parsed_sql)
-        tables = [
-            source
-            for scope in root.traverse()
-            for alias, (node, source) in scope.selected_sources.items()
-            if isinstance(source, exp.Table)
-        ]
+    def check(self, query: ParsedQuery) -> ex.TableNotFoundError | None:
+        if not query.tables:
+            return ex.TableNotFoundError("No tables found in the query.")
+
+
+class HasColumnsRule(ValidationRule):
+    """Check if the query references at least one column or star."""
+
+    def check(self, query: ParsedQuery) -> ex.ColumnNotFoundError | None:
+        if not query.columns and not query.stars:
+            return ex.ColumnNotFoundError("No columns found in the query.")
 
+
+class OmopTablesRule(ValidationRule):
+    """
+    Check if all real table references in the query are OMOP CDM tables and
+    ignores CTEs (defined in WITH clauses).
+    """
+
+    def __init__(self, omop_tables: t.Iterable[str] = OMOP_TABLES):
+        self.omop_tables = set(map(str.lower, omop_tables))
+
+    def check(self, query: ParsedQuery) -> ex.TableNotFoundError | None:
         not_omop_tables = [
             table.name.lower()
-            for table in tables
-            if table.name.lower() not in OMOP_TABLES
+            for table in query.source_tables
+            if table.name.lower() not in self.omop_tables
         ]
 
         if not_omop_tables:
@@ -93,23 +181,17 @@ class SQLValidator:
                 f"Tables not found in OMOP CDM: {', '.join(not_omop_tables)}"
             )
 
-    def _check_unauthorized_tables(
-        self, tables: t.List[exp.Table]
-    ) -> ex.UnauthorizedTableError | None:
-        """
-        Checks for unauthorized tables in the provided list of tables.
 
-        Args:
-            tables (List[exp.Table]): A list of table expressions to validate.
+class UnauthorizedTablesRule(ValidationRule):
+    """Check for unauthorized tables in the query."""
 
-        Returns:
-            UnauthorizedTableError: An error indicating the presence of unauthorized tables
-            in the query, if any are found. Otherwise, returns None.
-        """
+    def __init__(self, exclude_tables: t.Iterable[str]):
+        self.exclude_tables = set(map(str.lower, exclude_tables))
 
+    def check(self, query: ParsedQuery) -> ex.UnauthorizedTableError | None:
         unauthorized_tables = [
             table.name.lower()
-            for table in tables
+            for table in query.tables
             if table.name.lower() in self.exclude_tables
         ]
 
@@ -118,23 +200,17 @@ class SQLValidator:
                 f"Unauthorized tables in query: {', '.join(unauthorized_tables)}"
             )
 
-    def _check_unauthorized_columns(
-        self, columns: t.List[exp.Column]
-    ) -> ex.UnauthorizedColumnError | None:
-        """
-        Checks for unauthorized columns in the provided list of columns.
 
-        Args:
-            columns (List[exp.Column]): A list of column expressions.
+class UnauthorizedColumnsRule(ValidationRule):
+    """Check for unauthorized columns in the query."""
 
-        Returns:
-            UnauthorizedColumnError: An error indicating the presence of unauthorized columns
-            in the query, if any are found. Otherwise, returns None.
-        """
+    def __init__(self, exclude_columns: t.Iterable[str]):
+        self.exclude_columns = set(map(str.lower, exclude_columns))
 
+    def check(self, query: ParsedQuery) -> ex.UnauthorizedColumnError | None:
         unauthorized_columns = [
             column.name.lower()
-            for column in columns
+            for column in query.columns
             if column.name.lower() in self.exclude_columns
         ]
         if unauthorized_columns:
@@ -142,27 +218,31 @@ class SQLValidator:
                 f"Unauthorized columns in query: {', '.join(unauthorized_columns)}"
             )
 
-    def _check_source_value_columns(
-        self, columns: t.List[exp.Column]
-    ) -> ex.UnauthorizedColumnError | None:
-        """
-        Check if the query contains source value or source_concept_id columns.
 
-        Args:
-            columns (list): A list of column expressions.
+class NoStarRule(ValidationRule):
+    """Check that the query selects named columns instead of stars."""
+
+    def check(self, query: ParsedQuery) -> ex.StarNotAllowedError | None:
+        # COUNT(*) does not read any columns
+        stars = [star for star in query.stars if not isinstance(star.parent, exp.Count)]
+        if stars:
+            return ex.StarNotAllowedError(
+                "SELECT * is not allowed. Select only the columns that are needed."
+            )
+
+
+# Suffixes of the source value columns, which are not allowed by default
+SOURCE_VALUE_SUFFIXES = ("_source_value", "_source_concept_id")
 
-        Returns:
-            UnauthorizedColumnError: If source value columns are found.
-        """
 
-        if self.allow_source_value_columns:
-            return None
+class SourceValueColumnsRule(ValidationRule):
+    """Check if the query contains source value or source_concept_id columns."""
 
+    def check(self, query: ParsedQuery) -> ex.UnauthorizedColumnError | None:
         source_value_columns = [
             column.name.lower()
-            for column in columns
-            if column.name.lower().endswith("_source_value")
-            or column.name.lower().endswith("_source_concept_id")
+            for column in query.columns
+            if column.name.lower().endswith(SOURCE_VALUE_SUFFIXES)
         ]
 
         if source_value_columns:
@@ -172,57 +252,354 @@ class SQLValidator:
                 f"Inform the user that this is a security measure to prevent data leakage."
             )
 
-    def validate_sql(self, sql: str):
+
+@dataclass
+class CompiledQuery:
+    """A query compiled for the dialect and schemas of the database."""
+
+    sql: str
+    expression: exp.Expression
+    optimized: bool = False
+
+
+class SQLValidator:
+    def __init__(
+        self,
+        allow_source_value_columns: bool = False,
+        exclude_tables: t.List = None,
+        exclude_columns: t.List = None,
+        from_dialect: str = "postgres",
+        to_dialect: str = "duckdb",
+        rules: t.Optional[t.List[ValidationRule]] = None,
+        cache_size: int = 512,
+        table_schemas: t.Optional[t.Dict[str, str]] = None,
+        optimize: bool = False,
+        star_mode: StarMode = "allow",
+        max_star_columns: t.Optional[int] = None,
+    ):
+        """
+        Initialize the SQLValidator with a list of allowed tables.
+
+        Args:
+            allowed_tables (list): A list of allowed table names for validation.
+            allow_source_values (bool): Flag to allow source values in validation.
+            exclude_tables (list): A list of tables to exclude from validation.
+            exclude_columns (list): A list of columns to exclude from validation.
+            from_dialect (str): The SQL dialect queries are written in.
+            to_dialect (str): The SQL dialect of the database.
+            rules (list): Validation rules to apply. Defaults to the rules built from
+                the other arguments.
+            cache_size (int): Number of parsed queries and validation outcomes to cache.
+            table_schemas (dict): Schema of each table, used to qualify unqualified
+                table references in compiled queries.
+            optimize (bool): Apply predicate pushdown and column pruning to compiled
+                queries.
+            star_mode (str): "allow" stars, "expand" them to the columns of the schema
+                in compiled queries or "reject" queries with stars.
+            max_star_columns (int): Maximum number of output columns of a query whose
+                expanded stars select more columns is rejected.
+        """
+
+        self.allow_source_value_columns: bool = allow_source_value_columns
+        self.exclude_tables: t.List = (
+            list(map(str.lower, exclude_tables)) if exclude_tables is not None else []
+        )
+        self.exclude_columns: t.List = (
+            list(map(str.lower, exclude_columns)) if exclude_columns is not None else []
+        )
+        self.star_mode = star_mode
+        self.max_star_columns = max_star_columns
+        self.rules: t.List[ValidationRule] = (
+            rules if rules is not None else self.default_rules()
+        )
+        self.from_dialect = from_dialect
+        self.to_dialect = to_dialect
+        self.table_schemas = {
+            name.lower(): schema for name, schema in (table_schemas or {}).items()
+        }
+        self.optimize = optimize
+
+        # Rules and settings are fixed after initialisation, so outcomes can be cached
+        self._parse_cache = ResultCache(
+            max_entries=cache_size, max_bytes=None, ttl=None
+        )
+        self._outcome_cache = ResultCache(
+            max_entries=cache_size, max_bytes=None, ttl=None
+        )
+        self._compile_cache = ResultCache(
+            max_entries=cache_size, max_bytes=None, ttl=None
+        )
+
+    def default_rules(self) -> t.List[ValidationRule]:
+        """Build the default validation rules from the validator settings."""
+        rules = [
+            SelectOnlyRule(),
+            HasTablesRule(),
+            HasColumnsRule(),
+            OmopTablesRule(),
+            UnauthorizedTablesRule(self.exclude_tables),
+            UnauthorizedColumnsRule(self.exclude_columns),
+        ]
+        if not self.allow_source_value_columns:
+            rules.append(SourceValueColumnsRule())
+        if self.star_mode == "reject":
+            rules.append(NoStarRule())
+        return rules
+
+    def is_allowed_column(self, column: str) -> bool:
+        """Check that the validation rules allow selecting a column by name."""
+        column = column.lower()
+        if column in self.exclude_columns:
+            return False
+        return self.allow_source_value_columns or not column.endswith(
+            SOURCE_VALUE_SUFFIXES
+        )
+
+    def expand_stars(
+        self, expression: exp.Expression, schema: t.Dict[str, t.Any]
+    ) -> exp.Expression:
+        """
+        Expand the stars of a query to the columns of the schema and drop the columns
+        of subqueries and CTEs that are never used.
+
+        Columns that the validation rules reject when written explicitly, such as the
+        source value columns, are left out of the expansion.
+
+        Args:
+            expression (exp.Expression): The query with qualified tables. It is
+                modified in place.
+            schema (dict): Column types by schema, table and column name.
+
+        Returns:
+            exp.Expression: The query with expanded stars.
+
+        Raises:
+            ex.StarNotAllowedError: If a star of the outer query expands to more than
+                `max_star_columns` columns.
+        """
+        schema = {
+            db: {
+                table: {
+                    column: data_type
+                    for column, data_type in columns.items()
+                    if self.is_allowed_column(column)
+                }
+                for table, columns in tables.items()
+            }
+            for db, tables in schema.items()
+        }
+        original = expression.copy()
+        expanded = pushdown_projections(
+            qualify(
+                expression,
+                schema=schema,
+                dialect=self.from_dialect,
+                expand_stars=True,
+                validate_qualify_columns=False,
+                quote_identifiers=False,
+            )
+        )
+        _restore_output_names(original, expanded)
+
+        if (
+            self.max_star_columns is not None
+            and any(_is_projection_star(node) for node in original.selects)
+            and len(expanded.selects) > self.max_star_columns
+        ):
+            raise ex.StarNotAllowedError(
+                f"SELECT * selects {len(expanded.selects)} columns, more than the "
+                f"limit of {self.max_star_columns}. Select only the columns that are "
+                "needed."
+            )
+        return expanded
+
+    def policy_key(self) -> str:
+        """
+        Identify the rules and settings the validator checks and compiles queries with.
+
+        Results of the same query differ between validators with different policies,
+        so the key is part of the result cache keys.
+
+        Returns:
+            str: A hex digest of the validation and compilation settings.
+        """
+        parts = [
+            str(self.allow_source_value_columns),
+            ",".join(sorted(self.exclude_tables)),
+            ",".join(sorted(self.exclude_columns)),
+            self.star_mode,
+            str(self.max_star_columns),
+            self.from_dialect,
+            self.to_dialect,
+            str(self.optimize),
+            ",".join(f"{k}={v}" for k, v in sorted(self.table_schemas.items())),
+            ",".join(type(rule).__name__ for rule in self.rules),
+        ]
+        return self._hash("\x1f".join(parts))
+
+    @staticmethod
+    def _hash(sql: str) -> str:
+        return hashlib.sha256(sql.encode("utf-8")).hexdigest()
+
+    def parse(self, sql: str) -> ParsedQuery:
+        """
+        Parse the SQL query and collect its tables, columns and stars.
+
+        The result is cached and shared between callers, so the AST must not be
+        modified in place. Use `parsed.copy()` before transforming it.
+
+        Args:
+            sql (str): The SQL query to parse.
+
+        Returns:
+            ParsedQuery: The parsed query.
+
+        Raises:
+            sg.ParseError: If the query cannot be parsed.
+        """
+        key = self._hash(sql)
+        query = self._parse_cache.get(key)
+        if query is None:
+            query = ParsedQuery.from_expression(
+                sql, sg.parse_one(sql, read=self.from_dialect)
+            )
+            self._parse_cache.put(key, query)
+        return query
+
+    def validate_sql(self, sql: str, temp_tables: t.Iterable[str] = ()):
         """
         Validate the SQL query.
 
         Args:
             sql (str): The SQL query to validate.
+            temp_tables (Iterable[str]): Names of temporary tables provided with the
+                query, such as concept sets. Like CTEs, unqualified references to
+                them are not checked against the OMOP tables.
 
         Returns:
             list: A list of errors found during validation. If no errors, returns an empty list.
 
         """
 
+        temp_tables = sorted({name.lower() for name in temp_tables})
+        key = self._hash("\x1f".join([sql, *temp_tables]))
+        cached = self._outcome_cache.get(key)
+        if cached is not None:
+            return list(cached)
+
         errors = []
 
         try:
-            # Parse the SQL query
-            parsed_sql = sg.parse_one(sql)
+            query = self.parse(sql)
+            if temp_tables:
+                # Copy rather than modify the cached query
+                query = dataclasses.replace(
+                    query, cte_names=query.cte_names | set(temp_tables)
+                )
+
+            for rule in self.rules:
+                error = rule.check(query)
+                if error is None:
+                    continue
+                errors.append(error)
+                if rule.fatal:
+                    break
 
-            # Validate the query to ensure it's a SELECT statement
+        except sg.ParseError as e:
+            errors.append(e)
+        except Exception as e:
+            errors.append(e)
 
-            is_not_select_query = self._check_is_select_query(parsed_sql)
-            if is_not_select_query:
-                raise is_not_select_query
+        self._outcome_cache.put(key, errors)
+        return list(errors)
 
-            tables = list(parsed_sql.find_all(exp.Table))
-            columns = list(parsed_sql.find_all(exp.Column))
-            stars = list(parsed_sql.find_all(exp.Star))
-            # joins = parsed_sql.find_all(exp.Join)
-            # where_clauses = parsed_sql.find_all(exp.Where)
+    def compile(
+        self,
+        sql: str,
+        temp_tables: t.Iterable[str] = (),
+        schema: t.Optional[t.Dict[str, t.Any]] = None,
+        schema_version: str = "",
+    ) -> CompiledQuery:
+        """
+        Compile a validated SQL query for the database.
 
-            if not tables:
-                errors.append(ex.TableNotFoundError("No tables found in the query."))
-            if not columns and not stars:
-                errors.append(ex.ColumnNotFoundError("No columns found in the query."))
+        The query is transpiled to the dialect of the database and unqualified
+        references to tables with a known schema are qualified. When a schema is given,
+        stars are expanded if enabled (see `expand_stars`). When optimization is
+        enabled and a schema is given, predicates are pushed down and unused columns
+        pruned. Queries the optimizer cannot handle are compiled without optimization.
 
-            # Check is OMOP table
-            errors.append(self._check_is_omop_table(parsed_sql))
+        Args:
+            sql (str): The SQL query, which must have passed `validate_sql`.
+            temp_tables (Iterable[str]): Names of temporary tables provided with the
+                query, which are not qualified.
+            schema (dict): Column types by schema, table and column name for the
+                optimizer, e.g. {"cdm": {"person": {"person_id": "bigint"}}}.
+            schema_version (str): Identifier of the schema, part of the cache key.
 
-            # Check for excluded tables
-            errors.append(self._check_unauthorized_tables(tables))
+        Returns:
+            CompiledQuery: The compiled query. It is cached and shared between
+                callers, so the expression must not be modified in place.
 
-            # Check for excluded columns
-            errors.append(self._check_unauthorized_columns(columns))
+        Raises:
+            ex.DialectError: If the query uses syntax that the database dialect does
+                not support.
+            ex.StarNotAllowedError: If the stars of the query select too many columns.
+        """
+        temp_tables = sorted({name.lower() for name in temp_tables})
+        key = self._hash("\x1f".join([sql, schema_version, *temp_tables]))
+        compiled = self._compile_cache.get(key)
+        if compiled is not None:
+            return compiled
+
+        query = self.parse(sql)
+        expression = query.parsed.copy()
+        local_tables = query.cte_names | set(temp_tables)
+        for table in expression.find_all(exp.Table):
+            name = table.name.lower()
+            if table.db or name in local_tables or name not in self.table_schemas:
+                continue
+            table.set("db", exp.to_identifier(self.table_schemas[name]))
+
+        if self.star_mode == "expand" and query.stars and schema:
+            try:
+                expression = self.expand_stars(expression.copy(), schema)
+            except ex.StarNotAllowedError:
+                raise
+            except Exception:
+                # Stars over sources that are not in the schema are run as written
+                pass
+
+        optimized = False
+        if self.optimize and schema:
+            try:
+                original = expression
+                expression = optimize(
+                    expression,
+                    schema=schema,
+                    dialect=self.from_dialect,
+                    rules=OPTIMIZER_RULES,
+                )
+                _restore_output_names(original, expression)
+                optimized = True
+            except Exception:
+                # Optimization is best effort, e.g. columns of temporary tables are unknown
+                pass
 
-            # Check for source value columns
-            errors.append(self._check_source_value_columns(columns))
+        try:
+            compiled_sql = expression.sql(
+                dialect=self.to_dialect, unsupported_level=sg.ErrorLevel.RAISE
+            )
+        except sg.errors.UnsupportedError as e:
+            raise ex.DialectError(
+                f"The query cannot be run on {self.to_dialect}: {e}. "
+                f"Write the query in {self.from_dialect} SQL."
+            )
 
-        except sg.ParseError as e:
-            errors.append(e)
-        except Exception as e:
-            errors.append(e)
-        finally:
-            errors = list(filter(None, errors))  # Remove None values from the list
-            return errors
+        compiled = CompiledQuery(
+            sql=compiled_sql,
+            expression=sg.parse_one(compiled_sql, read=self.to_dialect),
+            optimized=optimized,
+        )
+        self._compile_cache.put(key, compiled)
+        return compiled
@@ -0,0 +1,176 @@
+"""Subexpression Reuse Module
+This module materialises the CTEs and derived tables repeated by the queries of a session.
+
+Within one question the agent often defines a cohort in a CTE and repeats it in every
+follow-up query. Each self-contained CTE and subquery in a FROM clause is fingerprinted
+by its canonical SQL. Once a fingerprint has been seen more than once in a session, the
+result of the subexpression is materialised as an Arrow table and the queries are
+rewritten to read the table instead of computing the subexpression again. The tables
+are made available to the queries as temporary tables, like concept sets.
+"""
+
+import threading
+import typing as t
+from dataclasses import dataclass
+
+import pyarrow as pa
+import sqlglot.expressions as exp
+
+from .cache import ResultCache, make_cache_key
+
+TABLE_PREFIX = "_cse_"
+
+# Subexpressions whose result changes between runs are never reused
+_NONDETERMINISTIC = (
+    exp.Rand,
+    exp.Uuid,
+    exp.CurrentDate,
+    exp.CurrentDatetime,
+    exp.CurrentTime,
+    exp.CurrentTimestamp,
+)
+
+
+@dataclass
+class Subexpression:
+    """A reusable subquery of a parsed query."""
+
+    fingerprint: str
+    body: exp.Query
+
+    @property
+    def table_name(self) -> str:
+        """Name of the temporary table holding the result of the subexpression."""
+        return f"{TABLE_PREFIX}{self.fingerprint[:16]}"
+
+
+def _is_reusable(body: exp.Expression, local_tables: t.Set[str]) -> bool:
+    """Check if a subquery is self-contained, deterministic and worth materialising."""
+    if not isinstance(body, exp.Query):
+        return False
+    for table in body.find_all(exp.Table):
+        # References to CTEs or temporary tables depend on the rest of the query
+        if not table.db and table.name.lower() in local_tables:
+            return False
+    if body.find(*_NONDETERMINISTIC):
+        return False
+    if body.args.get("limit") and not body.args.get("order"):
+        return False
+    # A plain projection of a table is cheaper to scan than to materialise
+    return body.find(exp.Join, exp.Where, exp.Group, exp.Subquery) is not None
+
+
+def find_subexpressions(
+    parsed: exp.Expression, temp_tables: t.Iterable[str] = ()
+) -> t.List[Subexpression]:
+    """
+    Find the reusable CTEs and derived tables of a query, outermost first.
+
+    Args:
+        parsed (exp.Expression): The parsed query.
+        temp_tables (Iterable[str]): Names of the temporary tables of the query.
+
+    Returns:
+        List[Subexpression]: The reusable subexpressions.
+    """
+    local_tables = {name.lower() for name in temp_tables}
+    local_tables |= {cte.alias_or_name.lower() for cte in parsed.find_all(exp.CTE)}
+
+    subexpressions = []
+    for node in parsed.find_all(exp.CTE, exp.Subquery, bfs=True):
+        if isinstance(node, exp.CTE):
+            with_ = node.parent
+            if isinstance(with_, exp.With) and with_.args.get("recursive"):
+                continue
+        elif not isinstance(node.parent, (exp.From, exp.Join)) or node.args.get(
+            "lateral"
+        ):
+            continue
+
+        body = node.this
+        if _is_reusable(body, local_tables):
+            subexpressions.append(Subexpression(make_cache_key(body), body))
+    return subexpressions
+
+
+class SubexpressionStore:
+    """
+    The materialised subexpressions of one session and how often each was seen.
+    """
+
+    def __init__(
+        self,
+        min_uses: int = 2,
+        max_tables: int = 32,
+        max_bytes: t.Optional[int] = 256 * 1024 * 1024,
+        ttl: t.Optional[float] = 3600.0,
+    ):
+        """
+        Initialize the SubexpressionStore.
+
+        Args:
+            min_uses (int): Number of times a subexpression is seen before its result
+                is materialised.
+            max_tables (int): Maximum number of materialised subexpressions.
+            max_bytes (int): Maximum total size of the materialised results.
+            ttl (float): Seconds after which a materialised result is dropped.
+        """
+        self.min_uses = min_uses
+        self.tables = ResultCache(max_entries=max_tables, max_bytes=max_bytes, ttl=ttl)
+        self._uses = ResultCache(max_entries=max_tables * 32, max_bytes=None, ttl=ttl)
+        # Subexpressions whose results could not be materialised or stored
+        self._rejected = ResultCache(
+            max_entries=max_tables * 32, max_bytes=None, ttl=ttl
+        )
+        self._lock = threading.Lock()
+
+    def _count_use(self, fingerprint: str) -> int:
+        with self._lock:
+            uses = (self._uses.get(fingerprint) or 0) + 1
+            self._uses.put(fingerprint, uses)
+            return uses
+
+    def rewrite(
+        self,
+        parsed: exp.Expression,
+        materialize: t.Callable[[exp.Query], t.Optional[pa.Table]],
+        temp_tables: t.Iterable[str] = (),
+    ) -> t.Tuple[exp.Expression, t.Dict[str, pa.Table]]:
+        """
+        Replace the repeated subexpressions of a query by their materialised results.
+
+        Args:
+            parsed (exp.Expression): The parsed query. It is copied and not modified.
+            materialize (Callable): Run a subexpression and return its result, or None
+                if the result cannot be materialised, e.g. because it is too large.
+            temp_tables (Iterable[str]): Names of the temporary tables of the query.
+
+        Returns:
+            Tuple[exp.Expression, Dict[str, pa.Table]]: The rewritten query and the
+                tables it reads by name.
+        """
+        rewritten = parsed.copy()
+        tables: t.Dict[str, pa.Table] = {}
+        for subexpression in find_subexpressions(rewritten, temp_tables):
+            # Subexpressions inside an already replaced subexpression are detached
+            if subexpression.body.root() is not rewritten:
+                continue
+            fingerprint = subexpression.fingerprint
+            if self._count_use(fingerprint) < self.min_uses:
+                continue
+            if self._rejected.get(fingerprint):
+                continue
+
+            table = self.tables.get(fingerprint)
+            if table is None:
+                table = materialize(subexpression.body)
+                if table is None:
+                    self._rejected.put(fingerprint, True)
+                    continue
+                if not self.tables.put(fingerprint, table):
+                    self._rejected.put(fingerprint, True)
+
+            name = subexpression.table_name
+            subexpression.body.replace(exp.select("*").from_(name))
+            tables[name] = table
+        return rewritten, tables
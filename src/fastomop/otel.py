@@ -1,20 +1,57 @@
 """Settings for the FastOMOP OpenTelemetry integration."""
 
 # This currently uses Langfuse OpenTelemetry for FastOMOP.
+# The client is created on first use, so that importing FastOMOP neither imports
+# Langfuse nor connects to it.
 
-from langfuse import Langfuse
+import threading
+from typing import TYPE_CHECKING, Any, Optional
 
-from fastomop.config import config as cfg
+if TYPE_CHECKING:
+    from langfuse import Langfuse
 
-tracer = Langfuse(
-    public_key=cfg.tracer.public_key,
-    secret_key=cfg.tracer.secret_key,
-    host=cfg.tracer.host,
-)
+_tracer: Optional["Langfuse"] = None
+_tracer_lock = threading.Lock()
 
 
-# Verify connection
-if tracer.auth_check():
-    print("Langfuse client is authenticated and ready!")
-else:
-    print("Authentication failed. Please check your credentials and host.")
+def _auth_check(tracer: "Langfuse") -> None:
+    """Verify the connection to Langfuse."""
+    # Prompts are served from the local prompt cache when Langfuse is unreachable, so
+    # a failed check is not fatal.
+    try:
+        if tracer.auth_check():
+            print("Langfuse client is authenticated and ready!")
+        else:
+            print("Authentication failed. Please check your credentials and host.")
+    except Exception as e:
+        print(f"Langfuse is unreachable, using cached prompts: {e}")
+
+
+def get_tracer() -> "Langfuse":
+    """Get the Langfuse client, creating it on first use."""
+    global _tracer
+    with _tracer_lock:
+        if _tracer is None:
+            from langfuse import Langfuse
+
+            from fastomop.config import get_config
+
+            cfg = get_config()
+            _tracer = Langfuse(
+                public_key=cfg.tracer.public_key,
+                secret_key=cfg.tracer.secret_key,
+                host=cfg.tracer.host,
+            )
+            # Verify the connection without delaying startup
+            threading.Thread(
+                target=_auth_check, args=(_tracer,), name="langfuse-auth", daemon=True
+            ).start()
+            print("FastOMOP initialized with OpenTelemetry support.")
+    return _tracer
+
+
+def __getattr__(name: str) -> Any:
+    # `tracer` is created on first access
+    if name == "tracer":
+        return get_tracer()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,8 +1,11 @@
 """Module for initial loading of prompts to Langfuse"""
 # This currently needs to be called manually once to bootstrap the prompt database with the initial prompts.
 
-from fastomop.config import config as cfg
-from fastomop.otel import tracer
+from fastomop.config import get_config
+from fastomop.otel import get_tracer
+
+cfg = get_config()
+tracer = get_tracer()
 
 # Bootstrap/update Langfuse prompt database
 # ToDo: Add logging and error handling
@@ -0,0 +1,268 @@
+"""Prompt Registry Module
+This module keeps the prompts of the agents in a local cache in front of Langfuse.
+
+The first use of a prompt fetches it from the prompt server, waiting at most the fetch
+timeout. Prompts are then served from memory. Once a prompt is older than the cache
+TTL, the stale version is still returned and a background thread fetches the latest
+version, so a query never waits for the prompt server again. Fetched prompts are written
+to a JSON file. When the first fetch fails, the prompt saved in the file is used, or
+else the prompt in `config.toml`, so that the application also starts when the prompt
+server is slow or unreachable.
+"""
+
+import functools
+import json
+import os
+import tempfile
+import threading
+import time
+import typing as t
+from dataclasses import dataclass
+
+from langfuse.model import TemplateParser
+
+from fastomop.config import FastOMOPSettings, get_config
+from fastomop.otel import get_tracer
+
+PromptSource = t.Literal["server", "file", "config"]
+
+# Sections of the configuration holding agent prompts, and the prompt kinds
+AGENT_SECTIONS = ("supervisor_agent", "sql_agent", "semantic_agent")
+PROMPT_KINDS = ("system_prompt", "user_prompt")
+
+
+@dataclass
+class CachedPrompt:
+    """A prompt template and when it was last checked against the prompt server."""
+
+    template: str
+    source: PromptSource
+    # time.monotonic() of the last fetch, None if the prompt was never fetched
+    checked_at: t.Optional[float] = None
+
+
+def config_prompts(settings: FastOMOPSettings) -> t.Dict[str, str]:
+    """
+    Get the prompts of the agents in the configuration.
+
+    Every prompt is available as "<Agent Name>/<kind>" and "<section>.<kind>", e.g.
+    "Semantic Agent/user_prompt" and "semantic_agent.user_prompt".
+
+    Args:
+        settings (FastOMOPSettings): The configuration.
+
+    Returns:
+        Dict[str, str]: Prompt templates by name.
+    """
+    prompts = {}
+    for section in AGENT_SECTIONS:
+        agent = getattr(settings, section)
+        for kind in PROMPT_KINDS:
+            template = getattr(agent, kind)
+            prompts[f"{agent.agent_name}/{kind}"] = template
+            prompts[f"{section}.{kind}"] = template
+    return prompts
+
+
+class PromptRegistry:
+    """
+    In-process prompt cache with stale-while-revalidate refresh, falling back to a file
+    and to seed prompts when the prompt server is unreachable.
+    """
+
+    def __init__(
+        self,
+        fetch: t.Callable[[str], str],
+        seeds: t.Optional[t.Dict[str, str]] = None,
+        cache_path: t.Optional[str] = None,
+        ttl: float = 300.0,
+    ):
+        """
+        Initialize the PromptRegistry.
+
+        Args:
+            fetch (Callable[[str], str]): Fetch the latest template of a prompt by name
+                from the prompt server.
+            seeds (Dict[str, str]): Templates used when a prompt cannot be fetched.
+            cache_path (str): JSON file the fetched prompts are saved to and loaded
+                from when they cannot be fetched, taking precedence over the seeds.
+                None disables the file.
+            ttl (float): Seconds after which a prompt is refreshed in the background.
+        """
+        self.fetch = fetch
+        self.cache_path = cache_path
+        self.ttl = ttl
+
+        self._lock = threading.Lock()
+        self._refreshing: t.Set[str] = set()
+        self._prompts: t.Dict[str, CachedPrompt] = {
+            name: CachedPrompt(template, "config")
+            for name, template in (seeds or {}).items()
+        }
+
+        for name, template in self._load_file().items():
+            self._prompts[name] = CachedPrompt(template, "file")
+
+    def _is_stale(self, prompt: CachedPrompt) -> bool:
+        if prompt.checked_at is None:
+            return True
+        return time.monotonic() - prompt.checked_at > self.ttl
+
+    def get(self, name: str) -> str:
+        """
+        Get the template of a prompt.
+
+        The first use of a prompt fetches it, falling back to the saved or seeded
+        template if the fetch fails. Later uses return the cached template
+        immediately, refreshing stale ones in the background.
+
+        Args:
+            name (str): The prompt name.
+
+        Returns:
+            str: The prompt template.
+
+        Raises:
+            Exception: If an unknown prompt cannot be fetched from the prompt server.
+        """
+        with self._lock:
+            prompt = self._prompts.get(name)
+        if prompt is None:
+            return self.refresh(name)
+
+        if prompt.checked_at is None:
+            # Saved and seeded prompts may be outdated, and agents compile their
+            # system prompt once, so the first use waits for the prompt server
+            try:
+                return self.refresh(name)
+            except Exception as e:
+                version = "saved" if prompt.source == "file" else "configured"
+                print(
+                    f"Failed to fetch prompt {name}, using the {version} version: {e}"
+                )
+                return prompt.template
+
+        if self._is_stale(prompt):
+            self._refresh_in_background(name)
+        return prompt.template
+
+    def compile(self, name: str, **variables: t.Any) -> str:
+        """
+        Get a prompt with its {{variables}} replaced.
+
+        Args:
+            name (str): The prompt name.
+            **variables: Values of the variables in the template.
+
+        Returns:
+            str: The compiled prompt.
+        """
+        return TemplateParser.compile_template(self.get(name), variables)
+
+    def refresh(self, name: str) -> str:
+        """
+        Fetch the latest template of a prompt and update the cache and the file.
+
+        Args:
+            name (str): The prompt name.
+
+        Returns:
+            str: The prompt template.
+        """
+        try:
+            template = self.fetch(name)
+        except Exception:
+            with self._lock:
+                # Keep serving the cached prompt and retry after the TTL
+                if name in self._prompts:
+                    self._prompts[name].checked_at = time.monotonic()
+            raise
+
+        with self._lock:
+            previous = self._prompts.get(name)
+            self._prompts[name] = CachedPrompt(template, "server", time.monotonic())
+        if (
+            previous is None
+            or previous.source == "config"
+            or (previous.template != template)
+        ):
+            self._save_file()
+        return template
+
+    def _refresh_in_background(self, name: str) -> None:
+        """Refresh a prompt in a daemon thread, unless it is already refreshing."""
+        with self._lock:
+            if name in self._refreshing:
+                return
+            self._refreshing.add(name)
+
+        def run():
+            try:
+                self.refresh(name)
+            except Exception as e:
+                print(f"Failed to refresh prompt {name}, using the cached version: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(name)
+
+        threading.Thread(target=run, name=f"prompt-refresh-{name}", daemon=True).start()
+
+    def _load_file(self) -> t.Dict[str, str]:
+        """Load the saved prompt templates, ignoring a missing or unreadable file."""
+        if not self.cache_path:
+            return {}
+        try:
+            with open(self.cache_path) as f:
+                prompts = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if not isinstance(prompts, dict):
+            return {}
+        return {k: v for k, v in prompts.items() if isinstance(v, str)}
+
+    def _save_file(self) -> None:
+        """Atomically write the fetched prompt templates to the file."""
+        if not self.cache_path:
+            return
+        with self._lock:
+            prompts = {
+                name: p.template
+                for name, p in self._prompts.items()
+                if p.source != "config"
+            }
+
+        directory = os.path.dirname(os.path.abspath(self.cache_path))
+        try:
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".prompts-")
+            with os.fdopen(fd, "w") as f:
+                json.dump(prompts, f, indent=2, sort_keys=True)
+            os.replace(tmp_path, self.cache_path)
+        except OSError as e:
+            print(f"Failed to save prompts to {self.cache_path}: {e}")
+
+
+def fetch_langfuse_prompt(name: str) -> str:
+    """Fetch the latest template of a text prompt from Langfuse."""
+    cfg = get_config()
+    prompt_client = get_tracer().get_prompt(
+        name,
+        label=cfg.prompts.label,
+        # Caching is done by the registry
+        cache_ttl_seconds=0,
+        max_retries=0,
+        fetch_timeout_seconds=cfg.prompts.fetch_timeout,
+    )
+    return prompt_client.prompt  # type: ignore
+
+
+@functools.cache
+def get_prompt_registry() -> PromptRegistry:
+    """Get the registry of the configured prompts, creating it on first use."""
+    cfg = get_config()
+    return PromptRegistry(
+        fetch=fetch_langfuse_prompt,
+        seeds=config_prompts(cfg),
+        cache_path=cfg.prompts.cache_path,
+        ttl=cfg.prompts.cache_ttl,
+    )
@@ -0,0 +1,107 @@
+import pytest
+
+from fastomop.agents.answer_cache import AnswerCache, question_terms
+
+# Thresholds of the default configuration
+ANSWER_THRESHOLD = 0.9
+SQL_THRESHOLD = 0.75
+
+
+def score(cached: str, question: str) -> float:
+    cache = AnswerCache()
+    cache.add(cached, "v1", "answer")
+    match = cache.lookup(question, "v1")
+    return match.score if match else 0.0
+
+
+@pytest.mark.parametrize(
+    "cached, question",
+    [
+        (
+            "How many women have diabetes?",
+            "Number of female patients with diabetes",
+        ),
+        ("How many patients are older than 65?", "How many people are above 65?"),
+        (
+            "What is the average age of patients with diabetes?",
+            "What is the mean age of people with diabetes?",
+        ),
+        ("How many people have hypertension?", "How many persons have hypertension?"),
+    ],
+)
+def test_paraphrases_are_served_the_answer(cached, question):
+    assert score(cached, question) >= ANSWER_THRESHOLD
+
+
+@pytest.mark.parametrize(
+    "cached, question",
+    [
+        ("How many patients are over 65?", "How many patients are under 65?"),
+        ("How many patients are older than 65?", "How many patients are under 65?"),
+        (
+            "How many patients had a visit before 2020?",
+            "How many patients had a visit after 2020?",
+        ),
+        ("What is the maximum age?", "What is the minimum age?"),
+        (
+            "How many patients have type 2 diabetes?",
+            "How many patients have type 1 diabetes?",
+        ),
+        ("How many patients have diabetes?", "How many patients do not have diabetes?"),
+    ],
+)
+def test_questions_differing_in_a_guard_term_are_not_similar(cached, question):
+    assert score(cached, question) == 0.0
+
+
+@pytest.mark.parametrize(
+    "cached, question",
+    [
+        ("How many patients have diabetes?", "How many patients died of diabetes?"),
+        ("How many patients have asthma?", "How many patients have asthma and COPD?"),
+    ],
+)
+def test_questions_with_an_extra_condition_are_not_served_the_answer(cached, question):
+    assert score(cached, question) < ANSWER_THRESHOLD
+
+
+def test_unrelated_questions_are_below_the_sql_threshold():
+    assert (
+        score("How many patients have diabetes?", "How many patients have asthma?")
+        < SQL_THRESHOLD
+    )
+
+
+def test_question_terms_drop_stop_words_and_map_synonyms():
+    assert question_terms("How many persons are older than 65?") == (
+        "count",
+        "over",
+        "65",
+    )
+
+
+def test_answers_of_other_cdm_versions_are_dropped():
+    cache = AnswerCache()
+    cache.add("How many patients have diabetes?", "v1", "42")
+
+    assert cache.lookup("How many patients have diabetes?", "v2") is None
+    assert len(cache) == 0
+
+
+def test_least_recently_used_answer_is_evicted():
+    cache = AnswerCache(max_entries=2)
+    cache.add("How many patients have diabetes?", "v1", "1")
+    cache.add("How many patients have asthma?", "v1", "2")
+    cache.lookup("How many patients have diabetes?", "v1")
+    cache.add("How many patients have hypertension?", "v1", "3")
+
+    assert len(cache) == 2
+    match = cache.lookup("How many patients have asthma?", "v1")
+    assert match is None or match.score < 1.0
+
+
+def test_expired_answers_are_not_served():
+    cache = AnswerCache(ttl=0)
+    cache.add("How many patients have diabetes?", "v1", "42")
+
+    assert cache.lookup("How many patients have diabetes?", "v1") is None
@@ -0,0 +1,95 @@
+import asyncio
+import threading
+import time
+
+import ibis
+import pytest
+
+from fastomop.mcp.sql import exceptions as ex
+from fastomop.mcp.sql.executor import CancellationToken, DatabaseExecutor
+from fastomop.mcp.sql.pool import interrupt_connection
+
+
+def test_on_cancel_raises_if_already_cancelled():
+    token = CancellationToken()
+    token.cancel()
+
+    with pytest.raises(ex.QueryCancelledError):
+        with token.on_cancel(lambda: None):
+            pass
+
+
+def test_on_cancel_runs_the_callback_when_cancelled():
+    token = CancellationToken()
+    called = threading.Event()
+
+    with token.on_cancel(called.set):
+        token.cancel()
+    assert called.is_set()
+
+
+def test_on_cancel_converts_errors_after_cancellation():
+    token = CancellationToken()
+
+    with pytest.raises(ex.QueryCancelledError) as info:
+        with token.on_cancel(lambda: None):
+            token.cancel()
+            raise RuntimeError("INTERRUPT Error: Interrupted!")
+    assert isinstance(info.value.__cause__, RuntimeError)
+
+
+def test_on_cancel_keeps_errors_without_cancellation():
+    token = CancellationToken()
+
+    with pytest.raises(ValueError):
+        with token.on_cancel(lambda: None):
+            raise ValueError("syntax error")
+
+
+def test_interrupted_duckdb_query_is_cancelled():
+    conn = ibis.duckdb.connect()
+    token = CancellationToken()
+    timer = threading.Timer(0.2, token.cancel)
+    timer.start()
+    try:
+        with pytest.raises(ex.QueryCancelledError):
+            with token.on_cancel(lambda: interrupt_connection(conn)):
+                reader = conn.to_pyarrow_batches(
+                    conn.sql("select sum(hash(i)) as n from range(20000000000) t(i)")
+                )
+                reader.read_all()
+    finally:
+        timer.cancel()
+        conn.disconnect()
+
+
+def test_cancelled_call_counts_until_its_worker_finishes():
+    executor = DatabaseExecutor(max_workers=1, max_queue=0)
+    release = threading.Event()
+    started = threading.Event()
+
+    def blocking(token):
+        # Ignores the token, like a backend that cannot be interrupted
+        started.set()
+        release.wait(5)
+
+    async def run():
+        task = asyncio.create_task(executor.run(blocking))
+        await asyncio.to_thread(started.wait, 5)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+        assert executor.pending == 1
+        with pytest.raises(ex.ServerBusyError):
+            await executor.run(lambda token: None)
+
+    try:
+        asyncio.run(run())
+    finally:
+        release.set()
+    deadline = time.monotonic() + 5
+    while executor.pending:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    executor.shutdown()
@@ -0,0 +1,44 @@
+import ibis
+import pytest
+
+from fastomop.mcp.sql import exceptions as ex
+from fastomop.mcp.sql.guard import QueryGuard, explain
+
+
+@pytest.fixture
+def conn():
+    conn = ibis.duckdb.connect()
+    conn.raw_sql("create table big as select range as id from range(1000000)")
+    conn.raw_sql("create table small as select range as id from range(2000)")
+    yield conn
+    conn.disconnect()
+
+
+@pytest.mark.parametrize(
+    "sql",
+    [
+        "select * from big",
+        "select count(*) from big",
+        "select b.id from big b join small s on b.id = s.id",
+    ],
+)
+def test_scans_and_selective_joins_are_not_limited(conn, sql):
+    guard = QueryGuard(max_estimated_rows=1000)
+
+    assert explain(conn, sql).rows == 0
+    assert guard.check(conn, sql) == guard.timeout
+
+
+def test_cross_join_is_rejected(conn):
+    guard = QueryGuard(max_estimated_rows=1_000_000)
+
+    with pytest.raises(ex.QueryCostExceededError) as info:
+        guard.check(conn, "select count(*) from small a, small b")
+    assert info.value.details["cross_products"] == 1
+
+
+def test_cross_join_is_downgraded(conn):
+    guard = QueryGuard(max_estimated_rows=1_000_000, mode="downgrade")
+
+    timeout = guard.check(conn, "select count(*) from small a, small b")
+    assert timeout == guard.downgraded_timeout
@@ -0,0 +1,188 @@
+import asyncio
+
+import anyio
+import pytest
+from pydantic_ai import Agent
+from pydantic_ai.models.test import TestModel
+from pydantic_ai.toolsets import FunctionToolset
+
+from fastomop.agents import mcp_sessions
+from fastomop.agents.mcp_sessions import MCPSessionManager
+from fastomop.config import MCPServerSettings
+
+
+class FakeServer:
+    """MCP server client failing its calls while the factory says so."""
+
+    def __init__(self, factory, number):
+        self.factory = factory
+        self.number = number
+        self.open = False
+
+        def List_Tables() -> str:
+            """List the tables."""
+            return ""
+
+        self.tools = FunctionToolset([List_Tables])
+
+    async def __aenter__(self):
+        if self.factory.start_error is not None:
+            raise self.factory.start_error
+        self.open = True
+        return self
+
+    async def __aexit__(self, *args):
+        self.open = False
+
+    async def get_tools(self, ctx):
+        assert self.open
+        return await self.tools.get_tools(ctx)
+
+    async def call_tool(self, name, tool_args, ctx, tool):
+        return await self.direct_call_tool(name, tool_args)
+
+    async def direct_call_tool(self, name, args):
+        assert self.open
+        error = self.factory.errors.pop(0) if self.factory.errors else None
+        if error is not None:
+            raise error
+        await asyncio.sleep(0)
+        return f"{name} from server {self.number}"
+
+
+class FakeServers:
+    """Creates the fake servers and decides which calls fail."""
+
+    def __init__(self):
+        self.servers = []
+        self.errors = []
+        self.start_error = None
+
+    def __call__(self, settings):
+        server = FakeServer(self, len(self.servers) + 1)
+        self.servers.append(server)
+        return server
+
+
+@pytest.fixture
+def servers(monkeypatch):
+    servers = FakeServers()
+    monkeypatch.setattr(mcp_sessions, "create_mcp_server", servers)
+    return servers
+
+
+def manager(max_restarts=3):
+    return MCPSessionManager([MCPServerSettings(name="sql", max_restarts=max_restarts)])
+
+
+def test_agents_share_one_session(servers):
+    async def run():
+        sessions = manager()
+        toolset = sessions.toolset("sql")
+        assert sessions.toolset("sql") is toolset
+        async with toolset:
+            pass
+        results = await asyncio.gather(
+            *(toolset.direct_call_tool("List_Tables", {}) for _ in range(5))
+        )
+        await sessions.close()
+        return results
+
+    results = asyncio.run(run())
+    assert results == ["List_Tables from server 1"] * 5
+    assert len(servers.servers) == 1
+    assert not servers.servers[0].open
+
+
+def test_unknown_server_has_no_toolset():
+    assert manager().toolset("other") is None
+
+
+def test_broken_session_is_restarted_and_the_call_retried(servers):
+    async def run():
+        sessions = manager()
+        toolset = sessions.toolset("sql")
+        await toolset.direct_call_tool("List_Tables", {})
+        servers.errors = [anyio.ClosedResourceError()]
+        result = await toolset.direct_call_tool("List_Tables", {})
+        await sessions.close()
+        return result
+
+    assert asyncio.run(run()) == "List_Tables from server 2"
+    assert len(servers.servers) == 2
+    # The broken session was closed by the task that opened it
+    assert not servers.servers[0].open
+
+
+def test_other_errors_do_not_restart_the_session(servers):
+    async def run():
+        sessions = manager()
+        toolset = sessions.toolset("sql")
+        servers.errors = [ValueError("invalid arguments")]
+        with pytest.raises(ValueError):
+            await toolset.direct_call_tool("List_Tables", {})
+        result = await toolset.direct_call_tool("List_Tables", {})
+        await sessions.close()
+        return result
+
+    assert asyncio.run(run()) == "List_Tables from server 1"
+    assert len(servers.servers) == 1
+
+
+def test_restarts_are_limited_until_a_call_succeeds(servers):
+    async def run():
+        sessions = manager(max_restarts=2)
+        toolset = sessions.toolset("sql")
+        servers.errors = [anyio.ClosedResourceError()] * 6
+        with pytest.raises(anyio.ClosedResourceError):
+            await toolset.direct_call_tool("List_Tables", {})
+        with pytest.raises(anyio.ClosedResourceError):
+            await toolset.direct_call_tool("List_Tables", {})
+        with pytest.raises(ConnectionError):
+            await toolset.direct_call_tool("List_Tables", {})
+        started = len(servers.servers)
+
+        # The server recovers, a later call starts a new session
+        servers.errors = []
+        recovered = await toolset.direct_call_tool("List_Tables", {})
+        # The successful call reset the restart count
+        servers.errors = [anyio.ClosedResourceError()]
+        restarted = await toolset.direct_call_tool("List_Tables", {})
+        await sessions.close()
+        return started, recovered, restarted
+
+    started, recovered, restarted = asyncio.run(run())
+    assert started == 3
+    assert recovered == "List_Tables from server 4"
+    assert restarted == "List_Tables from server 5"
+    assert not any(server.open for server in servers.servers)
+
+
+def test_session_that_fails_to_start_is_started_again(servers):
+    async def run():
+        sessions = manager()
+        toolset = sessions.toolset("sql")
+        servers.start_error = ConnectionError("server not running")
+        with pytest.raises(ConnectionError):
+            await toolset.direct_call_tool("List_Tables", {})
+        servers.start_error = None
+        result = await toolset.direct_call_tool("List_Tables", {})
+        await sessions.close()
+        return result
+
+    assert asyncio.run(run()) == "List_Tables from server 2"
+
+
+def test_agent_calls_are_retried_on_a_new_session(servers):
+    async def run():
+        sessions = manager()
+        agent = Agent(
+            TestModel(call_tools=["List_Tables"]), toolsets=[sessions.toolset("sql")]
+        )
+        servers.errors = [anyio.ClosedResourceError()]
+        result = await agent.run("Which tables are there?")
+        await sessions.close()
+        return result.output
+
+    assert "List_Tables from server 2" in asyncio.run(run())
+    assert len(servers.servers) == 2
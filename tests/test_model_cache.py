@@ -0,0 +1,128 @@
+import asyncio
+
+import pytest
+from pydantic_ai.messages import (
+    ModelRequest,
+    ModelResponse,
+    TextPart,
+    ToolCallPart,
+    ToolReturnPart,
+    UserPromptPart,
+)
+from pydantic_ai.models import ModelRequestParameters
+from pydantic_ai.models.function import FunctionModel
+
+from fastomop.agents.model_cache import (
+    CachingModel,
+    ModelCacheMissError,
+    ModelResponseStore,
+    make_request_key,
+)
+
+PARAMETERS = ModelRequestParameters(function_tools=[], output_tools=[])
+
+
+class CountingModel(FunctionModel):
+    """Model answering every call with the number of the call."""
+
+    def __init__(self):
+        self.calls = 0
+        super().__init__(self.answer, model_name="counting")
+
+    def answer(self, messages, info):
+        self.calls += 1
+        return ModelResponse(parts=[TextPart(f"answer {self.calls}")])
+
+
+def prompt(text):
+    return [ModelRequest(parts=[UserPromptPart(text)])]
+
+
+def request(model, messages):
+    response = asyncio.run(model.request(messages, None, PARAMETERS))
+    return response.parts[0].content
+
+
+def caching_model(tmp_path, mode="cache", ttl=None):
+    wrapped = CountingModel()
+    store = ModelResponseStore(tmp_path, ttl=ttl)
+    return wrapped, CachingModel(wrapped, store, mode)
+
+
+def test_repeated_call_is_served_from_the_cache(tmp_path):
+    wrapped, model = caching_model(tmp_path)
+
+    assert request(model, prompt("How many patients?")) == "answer 1"
+    assert request(model, prompt("How many patients?")) == "answer 1"
+    assert wrapped.calls == 1
+    assert (model.hits, model.misses) == (1, 1)
+
+
+def test_different_call_misses_the_cache(tmp_path):
+    wrapped, model = caching_model(tmp_path)
+
+    request(model, prompt("How many patients?"))
+    assert request(model, prompt("How many visits?")) == "answer 2"
+    assert wrapped.calls == 2
+
+
+def test_expired_response_is_not_served(tmp_path):
+    wrapped, model = caching_model(tmp_path, ttl=0)
+
+    request(model, prompt("How many patients?"))
+    assert request(model, prompt("How many patients?")) == "answer 2"
+
+
+def test_record_mode_always_calls_the_model(tmp_path):
+    wrapped, model = caching_model(tmp_path, mode="record")
+
+    request(model, prompt("How many patients?"))
+    request(model, prompt("How many patients?"))
+    assert wrapped.calls == 2
+
+
+def test_replay_serves_recorded_responses_and_raises_on_a_miss(tmp_path):
+    _, recorder = caching_model(tmp_path, mode="record")
+    request(recorder, prompt("How many patients?"))
+    wrapped, model = caching_model(tmp_path, mode="replay")
+
+    assert request(model, prompt("How many patients?")) == "answer 1"
+    with pytest.raises(ModelCacheMissError):
+        request(model, prompt("How many visits?"))
+    assert wrapped.calls == 0
+
+
+def tool_messages(args, content, call_id="call_1"):
+    return [
+        *prompt("How many patients?"),
+        ModelResponse(parts=[ToolCallPart("Select_Query", args, call_id)]),
+        ModelRequest(parts=[ToolReturnPart("Select_Query", content, call_id)]),
+    ]
+
+
+def key(messages):
+    return make_request_key(CountingModel(), messages, None, PARAMETERS)
+
+
+def test_message_timestamps_and_tool_call_ids_do_not_change_the_key():
+    first = tool_messages({"query": "select 1"}, {"rows": 1}, call_id="a")
+    second = tool_messages({"query": "select 1"}, {"rows": 1}, call_id="b")
+
+    assert key(first) == key(second)
+
+
+@pytest.mark.parametrize(
+    "first, second",
+    [
+        (
+            tool_messages({"query": "q", "timestamp": "2020"}, {"rows": 1}),
+            tool_messages({"query": "q", "timestamp": "2021"}, {"rows": 1}),
+        ),
+        (
+            tool_messages({"query": "q"}, {"usage": 1, "model_name": "a"}),
+            tool_messages({"query": "q"}, {"usage": 2, "model_name": "b"}),
+        ),
+    ],
+)
+def test_tool_data_is_part_of_the_key(first, second):
+    assert key(first) != key(second)
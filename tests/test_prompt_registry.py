@@ -0,0 +1,113 @@
+import json
+import threading
+import time
+
+import pytest
+
+from fastomop.prompts.registry import PromptRegistry
+
+
+class StubFetch:
+    """Prompt server serving fixed templates, or failing."""
+
+    def __init__(self, templates=None, error=None):
+        self.templates = dict(templates or {})
+        self.error = error
+        self.calls = []
+        self.called = threading.Event()
+
+    def __call__(self, name):
+        self.calls.append(name)
+        self.called.set()
+        if self.error is not None:
+            raise self.error
+        return self.templates[name]
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not met in time"
+        time.sleep(0.01)
+
+
+def test_first_use_fetches_instead_of_the_seed(tmp_path):
+    fetch = StubFetch({"agent/system_prompt": "SERVER"})
+    registry = PromptRegistry(
+        fetch,
+        seeds={"agent/system_prompt": "CONFIG"},
+        cache_path=str(tmp_path / "prompts.json"),
+    )
+
+    assert registry.get("agent/system_prompt") == "SERVER"
+    assert fetch.calls == ["agent/system_prompt"]
+    saved = json.loads((tmp_path / "prompts.json").read_text())
+    assert saved == {"agent/system_prompt": "SERVER"}
+
+
+def test_seed_is_the_fallback_when_the_fetch_fails():
+    fetch = StubFetch(error=TimeoutError("unreachable"))
+    registry = PromptRegistry(fetch, seeds={"agent/system_prompt": "CONFIG"})
+
+    assert registry.get("agent/system_prompt") == "CONFIG"
+    # The failed fetch is retried in the background after the TTL, not on every use
+    assert registry.get("agent/system_prompt") == "CONFIG"
+    assert fetch.calls == ["agent/system_prompt"]
+
+
+def test_saved_prompt_is_the_fallback_before_the_seed(tmp_path):
+    cache_path = tmp_path / "prompts.json"
+    cache_path.write_text(json.dumps({"agent/system_prompt": "FILE"}))
+    fetch = StubFetch(error=ConnectionError("unreachable"))
+    registry = PromptRegistry(
+        fetch, seeds={"agent/system_prompt": "CONFIG"}, cache_path=str(cache_path)
+    )
+
+    assert registry.get("agent/system_prompt") == "FILE"
+
+
+def test_saved_prompt_is_replaced_by_the_fetched_prompt(tmp_path):
+    cache_path = tmp_path / "prompts.json"
+    cache_path.write_text(json.dumps({"agent/system_prompt": "FILE"}))
+    fetch = StubFetch({"agent/system_prompt": "SERVER"})
+    registry = PromptRegistry(fetch, cache_path=str(cache_path))
+
+    assert registry.get("agent/system_prompt") == "SERVER"
+    assert json.loads(cache_path.read_text()) == {"agent/system_prompt": "SERVER"}
+
+
+def test_stale_prompt_is_served_while_refreshing_in_the_background():
+    fetch = StubFetch({"agent/system_prompt": "V1"})
+    registry = PromptRegistry(fetch, ttl=0.05)
+    assert registry.get("agent/system_prompt") == "V1"
+
+    fetch.templates["agent/system_prompt"] = "V2"
+    fetch.called.clear()
+    time.sleep(0.1)
+    # The stale template is returned at once and refreshed in the background
+    assert registry.get("agent/system_prompt") == "V1"
+    assert fetch.called.wait(5)
+    wait_for(lambda: registry.get("agent/system_prompt") == "V2")
+
+
+def test_fresh_prompt_is_not_fetched_again():
+    fetch = StubFetch({"agent/system_prompt": "V1"})
+    registry = PromptRegistry(fetch, ttl=300)
+
+    registry.get("agent/system_prompt")
+    registry.get("agent/system_prompt")
+    assert fetch.calls == ["agent/system_prompt"]
+
+
+def test_unknown_prompt_that_cannot_be_fetched_raises():
+    registry = PromptRegistry(StubFetch(error=ConnectionError("unreachable")))
+
+    with pytest.raises(ConnectionError):
+        registry.get("missing/system_prompt")
+
+
+def test_compile_replaces_variables():
+    fetch = StubFetch({"agent/user_prompt": "Schema {{schema}}"})
+    registry = PromptRegistry(fetch)
+
+    assert registry.compile("agent/user_prompt", schema="base") == "Schema base"
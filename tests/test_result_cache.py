@@ -0,0 +1,133 @@
+import duckdb
+import pyarrow as pa
+import pytest
+
+from fastomop.mcp.sql.db import OmopDatabase
+from fastomop.mcp.sql.exceptions import QueryError
+from fastomop.mcp.sql.disk_cache import DiskResultCache
+
+TABLE = pa.table({"n": [1, 2, 3]})
+
+
+def test_fingerprints_do_not_purge_each_other(tmp_path):
+    first = DiskResultCache(tmp_path, fingerprint="a" * 64)
+    first.put("key", TABLE)
+    second = DiskResultCache(tmp_path, fingerprint="b" * 64)
+
+    assert second.get("key") is None
+    second.put("key", pa.table({"n": [4]}))
+    assert first.get("key") == TABLE
+    assert DiskResultCache(tmp_path, fingerprint="a" * 64).get("key") == TABLE
+
+
+def test_expired_entries_are_purged(tmp_path):
+    cache = DiskResultCache(tmp_path, fingerprint="a" * 64, ttl=0)
+    cache.put("key", TABLE)
+
+    assert cache.get("key") is None
+
+
+def open_database(tmp_path, **kwargs):
+    path = tmp_path / "cdm.duckdb"
+    if not path.exists():
+        with duckdb.connect(str(path)) as conn:
+            conn.execute(
+                "create table person as select range as person_id, "
+                "'p' || range as person_source_value from range(3)"
+            )
+    return OmopDatabase(
+        f"duckdb:///{path}",
+        cdm_schema="main",
+        vocab_schema="main",
+        disk_cache_dir=str(tmp_path / "results"),
+        **kwargs,
+    )
+
+
+@pytest.fixture
+def database(tmp_path):
+    db = open_database(tmp_path, fingerprint_ttl=0)
+    yield db
+    db.pool.close()
+
+
+def test_refreshed_cdm_invalidates_the_cached_results(database, monkeypatch):
+    query = "select count(*) as n from person"
+    first = database.disk_cache
+    database.fetch_arrow(query)
+    key = database._query_cache_key(query, {})
+    assert first.get(key) is not None
+
+    monkeypatch.setattr(database, "get_cdm_fingerprint", lambda: "c" * 64)
+    refreshed_key = database._query_cache_key(query, {})
+
+    assert refreshed_key != key
+    assert database.disk_cache is not first
+    assert database.disk_cache.get(refreshed_key) is None
+    # The results of the previous version are left to the processes still serving it
+    assert first.get(key) is not None
+
+
+@pytest.mark.parametrize(
+    "query, strict",
+    [
+        (
+            "select person_source_value from person",
+            {"allow_source_value_columns": False},
+        ),
+        ("select * from person", {"star_mode": "reject"}),
+    ],
+)
+def test_results_of_a_lenient_server_are_not_served_to_a_strict_one(
+    tmp_path, query, strict
+):
+    lenient = open_database(
+        tmp_path, allow_source_value_columns=True, star_mode="allow"
+    )
+    try:
+        assert lenient.fetch_arrow(query).num_rows == 3
+    finally:
+        lenient.pool.close()
+
+    strict_db = open_database(
+        tmp_path, **{"allow_source_value_columns": True, "star_mode": "allow", **strict}
+    )
+    try:
+        with pytest.raises(ExceptionGroup):
+            strict_db.fetch_arrow(query)
+    finally:
+        strict_db.pool.close()
+
+
+def test_cached_results_are_validated(database, monkeypatch):
+    query = "select count(*) as n from person"
+    database.fetch_arrow(query)
+
+    def reject(query, concept_sets):
+        raise ExceptionGroup("Query validation failed", [ValueError("rejected")])
+
+    monkeypatch.setattr(database, "_validate", reject)
+    with pytest.raises(ExceptionGroup):
+        database.fetch_arrow(query)
+    (error,) = database.fetch_arrow_batch([query])
+    assert isinstance(error, Exception)
+
+
+def test_query_errors_are_not_wrapped_again(database):
+    with pytest.raises(QueryError) as info:
+        database.fetch_arrow(
+            "select count(*) from person", concept_sets={"person": [1]}
+        )
+    assert str(info.value).startswith("Invalid concept set name")
+
+
+def test_refreshed_cdm_rebuilds_the_catalog(database, monkeypatch):
+    catalog = database.get_catalog()
+    assert database.get_catalog() is catalog
+
+    monkeypatch.setattr(database, "get_cdm_fingerprint", lambda: "d" * 64)
+    refreshed = database.get_catalog()
+
+    assert refreshed is not catalog
+    assert refreshed.version != catalog.version
+    assert database.get_catalog() is refreshed
@@ -0,0 +1,59 @@
+import json
+
+import pyarrow as pa
+import pytest
+
+from fastomop.mcp.sql.results import CHARS_PER_TOKEN, to_summary
+
+
+def wide_table(num_columns=20, num_rows=100):
+    columns = {}
+    for i in range(num_columns):
+        if i % 2:
+            columns[f"column_{i}"] = [f"value_{j % 7}" for j in range(num_rows)]
+        else:
+            columns[f"column_{i}"] = list(range(num_rows))
+    return pa.table(columns)
+
+
+@pytest.mark.parametrize("token_budget", [10, 100, 300, 1000, 5000])
+def test_summary_fits_the_budget_or_says_it_does_not(token_budget):
+    text = to_summary(wide_table(), token_budget)
+    summary = json.loads(text)
+
+    if summary.get("budget_exceeded"):
+        assert summary["columns"] == {}
+    else:
+        assert len(text) <= token_budget * CHARS_PER_TOKEN
+    assert summary["num_rows"] == 100
+
+
+def test_summary_shrinks_with_the_budget():
+    sizes = [len(to_summary(wide_table(), budget)) for budget in (1000, 300, 100)]
+
+    assert sizes == sorted(sizes, reverse=True)
+    assert sizes[0] > sizes[1] > sizes[2]
+
+
+def test_statistics_are_shortened_before_columns_are_left_out():
+    summary = json.loads(to_summary(wide_table(), 300))
+
+    assert "first_rows" not in summary
+    assert summary["columns"]["column_0"]["min"] == 0
+    assert summary["columns"]["column_19"] == {"type": "string"}
+    assert "omitted_columns" not in summary
+
+
+def test_columns_are_left_out_when_types_do_not_fit():
+    summary = json.loads(to_summary(wide_table(), 100))
+
+    assert 0 < summary["omitted_columns"] < 20
+    assert len(summary["columns"]) == 20 - summary["omitted_columns"]
+
+
+def test_small_table_keeps_all_rows():
+    table = pa.table({"n": [1, 2, 3]})
+    summary = json.loads(to_summary(table, 1000))
+
+    assert summary["first_rows"].splitlines() == ["n", "1", "2", "3"]
+    assert summary["columns"]["n"]["mean"] == 2
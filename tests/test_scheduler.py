@@ -0,0 +1,170 @@
+import asyncio
+
+import pytest
+
+from fastomop.api.scheduler import (
+    QueryScheduler,
+    ServerBusyError,
+    ServerShuttingDownError,
+)
+
+
+async def hold(scheduler, tenant, release, order=None, name=None):
+    """Run a query of a tenant until release is set."""
+    async with scheduler.slot(tenant):
+        if order is not None:
+            order.append(name or tenant)
+        await release.wait()
+
+
+async def settle():
+    """Let the started tasks queue up."""
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_waiting_tenants_are_served_in_turn():
+    async def run():
+        scheduler = QueryScheduler(max_concurrency=1, tenant_concurrency=1)
+        order = []
+
+        async def query(tenant, name):
+            async with scheduler.slot(tenant):
+                order.append(name)
+                await asyncio.sleep(0)
+
+        release = asyncio.Event()
+        first = asyncio.create_task(hold(scheduler, "a", release))
+        await settle()
+        tasks = [asyncio.create_task(query("a", f"a{i}")) for i in range(4)]
+        await settle()
+        tasks.append(asyncio.create_task(query("b", "b0")))
+        await settle()
+        release.set()
+        await asyncio.gather(first, *tasks)
+        return order
+
+    order = asyncio.run(run())
+    # b does not wait for all the queued queries of a
+    assert order.index("b0") <= 1
+    assert [name for name in order if name.startswith("a")] == ["a0", "a1", "a2", "a3"]
+
+
+def test_tenant_concurrency_leaves_slots_to_other_tenants():
+    async def run():
+        scheduler = QueryScheduler(max_concurrency=4, tenant_concurrency=2)
+        release = asyncio.Event()
+        tasks = [asyncio.create_task(hold(scheduler, "a", release)) for _ in range(4)]
+        await settle()
+        running_a = scheduler.running
+        tasks.append(asyncio.create_task(hold(scheduler, "b", release)))
+        await settle()
+        stats = scheduler.stats()
+        release.set()
+        await asyncio.gather(*tasks)
+        return running_a, stats
+
+    running_a, stats = asyncio.run(run())
+    assert running_a == 2
+    assert stats["tenants"]["a"] == {"running": 2, "queued": 2}
+    assert stats["tenants"]["b"] == {"running": 1, "queued": 0}
+
+
+def test_full_queues_reject_queries():
+    async def run():
+        scheduler = QueryScheduler(
+            max_concurrency=1, tenant_concurrency=1, max_queue=2, tenant_queue=1
+        )
+        release = asyncio.Event()
+        tasks = [
+            asyncio.create_task(hold(scheduler, "a", release)),
+            asyncio.create_task(hold(scheduler, "a", release)),
+        ]
+        await settle()
+
+        # The queue of the tenant is full
+        with pytest.raises(ServerBusyError):
+            scheduler.check("a")
+        scheduler.check("b")
+        tasks.append(asyncio.create_task(hold(scheduler, "b", release)))
+        await settle()
+
+        # The queue of the server is full
+        with pytest.raises(ServerBusyError):
+            async with scheduler.slot("c"):
+                pass
+        release.set()
+        await asyncio.gather(*tasks)
+        return scheduler
+
+    scheduler = asyncio.run(run())
+    assert scheduler.running == scheduler.queued == 0
+    assert scheduler.stats()["tenants"] == {}
+
+
+def test_query_waiting_longer_than_the_timeout_is_rejected():
+    async def run():
+        scheduler = QueryScheduler(max_concurrency=1, queue_timeout=0.05)
+        release = asyncio.Event()
+        task = asyncio.create_task(hold(scheduler, "a", release))
+        await settle()
+
+        with pytest.raises(ServerBusyError):
+            async with scheduler.slot("b"):
+                pass
+        queued = scheduler.queued
+        release.set()
+        await task
+        return queued
+
+    assert asyncio.run(run()) == 0
+
+
+def test_cancelled_waiting_query_leaves_the_queue():
+    async def run():
+        scheduler = QueryScheduler(max_concurrency=1)
+        release = asyncio.Event()
+        running = asyncio.create_task(hold(scheduler, "a", release))
+        waiting = asyncio.create_task(hold(scheduler, "b", release))
+        await settle()
+        waiting.cancel()
+        await asyncio.gather(waiting, return_exceptions=True)
+        queued = scheduler.queued
+        release.set()
+        await running
+        return queued, scheduler.stats()
+
+    queued, stats = asyncio.run(run())
+    assert queued == 0
+    assert stats == {"running": 0, "queued": 0, "closed": False, "tenants": {}}
+
+
+def test_drain_serves_admitted_queries_and_rejects_new_ones():
+    async def run():
+        scheduler = QueryScheduler(max_concurrency=1)
+        release = asyncio.Event()
+        order = []
+        tasks = [
+            asyncio.create_task(hold(scheduler, "a", release, order, "running")),
+            asyncio.create_task(hold(scheduler, "b", release, order, "waiting")),
+        ]
+        await settle()
+        scheduler.close()
+
+        with pytest.raises(ServerShuttingDownError):
+            async with scheduler.slot("c"):
+                pass
+        drained_early = await scheduler.drain(timeout=0.05)
+        release.set()
+        drained = await scheduler.drain(timeout=5)
+        await asyncio.gather(*tasks)
+        return drained_early, drained, order
+
+    drained_early, drained, order = asyncio.run(run())
+    assert not drained_early
+    assert drained
+    assert order == ["running", "waiting"]
+
+
+def test_idle_scheduler_drains_at_once():
+    assert asyncio.run(QueryScheduler().drain(timeout=0))
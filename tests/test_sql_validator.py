@@ -0,0 +1,52 @@
+from fastomop.mcp.sql.sql_validator import SQLValidator
+
+SCHEMA = {
+    "cdm": {
+        "person": {
+            "person_id": "bigint",
+            "gender_concept_id": "int",
+            "year_of_birth": "int",
+            "gender_source_value": "varchar",
+            "gender_source_concept_id": "int",
+            "person_source_value": "varchar",
+        }
+    }
+}
+
+
+def compile_star(**kwargs) -> str:
+    validator = SQLValidator(
+        table_schemas={"person": "cdm"}, star_mode="expand", **kwargs
+    )
+    sql = "select * from person"
+    assert validator.validate_sql(sql) == []
+    return validator.compile(sql, schema=SCHEMA, schema_version="v1").sql
+
+
+def test_star_expansion_leaves_out_source_value_columns():
+    sql = compile_star()
+
+    assert "person_id" in sql
+    assert "year_of_birth" in sql
+    assert "_source_value" not in sql
+    assert "_source_concept_id" not in sql
+
+
+def test_star_expansion_leaves_out_excluded_columns():
+    sql = compile_star(exclude_columns=["year_of_birth"])
+
+    assert "person_id" in sql
+    assert "year_of_birth" not in sql
+
+
+def test_star_expansion_keeps_source_value_columns_when_allowed():
+    sql = compile_star(allow_source_value_columns=True)
+
+    assert "gender_source_value" in sql
+
+
+def test_explicit_source_value_column_is_rejected():
+    validator = SQLValidator(table_schemas={"person": "cdm"})
+
+    errors = validator.validate_sql("select gender_source_value from person")
+    assert errors